@@ -0,0 +1,258 @@
+"""Activity Log
+
+This module contains the ActivityLog class, which keeps the activities of a
+monitor on disk, so that a monitor can record every activity of a run that
+has more activities than fit in memory.
+
+Activities are buffered in memory in a chunk of fixed size, one typed array
+per field. A full chunk is written to its own binary file in the directory
+of the log, and a line describing it is appended to the index file of the
+directory:
+
+    <file name> <first time> <last time> <number of activities>
+
+A chunk file starts with a header, followed by the identifiers of the actors
+of the chunk, one per line, and then the columns of the chunk: the times
+(8-byte floats), the categories and descriptions (1-byte codes), and the
+actors, rows and columns (8-byte integers, with the actor as a position in
+the identifiers of the chunk). A scan by time range skips the chunks whose
+times are out of range using the index file alone, and a scan by actor
+skips the chunks whose identifiers do not include the actor without
+reading their columns.
+"""
+import os
+import struct
+from array import array
+
+from location import Location
+from monitor import Activity, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+
+# The codes of the categories and descriptions of activities.
+_CATEGORIES = (RIDER, DRIVER)
+_DESCRIPTIONS = (REQUEST, CANCEL, PICKUP, DROPOFF)
+
+# The row and column stored for an activity without a location.
+_NOWHERE = -2 ** 63
+
+# The header of a chunk file: a magic number, the number of activities, and
+# the number of bytes of the identifiers.
+_HEADER = struct.Struct("<4sQQ")
+_MAGIC = b"ACT1"
+
+INDEX = "index.txt"
+
+
+class ActivityLog:
+    """A log of activities that spills to files in a directory.
+
+    === Attributes ===
+    @type directory: str
+        The directory of the chunk files and the index file.
+    @type chunk_size: int
+        The number of activities of a full chunk.
+    """
+
+    # === Private Attributes ===
+    # @type _chunks: int
+    #     The number of chunks written so far.
+    # @type _times: array[float]
+    # @type _categories, _descriptions: array[int]
+    # @type _actors, _rows, _columns: array[int]
+    #     The columns of the chunk that is buffered in memory.
+    # @type _identifiers: dict[str, int]
+    #     The position of every identifier of the buffered chunk.
+
+    def __init__(self, directory, chunk_size=4096):
+        """Initialize an ActivityLog in <directory>, after the chunks that
+        are in it already. The directory is created if it does not exist.
+
+        @type self: ActivityLog
+        @type directory: str
+        @type chunk_size: int
+        @rtype: None
+        """
+        self.directory, self.chunk_size = directory, chunk_size
+        os.makedirs(directory, exist_ok=True)
+        self._chunks = len(self._index())
+        self._clear()
+
+    def append(self, timestamp, category, description, identifier,
+               location):
+        """Append an activity to the log, and write the buffered chunk to
+        disk if it is full.
+
+        @type self: ActivityLog
+        @type timestamp: int | float
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROPOFF
+        @type identifier: str
+        @type location: Location | None
+        @rtype: None
+        """
+        actor = self._identifiers.setdefault(identifier,
+                                             len(self._identifiers))
+        self._times.append(timestamp)
+        self._categories.append(_CATEGORIES.index(category))
+        self._descriptions.append(_DESCRIPTIONS.index(description))
+        self._actors.append(actor)
+        if location is None:
+            self._rows.append(_NOWHERE)
+            self._columns.append(_NOWHERE)
+        else:
+            self._rows.append(location.row)
+            self._columns.append(location.column)
+        if len(self._times) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered activities to disk as a chunk, if there are
+        any.
+
+        @type self: ActivityLog
+        @rtype: None
+        """
+        if not self._times:
+            return
+        name = "chunk-{:06d}.bin".format(self._chunks)
+        identifiers = "\n".join(self._identifiers).encode()
+        with open(os.path.join(self.directory, name), "wb") as file:
+            file.write(_HEADER.pack(_MAGIC, len(self._times),
+                                    len(identifiers)))
+            file.write(identifiers)
+            for column in self._columns_of_chunk():
+                column.tofile(file)
+        with open(os.path.join(self.directory, INDEX), "a") as index:
+            index.write("{} {!r} {!r} {}\n".format(
+                name, float(min(self._times)), float(max(self._times)),
+                len(self._times)))
+        self._chunks += 1
+        self._clear()
+
+    def scan(self, start=None, end=None, identifier=None):
+        """Yield the category and the Activity of every activity in the log,
+        in the order they were appended, that happened from <start> up to
+        and including <end>, and that was done by <identifier>. A bound or
+        identifier that is None does not restrict the activities.
+
+        @type self: ActivityLog
+        @type start: int | float | None
+        @type end: int | float | None
+        @type identifier: str | None
+        @rtype: iterator[(str, Activity)]
+
+        >>> import tempfile
+        >>> log = ActivityLog(tempfile.mkdtemp(), 2)
+        >>> log.append(0, RIDER, REQUEST, "kal", Location(5, 2))
+        >>> log.append(1, DRIVER, REQUEST, "fire", Location(5, 5))
+        >>> log.append(4, RIDER, PICKUP, "kal", Location(5, 2))
+        >>> log.append(6, DRIVER, PICKUP, "fire", None)
+        >>> log.append(9, RIDER, DROPOFF, "kal", Location(3, 2))
+        >>> [(category, activity.time, activity.description)
+        ...  for category, activity in log.scan(identifier="kal")]
+        [('rider', 0.0, 'request'), ('rider', 4.0, 'pickup'), ('rider', 9.0, 'dropoff')]
+        >>> [(activity.id, str(activity.location))
+        ...  for _, activity in log.scan(2, 6)]
+        [('kal', '5,2'), ('fire', 'None')]
+        """
+        for name, first, last, _ in self._index():
+            if ((start is None or last >= start) and
+                    (end is None or first <= end)):
+                for activity in self._read(name, start, end, identifier):
+                    yield activity
+        for activity in self._select(self._columns_of_chunk(),
+                                     list(self._identifiers), start, end,
+                                     identifier):
+            yield activity
+
+    def _clear(self):
+        """Empty the buffered chunk.
+
+        @type self: ActivityLog
+        @rtype: None
+        """
+        self._times = array("d")
+        self._categories, self._descriptions = array("b"), array("b")
+        self._actors, self._rows, self._columns = (array("q"), array("q"),
+                                                   array("q"))
+        self._identifiers = {}
+
+    def _columns_of_chunk(self):
+        """Return the columns of the buffered chunk, in the order in which
+        they are stored.
+
+        @type self: ActivityLog
+        @rtype: list[array]
+        """
+        return [self._times, self._categories, self._descriptions,
+                self._actors, self._rows, self._columns]
+
+    def _index(self):
+        """Return the file name, the first and last times, and the number of
+        activities of every chunk written so far.
+
+        @type self: ActivityLog
+        @rtype: list[(str, float, float, int)]
+        """
+        path = os.path.join(self.directory, INDEX)
+        if not os.path.exists(path):
+            return []
+        chunks = []
+        with open(path) as index:
+            for line in index:
+                name, first, last, count = line.split()
+                chunks.append((name, float(first), float(last), int(count)))
+        return chunks
+
+    def _read(self, name, start, end, identifier):
+        """Yield the activities of the chunk file <name> that match <start>,
+        <end> and <identifier>.
+
+        @type self: ActivityLog
+        @type name: str
+        @type start: int | float | None
+        @type end: int | float | None
+        @type identifier: str | None
+        @rtype: iterator[(str, Activity)]
+        """
+        with open(os.path.join(self.directory, name), "rb") as file:
+            magic, count, size = _HEADER.unpack(file.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError("{} is not a chunk file".format(name))
+            identifiers = file.read(size).decode().split("\n")
+            if identifier is not None and identifier not in identifiers:
+                return
+            columns = [array(column.typecode)
+                       for column in self._columns_of_chunk()]
+            for column in columns:
+                column.fromfile(file, count)
+        for activity in self._select(columns, identifiers, start, end,
+                                     identifier):
+            yield activity
+
+    @staticmethod
+    def _select(columns, identifiers, start, end, identifier):
+        """Yield the activities of a chunk with <columns> and <identifiers>
+        that match <start>, <end> and <identifier>.
+
+        @type columns: list[array]
+        @type identifiers: list[str]
+        @type start: int | float | None
+        @type end: int | float | None
+        @type identifier: str | None
+        @rtype: iterator[(str, Activity)]
+        """
+        times, categories, descriptions, actors, rows, locations = columns
+        for position in range(len(times)):
+            timestamp = times[position]
+            if ((start is not None and timestamp < start) or
+                    (end is not None and timestamp > end)):
+                continue
+            actor = identifiers[actors[position]]
+            if identifier is not None and actor != identifier:
+                continue
+            location = None
+            if rows[position] != _NOWHERE:
+                location = Location(rows[position], locations[position])
+            yield (_CATEGORIES[categories[position]],
+                   Activity(timestamp, _DESCRIPTIONS[descriptions[position]],
+                            actor, location))
@@ -0,0 +1,430 @@
+"""Array Simulation
+
+This module contains the ArraySimulation class, an engine that simulates the
+same events as Simulation without creating an object for every event.
+
+Riders and drivers are numbered in the order they are first seen, and their
+state is kept in parallel typed arrays, indexed by those numbers. A pending
+event is a slot in the parallel arrays of event kinds, riders and drivers,
+and the slots of events that have been done are reused. The pending events
+are ordered by a heap of (timestamp, sequence, slot) tuples, which Python
+compares without calling back into Event comparison methods. The sequence
+breaks ties in the order in which events were scheduled, as the FIFO ties of
+the PriorityQueue do. Every kind of event has a code, and the handler for an
+event is looked up by code in a table.
+
+The reports of an ArraySimulation are identical to those of a Simulation on
+the same events.
+"""
+import heapq
+from array import array
+
+from event import DriverRequest, LazyRequest
+from location import distance_backend
+from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+
+# The codes of the kinds of events.
+RIDER_REQUEST = 0
+DRIVER_REQUEST = 1
+CANCELLATION = 2
+PICKUP_EVENT = 3
+DROPOFF_EVENT = 4
+
+# The codes of the status of a rider.
+_WAITING = 0
+_CANCELLED = 1
+_SATISFIED = 2
+
+
+class ArraySimulation:
+    """A simulation whose events and actors are kept in typed arrays."""
+
+    # === Private Attributes ===
+    # @type _monitor: Monitor
+    #     The monitor of the simulation.
+    # @type _backend: callable | None
+    #     The distance backend of the location module when the simulation
+    #     was created, or None for the Manhattan distance.
+    # @type _handlers: list[callable]
+    #     The handler of every kind of event, by code.
+    # @type _heap: list[(float, int, int)]
+    #     The timestamp, sequence and slot of every pending event.
+    # @type _sequence: int
+    #     The number of events scheduled so far.
+    # @type _kinds: array[int]
+    #     The kind of the event in every slot.
+    # @type _event_riders: array[int]
+    #     The rider of the event in every slot, or -1.
+    # @type _event_drivers: array[int]
+    #     The driver of the event in every slot, or -1.
+    # @type _free: list[int]
+    #     The slots that are not in use.
+    #
+    # @type _rider_ids: list[str]
+    #     The identifier of every rider.
+    # @type _origins, _destinations: list[Location]
+    #     The origin and destination of every rider.
+    # @type _origin_x, _origin_y, _destination_x, _destination_y: array[int]
+    #     The coordinates of the origin and destination of every rider.
+    # @type _trip_distance: array[float]
+    #     The travel distance from the origin to the destination of every
+    #     rider.
+    # @type _patience: array[int]
+    #     The patience of every rider.
+    # @type _status: array[int]
+    #     The status code of every rider.
+    # @type _picked_up: array[int]
+    #     1 for every rider that has been picked up, 0 otherwise.
+    # @type _waiting: list[int]
+    #     The riders waiting for a driver, longest waiting first.
+    #
+    # @type _driver_ids: list[str]
+    #     The identifier of every driver.
+    # @type _locations: list[Location]
+    #     The location of every driver.
+    # @type _x, _y: array[int]
+    #     The coordinates of the location of every driver.
+    # @type _speed: array[float]
+    #     The speed of every driver.
+    # @type _idle: array[int]
+    #     1 for every idle driver, 0 otherwise.
+    # @type _registered: list[int]
+    #     The drivers registered with the dispatcher, in order.
+    # @type _is_registered: array[int]
+    #     1 for every registered driver, 0 otherwise.
+
+    def __init__(self):
+        """Initialize an ArraySimulation without any events.
+
+        @type self: ArraySimulation
+        @rtype: None
+        """
+        self._monitor = Monitor()
+        self._backend = distance_backend()
+        self._handlers = [self._rider_request, self._driver_request,
+                          self._cancellation, self._pickup, self._dropoff]
+        self._heap = []
+        self._sequence = 0
+        self._kinds = array("b")
+        self._event_riders = array("l")
+        self._event_drivers = array("l")
+        self._free = []
+
+        self._rider_ids = []
+        self._origins, self._destinations = [], []
+        self._origin_x, self._origin_y = array("l"), array("l")
+        self._destination_x, self._destination_y = array("l"), array("l")
+        self._trip_distance = array("d")
+        self._patience = array("l")
+        self._status = array("b")
+        self._picked_up = array("b")
+        self._waiting = []
+
+        self._driver_ids = []
+        self._locations = []
+        self._x, self._y = array("l"), array("l")
+        self._speed = array("d")
+        self._idle = array("b")
+        self._registered = []
+        self._is_registered = array("b")
+
+    def run(self, initial_events):
+        """Run the simulation on the list of events in <initial_events>.
+
+        Return a dictionary containing statistics of the simulation,
+        according to the specifications in the assignment handout.
+
+        Precondition: every event of <initial_events> is a RiderRequest, a
+        DriverRequest or a LazyRequest.
+
+        @type self: ArraySimulation
+        @type initial_events: list[Event]
+        @rtype: dict[str, object]
+
+        >>> from event import create_event_list
+        >>> from simulation import Simulation
+        >>> expected = Simulation().run(create_event_list("events.txt"))
+        >>> ArraySimulation().run(create_event_list("events.txt")) == expected
+        True
+        """
+        # Riders and drivers are told apart by identity, so every event is
+        # kept alive until all of them are stored.
+        initial_events = [event.materialize() if isinstance(event, LazyRequest)
+                          else event for event in initial_events]
+        riders, drivers = {}, {}
+        for event in sorted(initial_events, key=lambda event: event.timestamp):
+            if isinstance(event, DriverRequest):
+                driver = drivers.get(id(event.driver))
+                if driver is None:
+                    driver = drivers[id(event.driver)] = self._add_driver(
+                        event.driver)
+                self._schedule(event.timestamp, DRIVER_REQUEST, -1, driver)
+            else:
+                rider = riders.get(id(event.rider))
+                if rider is None:
+                    rider = riders[id(event.rider)] = self._add_rider(
+                        event.rider)
+                self._schedule(event.timestamp, RIDER_REQUEST, rider, -1)
+
+        heap, handlers, free = self._heap, self._handlers, self._free
+        kinds, event_riders, event_drivers = (self._kinds, self._event_riders,
+                                              self._event_drivers)
+        while heap:
+            timestamp, _, slot = heapq.heappop(heap)
+            free.append(slot)
+            handlers[kinds[slot]](timestamp, event_riders[slot],
+                                  event_drivers[slot])
+        return self._monitor.report()
+
+    def report(self):
+        """Return a dictionary containing statistics of the simulation so far.
+
+        @type self: ArraySimulation
+        @rtype: dict[str, object]
+        """
+        return self._monitor.report()
+
+    def _add_rider(self, rider):
+        """Add <rider> to the rider store and return its number.
+
+        @type self: ArraySimulation
+        @type rider: Rider
+        @rtype: int
+        """
+        self._rider_ids.append(rider.id)
+        self._origins.append(rider.origin)
+        self._destinations.append(rider.destination)
+        self._origin_x.append(rider.origin.row)
+        self._origin_y.append(rider.origin.column)
+        self._destination_x.append(rider.destination.row)
+        self._destination_y.append(rider.destination.column)
+        distance = rider.trip_distance
+        if distance is None or rider.trip_backend is not self._backend:
+            if self._backend is not None:
+                distance = self._backend(rider.origin, rider.destination)
+            else:
+                distance = (abs(rider.origin.row - rider.destination.row) +
+                            abs(rider.origin.column -
+                                rider.destination.column))
+        self._trip_distance.append(distance)
+        self._patience.append(rider.patience)
+        self._status.append(_WAITING)
+        self._picked_up.append(0)
+        return len(self._rider_ids) - 1
+
+    def _add_driver(self, driver):
+        """Add <driver> to the fleet store and return its number.
+
+        @type self: ArraySimulation
+        @type driver: Driver
+        @rtype: int
+        """
+        self._driver_ids.append(driver.id)
+        self._locations.append(driver.location)
+        self._x.append(driver.location.row)
+        self._y.append(driver.location.column)
+        self._speed.append(driver.speed)
+        self._idle.append(1)
+        self._is_registered.append(0)
+        return len(self._driver_ids) - 1
+
+    def _schedule(self, timestamp, kind, rider, driver):
+        """Schedule an event of <kind> for <rider> and <driver> at
+        <timestamp>.
+
+        @type self: ArraySimulation
+        @type timestamp: float
+        @type kind: int
+        @type rider: int
+        @type driver: int
+        @rtype: None
+        """
+        if self._free:
+            slot = self._free.pop()
+            self._kinds[slot] = kind
+            self._event_riders[slot] = rider
+            self._event_drivers[slot] = driver
+        else:
+            slot = len(self._kinds)
+            self._kinds.append(kind)
+            self._event_riders.append(rider)
+            self._event_drivers.append(driver)
+        heapq.heappush(self._heap, (timestamp, self._sequence, slot))
+        self._sequence += 1
+
+    def _distance(self, driver, rider):
+        """Return the distance from <driver> to the origin of <rider>.
+
+        @type self: ArraySimulation
+        @type driver: int
+        @type rider: int
+        @rtype: int | float
+        """
+        if self._backend is not None:
+            return self._backend(self._locations[driver],
+                                 self._origins[rider])
+        return (abs(self._x[driver] - self._origin_x[rider]) +
+                abs(self._y[driver] - self._origin_y[rider]))
+
+    def _travel_time(self, driver, rider):
+        """Return the time it takes <driver> to drive to the origin of
+        <rider>.
+
+        @type self: ArraySimulation
+        @type driver: int
+        @type rider: int
+        @rtype: float
+        """
+        return self._distance(driver, rider) / self._speed[driver]
+
+    def _ride_time(self, driver, rider):
+        """Return the time it takes <driver> to drive <rider> from their
+        origin to their destination.
+
+        @type self: ArraySimulation
+        @type driver: int
+        @type rider: int
+        @rtype: float
+        """
+        return self._trip_distance[rider] / self._speed[driver]
+
+    def _rider_request(self, timestamp, rider, _):
+        """Do a RiderRequest: assign the nearest idle driver to <rider>, or
+        add the rider to the waiting list.
+
+        @type self: ArraySimulation
+        @type timestamp: float
+        @type rider: int
+        @rtype: None
+        """
+        self._monitor.notify(timestamp, RIDER, REQUEST, self._rider_ids[rider],
+                             self._origins[rider])
+        idle = self._idle
+        nearest, nearest_time = -1, 0.0
+        # A driver on a ride is not idle either.
+        if self._backend is None:
+            # The Manhattan distance is computed inline, as this is the
+            # innermost loop of the engine.
+            x, y = self._origin_x[rider], self._origin_y[rider]
+            xs, ys, speed = self._x, self._y, self._speed
+            for driver in self._registered:
+                if idle[driver]:
+                    travel_time = (abs(xs[driver] - x) +
+                                   abs(ys[driver] - y)) / speed[driver]
+                    if nearest == -1 or travel_time < nearest_time:
+                        nearest, nearest_time = driver, travel_time
+        else:
+            for driver in self._registered:
+                if idle[driver]:
+                    travel_time = self._travel_time(driver, rider)
+                    if nearest == -1 or travel_time < nearest_time:
+                        nearest, nearest_time = driver, travel_time
+        if nearest == -1:
+            self._waiting.append(rider)
+        else:
+            idle[nearest] = 0
+            self._monitor.notify_leg(timestamp, self._driver_ids[nearest],
+                                     self._distance(nearest, rider),
+                                     nearest_time, False)
+            self._schedule(timestamp + nearest_time, PICKUP_EVENT, rider,
+                           nearest)
+        self._schedule(timestamp + self._patience[rider], CANCELLATION, rider,
+                       -1)
+
+    def _driver_request(self, timestamp, _, driver):
+        """Do a DriverRequest: register <driver>, and assign it the longest
+        waiting rider, if there is one.
+
+        @type self: ArraySimulation
+        @type timestamp: float
+        @type driver: int
+        @rtype: None
+        """
+        self._monitor.notify(timestamp, DRIVER, REQUEST,
+                             self._driver_ids[driver], self._locations[driver])
+        if not self._is_registered[driver]:
+            self._is_registered[driver] = 1
+            self._registered.append(driver)
+        if self._waiting:
+            rider = self._waiting.pop(0)
+            self._idle[driver] = 0
+            travel_time = self._travel_time(driver, rider)
+            self._monitor.notify_leg(timestamp, self._driver_ids[driver],
+                                     self._distance(driver, rider),
+                                     travel_time, False)
+            self._schedule(timestamp + travel_time, PICKUP_EVENT, rider,
+                           driver)
+
+    def _cancellation(self, timestamp, rider, _):
+        """Do a Cancellation: cancel the request of <rider> if they are still
+        waiting and have not been picked up.
+
+        @type self: ArraySimulation
+        @type timestamp: float
+        @type rider: int
+        @rtype: None
+        """
+        if self._status[rider] == _WAITING and not self._picked_up[rider]:
+            if rider in self._waiting:
+                self._waiting.remove(rider)
+            self._status[rider] = _CANCELLED
+            self._monitor.notify(timestamp, RIDER, CANCEL,
+                                 self._rider_ids[rider], self._origins[rider])
+
+    def _pickup(self, timestamp, rider, driver):
+        """Do a Pickup: <driver> arrives at the origin of <rider>, and starts
+        the ride if the rider is still waiting.
+
+        @type self: ArraySimulation
+        @type timestamp: float
+        @type rider: int
+        @type driver: int
+        @rtype: None
+        """
+        self._locations[driver] = self._origins[rider]
+        self._x[driver] = self._origin_x[rider]
+        self._y[driver] = self._origin_y[rider]
+        self._idle[driver] = 1
+        if self._status[rider] == _WAITING:
+            self._idle[driver] = 0
+            self._picked_up[rider] = 1
+            ride_time = self._ride_time(driver, rider)
+            self._monitor.notify_leg(timestamp, self._driver_ids[driver],
+                                     self._trip_distance[rider], ride_time,
+                                     True)
+            self._schedule(timestamp + ride_time, DROPOFF_EVENT, rider,
+                           driver)
+            self._monitor.notify(timestamp, RIDER, PICKUP,
+                                 self._rider_ids[rider], self._origins[rider])
+            self._monitor.notify(timestamp, DRIVER, PICKUP,
+                                 self._driver_ids[driver],
+                                 self._locations[driver])
+        elif self._status[rider] == _CANCELLED:
+            self._schedule(timestamp, DRIVER_REQUEST, -1, driver)
+
+    def _dropoff(self, timestamp, rider, driver):
+        """Do a Dropoff: <driver> arrives at the destination of <rider>, and
+        requests a new rider.
+
+        @type self: ArraySimulation
+        @type timestamp: float
+        @type rider: int
+        @type driver: int
+        @rtype: None
+        """
+        self._locations[driver] = self._destinations[rider]
+        self._x[driver] = self._destination_x[rider]
+        self._y[driver] = self._destination_y[rider]
+        self._idle[driver] = 1
+        self._status[rider] = _SATISFIED
+        self._schedule(timestamp, DRIVER_REQUEST, -1, driver)
+        self._monitor.notify(timestamp, DRIVER, DROPOFF,
+                             self._driver_ids[driver], self._locations[driver])
+        self._monitor.notify(timestamp, RIDER, DROPOFF,
+                             self._rider_ids[rider], self._destinations[rider])
+
+
+if __name__ == "__main__":
+    from event import create_event_list
+
+    print(ArraySimulation().run(create_event_list("events.txt")))
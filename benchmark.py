@@ -0,0 +1,861 @@
+"""Benchmarks
+
+This module contains a generator for random event traces and timing
+harnesses for the simulation engines. Run this module to print the results
+of every benchmark for traces of the default size.
+"""
+import gc
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from activitylog import ActivityLog
+from array_engine import ArraySimulation
+from cache import ResultCache
+from dispatcher import (LONGEST_WAITING, NEAREST, TRADE_OFF, Dispatcher,
+                        StripedDispatcher)
+from driver import Driver
+from event import (Event, create_event_list, create_lazy_event_list,
+                   parse_event_lines)
+from location import (Location, deserialize_location, manhattan_distance,
+                      set_distance_backend, trip_distances)
+from market import MultiMarketSimulation
+from monitor import DRIVER, DROPOFF, PICKUP, RIDER
+from partition import PartitionedSimulation
+from pooling import PooledSimulation
+from rider import Rider
+from roadgraph import RoadGraph
+from rollup import CsvSink, Rollup
+from simulation import Simulation
+
+
+def random_trace(drivers, riders, rows, columns, duration, seed=0,
+                 hotspot=0):
+    """Return the lines of a random event trace.
+
+    Drivers all request a rider at time 0. Riders request a driver at random
+    times before <duration>. A share <hotspot> of the riders request a
+    driver from around a hotspot, a tenth of the way from the corner of the
+    grid that is furthest from the origin. The lines are in the format of
+    the event files, ordered by timestamp.
+
+    @type drivers: int
+    @type riders: int
+    @type rows: int
+    @type columns: int
+    @type duration: int
+    @type seed: int
+    @type hotspot: float
+    @rtype: list[str]
+
+    >>> trace = random_trace(2, 3, 10, 10, 100)
+    >>> len(trace)
+    5
+    >>> len(parse_event_lines(trace))
+    5
+    >>> trace == random_trace(2, 3, 10, 10, 100)
+    True
+    """
+    generator = random.Random(seed)
+
+    def location():
+        return "{},{}".format(generator.randrange(rows),
+                              generator.randrange(columns))
+
+    def origin():
+        if not hotspot or generator.random() >= hotspot:
+            return location()
+        return "{},{}".format(
+            min(max(int(generator.gauss(rows * 0.9, rows * 0.05)), 0),
+                rows - 1),
+            min(max(int(generator.gauss(columns * 0.9, columns * 0.05)), 0),
+                columns - 1))
+
+    lines = ["0 DriverRequest D{} {} {}".format(
+        number, location(), generator.randint(1, 3))
+        for number in range(drivers)]
+    requests = sorted(generator.randrange(duration) for _ in range(riders))
+    lines.extend("{} RiderRequest R{} {} {} {}".format(
+        timestamp, number, origin(), location(), generator.randint(5, 30))
+        for number, timestamp in enumerate(requests))
+    return lines
+
+
+def time_run(simulation, events):
+    """Return the report of <simulation> on <events> and the seconds taken.
+
+    @type simulation: Simulation | PartitionedSimulation
+    @type events: list[Event]
+    @rtype: (dict[str, object], float)
+    """
+    start = time.perf_counter()
+    report = simulation.run(events)
+    return report, time.perf_counter() - start
+
+
+def benchmark_partitioned(trace, regions=(1, 2, 4)):
+    """Print the throughput of a PartitionedSimulation on <trace> for every
+    number of regions in <regions>.
+
+    @type trace: list[str]
+    @type regions: tuple[int]
+    @rtype: None
+    """
+    for count in regions:
+        events = parse_event_lines(trace)
+        report, seconds = time_run(PartitionedSimulation(count), events)
+        # The wait time is the same for any number of regions.
+        print("partitioned, {} regions: {:.2f}s, {:.0f} events/s, "
+              "wait {:.2f}".format(count, seconds, len(events) / seconds,
+                                   report["rider_wait_time"]))
+
+
+def benchmark_markets(traces):
+    """Print the time per event of simulating every trace in <traces> as its
+    own market of a MultiMarketSimulation, and as separate Simulations.
+
+    @type traces: list[list[str]]
+    @rtype: None
+    """
+    count = sum(len(parse_event_lines(trace)) for trace in traces)
+
+    start = time.perf_counter()
+    for trace in traces:
+        Simulation().run(parse_event_lines(trace))
+    separate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sim = MultiMarketSimulation()
+    for market, trace in enumerate(traces):
+        sim.add_events(market, parse_event_lines(trace))
+    sim.run()
+    merged = time.perf_counter() - start
+
+    print("{} markets: separate {:.1f}us/event, merged {:.1f}us/event".format(
+        len(traces), 1e6 * separate / count, 1e6 * merged / count))
+
+
+def benchmark_snapshot(trace, until):
+    """Print the size of a snapshot of a simulation of <trace> at the time
+    <until>, and the time it takes to snapshot and restore it.
+
+    @type trace: list[str]
+    @type until: int
+    @rtype: None
+    """
+    sim = Simulation()
+    sim.run(parse_event_lines(trace), until)
+
+    start = time.perf_counter()
+    snapshot = sim.snapshot()
+    taken = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Simulation.restore(snapshot)
+    restored = time.perf_counter() - start
+
+    print("snapshot: {} kB, taken in {:.3f}s, restored in {:.3f}s".format(
+        len(snapshot) // 1024, taken, restored))
+
+
+def benchmark_rerun(trace, extra, interval):
+    """Print the time it takes to run <trace> with the lines <extra> added,
+    from scratch and as a rerun after a run of <trace>.
+
+    @type trace: list[str]
+    @type extra: list[str]
+    @type interval: int
+    @rtype: None
+    """
+    sim = Simulation(snapshot_interval=interval)
+    sim.run(parse_event_lines(trace))
+
+    _, scratch = time_run(Simulation(), parse_event_lines(trace + extra))
+
+    start = time.perf_counter()
+    sim.rerun(parse_event_lines(trace + extra))
+    rerun = time.perf_counter() - start
+
+    print("rerun: from scratch {:.2f}s, from snapshot {:.2f}s".format(
+        scratch, rerun))
+
+
+def benchmark_stepwise(trace):
+    """Print the time it takes to simulate <trace> in one run, and one event
+    at a time.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    _, batch = time_run(Simulation(), parse_event_lines(trace))
+
+    sim = Simulation()
+    for event in parse_event_lines(trace):
+        sim.inject(event)
+    start = time.perf_counter()
+    while sim.step():
+        pass
+    stepwise = time.perf_counter() - start
+
+    print("stepwise: batch run {:.2f}s, one step at a time {:.2f}s".format(
+        batch, stepwise))
+
+
+def benchmark_timeouts(trace):
+    """Print the time it takes to simulate <trace> with Cancellation events
+    in the event queue, and with them kept as patience timeouts.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    _, queued = time_run(Simulation(), parse_event_lines(trace))
+    _, wheel = time_run(Simulation(patience_timeouts=True),
+                        parse_event_lines(trace))
+    print("timeouts: in event queue {:.2f}s, as patience timeouts {:.2f}s"
+          .format(queued, wheel))
+
+
+def benchmark_engines(trace):
+    """Print the time it takes the object engine and the array engine to
+    simulate <trace>.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    expected, objects = time_run(Simulation(), parse_event_lines(trace))
+    report, arrays = time_run(ArraySimulation(), parse_event_lines(trace))
+    assert report == expected
+    print("engines: objects {:.2f}s, arrays {:.2f}s".format(objects, arrays))
+
+
+def allocation_stats(simulation, events):
+    """Run <simulation> on <events>, and return the number of rides, the
+    number of garbage collections, the seconds spent collecting garbage,
+    and the peak traced memory in bytes.
+
+    @type simulation: Simulation
+    @type events: list[Event]
+    @rtype: (int, int, float, int)
+    """
+    pauses = []
+
+    def collecting(phase, info):
+        pauses.append(time.perf_counter())
+
+    gc.collect()
+    collections = sum(generation["collections"]
+                      for generation in gc.get_stats())
+    gc.callbacks.append(collecting)
+    tracemalloc.start()
+    try:
+        simulation.run(events)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        gc.callbacks.remove(collecting)
+    collections = sum(generation["collections"]
+                      for generation in gc.get_stats()) - collections
+    rides = sum(1 for activities in
+                simulation._monitor._activities[RIDER].values()
+                if len(activities) == 3)
+    # The callback is called when a collection starts and when it stops.
+    pause = sum(pauses[1::2]) - sum(pauses[0::2])
+    return rides, collections, pause, peak
+
+
+def count_events_created(simulation, events):
+    """Run <simulation> on <events>, and return the number of event objects
+    initialized during the run, not counting reused ones.
+
+    Every event is kept alive until the run ends, so that no two events
+    share an id.
+
+    @type simulation: Simulation
+    @type events: list[Event]
+    @rtype: int
+    """
+    initialize = Event.__init__
+    created = {}
+
+    def counting(event, timestamp):
+        created[id(event)] = event
+        initialize(event, timestamp)
+
+    Event.__init__ = counting
+    try:
+        simulation.run(events)
+    finally:
+        Event.__init__ = initialize
+    return len(created)
+
+
+def benchmark_allocations(trace):
+    """Print the events created per ride and the garbage collection
+    statistics of simulating <trace> with and without recycling events.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    for recycle in (False, True):
+        rides, collections, pause, peak = allocation_stats(
+            Simulation(recycle=recycle), parse_event_lines(trace))
+        created = count_events_created(Simulation(recycle=recycle),
+                                       parse_event_lines(trace))
+        print("recycle={}: {:.2f} events created per ride, {} collections "
+              "in {:.1f}ms, peak {} kB".format(
+                  recycle, created / rides, collections, 1000 * pause,
+                  peak // 1024))
+
+
+def benchmark_lazy(trace):
+    """Print the memory taken by the events of <trace> and the time it takes
+    to simulate them, when they are read in up front and when they are read
+    in lazily.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+        file.write("\n".join(trace) + "\n")
+    try:
+        for name, create in (("eager", create_event_list),
+                             ("lazy", create_lazy_event_list)):
+            tracemalloc.start()
+            events = create(file.name)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            _, seconds = time_run(Simulation(), events)
+            print("{}: {:.0f} bytes per event, run in {:.2f}s".format(
+                name, size / len(events), seconds))
+            del events
+    finally:
+        os.remove(file.name)
+
+
+def benchmark_trip_distances(trace):
+    """Print the time it takes to compute the trip distances of the riders of
+    <trace> at load time, and to simulate it with those distances and with
+    the distances recomputed at every pickup.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    events = parse_event_lines(trace)
+    riders = [event.rider for event in events if hasattr(event, "rider")]
+    start = time.perf_counter()
+    trip_distances([rider.origin for rider in riders],
+                   [rider.destination for rider in riders])
+    computed = time.perf_counter() - start
+    _, precomputed = time_run(Simulation(), events)
+
+    events = parse_event_lines(trace)
+    for event in events:
+        if hasattr(event, "rider"):
+            event.rider.trip_distance = None
+    _, recomputed = time_run(Simulation(), events)
+    print("trip distances of {} riders: computed in {:.3f}s at load, run "
+          "{:.2f}s with them, {:.2f}s recomputing them at pickup".format(
+              len(riders), computed, precomputed, recomputed))
+
+
+def deadhead_distance(monitor):
+    """Return the total distance the drivers recorded by <monitor> have
+    driven without a rider.
+
+    A driver only moves between the locations of its activities, and drives
+    with a rider from every pickup to the dropoff that follows it.
+
+    @type monitor: Monitor
+    @rtype: int
+    """
+    deadhead = 0
+    for activities in monitor._activities[DRIVER].values():
+        for previous, activity in zip(activities, activities[1:]):
+            if not (previous.description == PICKUP and
+                    activity.description == DROPOFF):
+                deadhead += manhattan_distance(previous.location,
+                                               activity.location)
+    return deadhead
+
+
+def benchmark_fleet_report(trace):
+    """Print the time it takes to report the distances driven by the fleet
+    after simulating <trace>, from the ledger the monitor keeps up to date
+    and by a pass over the activities of every driver, and the time it
+    takes to find the ten least utilized drivers.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    simulation = Simulation()
+    simulation.run(parse_event_lines(trace))
+    monitor = simulation._monitor
+    start = time.perf_counter()
+    monitor.fleet_report()
+    ledger = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for activities in monitor._activities[DRIVER].values():
+        sum(manhattan_distance(previous.location, activity.location)
+            for previous, activity in zip(activities, activities[1:]))
+    deadhead_distance(monitor)
+    scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    monitor.least_utilized(10)
+    least = time.perf_counter() - start
+    print("fleet report of {} drivers: {:.0f}us from the ledger, {:.0f}us "
+          "from the activities, ten least utilized in {:.0f}us".format(
+              len(monitor._activities[DRIVER]), 1e6 * ledger, 1e6 * scan,
+              1e6 * least))
+
+
+def benchmark_rollup(trace, width=300, span=4):
+    """Print the time it takes to simulate <trace> with and without a
+    rollup of tumbling windows of <width> and sliding windows of <span>
+    tumbling windows, written to a CSV file.
+
+    @type trace: list[str]
+    @type width: int
+    @type span: int
+    @rtype: None
+    """
+    _, plain = time_run(Simulation(), parse_event_lines(trace))
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as file:
+        pass
+    try:
+        rollup = Rollup(CsvSink(file.name), width, span)
+        _, rolled = time_run(Simulation(rollup=rollup),
+                             parse_event_lines(trace))
+        rollup.close()
+        with open(file.name) as rows:
+            windows = sum(1 for _ in rows) - 1
+    finally:
+        os.remove(file.name)
+    print("rollup: {} windows written, run in {:.2f}s, {:.2f}s without".format(
+        windows, rolled, plain))
+
+
+def benchmark_activity_log(trace, chunk_size=4096):
+    """Print the memory the monitor holds after simulating <trace>, and the
+    time it takes, with activities kept in memory and with activities
+    spilled to an activity log in chunks of <chunk_size>.
+
+    @type trace: list[str]
+    @type chunk_size: int
+    @rtype: None
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        results = []
+        for log in (None, ActivityLog(directory, chunk_size)):
+            events = parse_event_lines(trace)
+            simulation = Simulation(activity_log=log)
+            tracemalloc.start()
+            start = time.perf_counter()
+            report = simulation.run(events)
+            seconds = time.perf_counter() - start
+            del events
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            results.append((report, seconds, size))
+        chunks = len(os.listdir(directory)) - 1
+    finally:
+        shutil.rmtree(directory)
+    (kept, kept_time, kept_size), (spilled, spilled_time, spilled_size) = \
+        results
+    print("activity log: {} chunks, {:.0f}KB held, run in {:.2f}s; "
+          "{:.0f}KB held in memory, run in {:.2f}s".format(
+              chunks, spilled_size / 1024, spilled_time,
+              kept_size / 1024, kept_time))
+    assert all(abs(kept[key] - spilled[key]) < 1e-6 for key in kept)
+
+
+def benchmark_rebalancing(trace, interval=60):
+    """Print the average wait time of riders and the total distance driven
+    on <trace>, with and without rebalancing idle drivers every <interval>,
+    and the time a rebalancing tick takes.
+
+    @type trace: list[str]
+    @type interval: int
+    @rtype: None
+    """
+    plain = Simulation().run(parse_event_lines(trace))
+    simulation = Simulation(rebalance_interval=interval)
+    dispatcher = simulation._dispatcher
+    plan = dispatcher.rebalance
+    ticks = []
+
+    def timed(timestamp):
+        start = time.perf_counter()
+        moves = plan(timestamp)
+        ticks.append((time.perf_counter() - start, len(moves)))
+        return moves
+
+    dispatcher.rebalance = timed
+    rebalanced = simulation.run(parse_event_lines(trace))
+    print("rebalancing: wait {:.2f} -> {:.2f}, distance {:.2f} -> {:.2f}, "
+          "{} ticks of {:.3f}ms, {} drivers moved".format(
+              plain["rider_wait_time"], rebalanced["rider_wait_time"],
+              plain["driver_total_distance"],
+              rebalanced["driver_total_distance"], len(ticks),
+              1000 * sum(seconds for seconds, _ in ticks) / max(len(ticks), 1),
+              sum(moves for _, moves in ticks)))
+
+
+def benchmark_pooling(trace, capacities=(1, 2, 4), max_candidates=32):
+    """Print the number of riders served, the average wait time and the
+    total distance driven on <trace> without pooling, and with pooled rides
+    of every capacity in <capacities>, with the time and the number of
+    routes it takes to match a rider to a route.
+
+    @type trace: list[str]
+    @type capacities: tuple[int]
+    @type max_candidates: int | None
+    @rtype: None
+    """
+    def served(monitor):
+        return sum(1 for activities in monitor._activities[RIDER].values()
+                   if len(activities) == 3)
+
+    simulation = Simulation()
+    report = simulation.run(parse_event_lines(trace))
+    print("unpooled: {} served, wait {:.2f}, distance {:.2f}".format(
+        served(simulation._monitor), report["rider_wait_time"],
+        report["driver_total_distance"]))
+    for capacity in capacities:
+        simulation = PooledSimulation(capacity, max_candidates=max_candidates)
+        pool = simulation._pool
+        match = pool.match
+        matches = []
+
+        def timed(rider, timestamp, routes=None):
+            start = time.perf_counter()
+            route = match(rider, timestamp, routes)
+            matches.append(time.perf_counter() - start)
+            return route
+
+        pool.match = timed
+        report = simulation.run(parse_event_lines(trace))
+        print("capacity {}: {} served, wait {:.2f}, distance {:.2f}, "
+              "{:.1f}us and {:.1f} routes per match".format(
+                  capacity, served(simulation._monitor),
+                  report["rider_wait_time"], report["driver_total_distance"],
+                  1e6 * sum(matches) / max(len(matches), 1),
+                  pool.evaluated / max(len(matches), 1)))
+
+
+def benchmark_cache(trace):
+    """Print the time it takes to simulate <trace>, and to get its report
+    from a result cache once it has been stored.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        cache = ResultCache(directory)
+        start = time.perf_counter()
+        report = cache.run(parse_event_lines(trace))
+        missed = time.perf_counter() - start
+        events = parse_event_lines(trace)
+        start = time.perf_counter()
+        cached = cache.run(events)
+        hit = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+    assert cached == report
+    print("result cache: run in {:.2f}s, {:.1f}ms from the cache".format(
+        missed, 1000 * hit))
+
+
+def benchmark_rider_policies(trace):
+    """Print the distance driven without a rider per pickup, the average
+    wait time, and the latency of requests for a rider, for every policy
+    with which the dispatcher can assign waiting riders.
+
+    @type trace: list[str]
+    @rtype: None
+    """
+    for policy in (LONGEST_WAITING, NEAREST, TRADE_OFF):
+        simulation = Simulation(rider_policy=policy)
+        dispatcher = simulation._dispatcher
+        request_rider = dispatcher.request_rider
+        latencies = []
+
+        def timed_request_rider(driver):
+            start = time.perf_counter()
+            rider = request_rider(driver)
+            latencies.append(time.perf_counter() - start)
+            return rider
+
+        dispatcher.request_rider = timed_request_rider
+        report, seconds = time_run(simulation, parse_event_lines(trace))
+        monitor = simulation._monitor
+        pickups = sum(activity.description == PICKUP
+                      for activities in monitor._activities[DRIVER].values()
+                      for activity in activities)
+        latencies.sort()
+        print("{}: {} pickups, {:.1f} deadhead per pickup, {:.1f} wait, "
+              "rider requests p50 {:.0f}us, p99 {:.0f}us, run in {:.2f}s"
+              .format(policy, pickups,
+                      deadhead_distance(monitor) / max(pickups, 1),
+                      report["rider_wait_time"],
+                      1e6 * latencies[len(latencies) // 2],
+                      1e6 * latencies[len(latencies) * 99 // 100], seconds))
+
+
+def benchmark_approximate(trace, fleet=100000, size=1000, requests=2000,
+                          settings=((None, None), (1, None), (1.5, None),
+                                    (2, None), (None, 8))):
+    """Print, for an exact dispatcher and for an approximate one with every
+    approximation factor and maximum number of candidates in <settings>:
+    the latency of a request for a driver to a fleet of <fleet> idle
+    drivers on a grid of <size> by <size>, the time it takes to simulate
+    <trace>, and how often and by how much the approximate dispatcher chose
+    a driver further away than the nearest one in that simulation.
+
+    The latency is measured without checking choices against the nearest
+    driver, and every driver assigned requests a rider again right away.
+
+    @type trace: list[str]
+    @type fleet: int
+    @type size: int
+    @type requests: int
+    @type settings: tuple[(int | float | None, int | None)]
+    @rtype: None
+    """
+    generator = random.Random(0)
+
+    def location():
+        return Location(generator.randrange(size), generator.randrange(size))
+
+    drivers = [Driver("D{}".format(number), location(),
+                      generator.randint(1, 3)) for number in range(fleet)]
+    riders = [Rider("R{}".format(number), location(), location(), 10, 0)
+              for number in range(requests)]
+    for approximation, max_candidates in settings:
+        dispatcher = Dispatcher(approximation=approximation,
+                                max_candidates=max_candidates)
+        for driver in drivers:
+            dispatcher.request_rider(driver)
+        start = time.perf_counter()
+        for rider in riders:
+            dispatcher.request_rider(dispatcher.request_driver(rider))
+        latency = (time.perf_counter() - start) / requests
+
+        simulation = Simulation(approximation=approximation,
+                                max_candidates=max_candidates,
+                                check_interval=1)
+        _, seconds = time_run(simulation, parse_event_lines(trace))
+        line = "{:.0f}us per request, run in {:.2f}s".format(1e6 * latency,
+                                                            seconds)
+        if approximation is None and max_candidates is None:
+            line = "exact: " + line
+        else:
+            line = "factor {}, {} candidates: ".format(
+                approximation, max_candidates) + line
+            report = simulation._monitor.approximation_report()
+            line += ", {} of {} dispatches changed, {:.3f} average excess, " \
+                    "{:.2f} worst ratio".format(
+                        report["changed_dispatches"],
+                        report["approximate_dispatches"],
+                        report["average_excess_time"], report["worst_ratio"])
+        print(line)
+
+
+def city_map(rows, columns):
+    """Return the lines of a city map of <rows> by <columns> cells.
+
+    Streets run along every fourth row and column, with buildings in
+    between. A river runs along the middle street, with a bridge on every
+    eighth column, and the streets along every eighth row are one-way, in
+    alternating directions.
+
+    @type rows: int
+    @type columns: int
+    @rtype: list[str]
+
+    >>> RoadGraph(city_map(9, 9)).distances_to(0)[8 * 9 + 8]
+    16
+    """
+    lines = []
+    for row in range(rows):
+        line = []
+        for column in range(columns):
+            if row % 4 and column % 4:
+                line.append("#")
+            elif row == rows // 2 // 4 * 4 and column % 8:
+                line.append("#")
+            elif (row % 8 == 0 and column % 4 and
+                    column < (columns - 1) // 4 * 4):
+                line.append(">" if row % 16 else "<")
+            else:
+                line.append(".")
+        lines.append("".join(line))
+    return lines
+
+
+def benchmark_roadgraph(rows, columns, drivers, riders, duration):
+    """Print the time it takes to build a distance oracle for a city map of
+    <rows> by <columns> cells, and to simulate a random trace on it.
+
+    @type rows: int
+    @type columns: int
+    @type drivers: int
+    @type riders: int
+    @type duration: int
+    @rtype: None
+    """
+    city = city_map(rows, columns)
+    graph = RoadGraph(city)
+    start = time.perf_counter()
+    oracle = graph.oracle()
+    built = time.perf_counter() - start
+
+    def on_street(token):
+        location = deserialize_location(token)
+        return city[location.row][location.column] != "#"
+
+    # Riders and drivers in buildings are left out.
+    trace = [line for line in random_trace(drivers, riders, rows, columns,
+                                           duration)
+             if all(on_street(token) for token in line.split()
+                    if "," in token)]
+    _, manhattan = time_run(Simulation(), parse_event_lines(trace))
+    set_distance_backend(oracle)
+    try:
+        _, road = time_run(Simulation(), parse_event_lines(trace))
+    finally:
+        set_distance_backend(None)
+    print("{}x{} road graph: {} built in {:.2f}s, run {:.2f}s on roads, "
+          "{:.2f}s on an empty grid".format(
+              rows, columns, type(oracle).__name__, built, road, manhattan))
+
+
+def stress_striped(threads, operations, drivers=200, size=100):
+    """Hammer a StripedDispatcher with rider and driver requests from
+    <threads> threads, <operations> requests each. Return the number of
+    requests done per second, and the number of times a driver or a rider
+    was assigned twice.
+
+    Every thread requests drivers for new riders, and lets every driver it
+    is assigned finish its ride and request a rider again.
+
+    @type threads: int
+    @type operations: int
+    @type drivers: int
+    @type size: int
+    @rtype: (float, int)
+
+    >>> stress_striped(4, 200, 20, 20)[1]
+    0
+    """
+    dispatcher = StripedDispatcher(size, size, 10, 3)
+    generator = random.Random(0)
+    for number in range(drivers):
+        dispatcher.request_rider(Driver(
+            "D{}".format(number), Location(generator.randrange(size),
+                                           generator.randrange(size)), 3))
+
+    check = threading.Lock()
+    busy = set()
+    matched = set()
+    doubles = [0]
+
+    def assign(driver, rider):
+        with check:
+            if id(driver) in busy or rider.id in matched:
+                doubles[0] += 1
+            busy.add(id(driver))
+            matched.add(rider.id)
+
+    def release(driver, local):
+        with check:
+            busy.discard(id(driver))
+        driver.location = Location(local.randrange(size),
+                                   local.randrange(size))
+        rider = dispatcher.request_rider(driver)
+        if rider is not None:
+            assign(driver, rider)
+            return driver
+        return None
+
+    def work(thread):
+        local = random.Random(thread)
+        driving = []
+        for number in range(operations):
+            if driving and local.random() < 0.5:
+                driver = release(driving.pop(local.randrange(len(driving))),
+                                 local)
+                if driver is not None:
+                    driving.append(driver)
+                continue
+            rider = Rider("R{}-{}".format(thread, number),
+                          Location(local.randrange(size),
+                                   local.randrange(size)),
+                          Location(0, 0), 10, 0)
+            driver = dispatcher.request_driver(rider)
+            if driver is not None:
+                assign(driver, rider)
+                driving.append(driver)
+
+    workers = [threading.Thread(target=work, args=(thread,))
+               for thread in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * operations / (time.perf_counter() - start), doubles[0]
+
+
+def benchmark_striped(threads=(1, 2, 4, 8)):
+    """Print the throughput of a StripedDispatcher for every number of
+    threads in <threads>, and the number of double assignments.
+
+    @type threads: tuple[int]
+    @rtype: None
+    """
+    for count in threads:
+        throughput, doubles = stress_striped(count, 20000)
+        print("striped, {} threads: {:.0f} requests/s, {} doubles".format(
+            count, throughput, doubles))
+
+
+if __name__ == "__main__":
+    benchmark_partitioned(random_trace(500, 5000, 100, 100, 5000))
+    benchmark_markets([random_trace(50, 500, 30, 30, 2000, seed)
+                       for seed in range(30)])
+    benchmark_snapshot(random_trace(500, 5000, 100, 100, 5000), 2500)
+    benchmark_rerun(random_trace(500, 5000, 100, 100, 5000),
+                    ["4800 RiderRequest Spike{} 50,50 10,10 10".format(number)
+                     for number in range(100)], 250)
+    benchmark_stepwise(random_trace(500, 5000, 100, 100, 5000))
+    # A rush hour, with about a hundred requests per timestamp.
+    benchmark_stepwise(random_trace(500, 5000, 100, 100, 50))
+    benchmark_engines(random_trace(500, 5000, 100, 100, 5000))
+    benchmark_timeouts(random_trace(500, 5000, 100, 100, 5000))
+    benchmark_lazy(random_trace(500, 5000, 100, 100, 5000))
+    benchmark_roadgraph(40, 40, 100, 1000, 1000)
+    benchmark_roadgraph(100, 100, 500, 5000, 5000)
+    benchmark_trip_distances(random_trace(500, 20000, 100, 100, 20000))
+    benchmark_fleet_report(random_trace(2000, 20000, 100, 100, 20000))
+    benchmark_rollup(random_trace(500, 20000, 100, 100, 20000))
+    benchmark_activity_log(random_trace(500, 20000, 100, 100, 20000))
+    benchmark_cache(random_trace(500, 20000, 100, 100, 20000))
+    # Most riders request a driver from around a hotspot.
+    benchmark_rebalancing(random_trace(100, 3000, 100, 100, 20000,
+                                       hotspot=0.7))
+    # Thousands of routes, with more riders than single rides can serve.
+    benchmark_pooling(random_trace(2000, 40000, 300, 300, 2000))
+    # More riders than the drivers can serve, so that riders wait.
+    benchmark_rider_policies(random_trace(50, 10000, 100, 100, 1000))
+    # A very large fleet, most of which is idle.
+    benchmark_approximate(random_trace(10000, 2000, 1000, 1000, 2000))
+    benchmark_allocations(random_trace(500, 5000, 100, 100, 5000))
+    benchmark_striped()
@@ -0,0 +1,279 @@
+"""Result Cache
+
+This module contains the ResultCache class, which keeps the reports of
+simulation runs on disk, so that a run on the same events with the same
+configuration returns the stored report instead of simulating again.
+
+A report is stored in a file named after its key: a SHA-256 hash of the
+version of the engine, the configuration of the simulation with every
+argument that is left out filled in with its default, and the events in the
+format of the event files. The version of the engine is a hash of the
+source of every module that a run depends on, so that any change to the
+engine invalidates every report stored before it without anyone having to
+remember to clear the cache. Reports stored by other versions of the engine
+are never read again, and are evicted in time like any other.
+
+The cache is bounded in size. Reading a report touches its file, and once
+the files take more than the bound, the least recently used are removed
+until they fit again.
+
+Several processes can share a cache directory. A report is written to a
+temporary file that then replaces the file of its key in a single step, so
+that a reader never sees a partial report, and a report that disappears
+while it is read is a miss. Evictions are serialized by a lock on a file of
+the directory, where file locks are available.
+"""
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Evictions are not serialized where file locks are not available.
+    fcntl = None
+
+from event import serialize_event
+from location import distance_backend
+from simulation import Simulation
+
+# The modules whose source the reports of a run depend on.
+ENGINE_MODULES = ("container", "dispatcher", "driver", "event", "heatmap",
+                  "location", "monitor", "rider", "simulation", "spatial")
+
+# The version of the format of the keys and files of a cache.
+FORMAT = 1
+
+# The suffix of the files of reports.
+_SUFFIX = ".json"
+# The name of the file locked during evictions.
+_LOCK = ".lock"
+
+# The hash of the engine, once computed.
+_engine_digest = None
+
+
+def engine_digest():
+    """Return a hash of the source of the modules in ENGINE_MODULES.
+
+    @rtype: str
+    """
+    global _engine_digest
+    if _engine_digest is None:
+        digest = hashlib.sha256(str(FORMAT).encode())
+        for name in ENGINE_MODULES:
+            module = __import__(name)
+            with open(module.__file__, "rb") as file:
+                digest.update(name.encode() + b"\0" + file.read() + b"\0")
+        _engine_digest = digest.hexdigest()
+    return _engine_digest
+
+
+class ResultCache:
+    """A cache of the reports of simulation runs in a directory.
+
+    === Attributes ===
+    @type directory: str
+        The directory of the files of the reports.
+    @type max_bytes: int
+        The most bytes the files of the reports take before the least
+        recently used are evicted.
+    @type hits: int
+        The number of runs whose report was found in the cache.
+    @type misses: int
+        The number of runs that were simulated.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 2 ** 20):
+        """Initialize a ResultCache in <directory>, which is created if it
+        does not exist, with the reports already in it.
+
+        @type self: ResultCache
+        @type directory: str
+        @type max_bytes: int
+        @rtype: None
+        """
+        self.directory, self.max_bytes = directory, max_bytes
+        self.hits = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, events, config):
+        """Return the key of a run on <events> with the keyword arguments
+        <config> of Simulation.
+
+        Configurations that only differ in leaving out arguments that are
+        given their default values have the same key.
+
+        @type self: ResultCache
+        @type events: list[Event]
+        @type config: dict[str, object]
+        @rtype: str
+
+        >>> from event import create_event_list
+        >>> cache = ResultCache(tempfile.mkdtemp())
+        >>> events = create_event_list("events.txt")
+        >>> cache.key(events, {}) == cache.key(events, {"recycle": False})
+        True
+        >>> cache.key(events, {}) == cache.key(events, {"recycle": True})
+        False
+        """
+        arguments = inspect.signature(Simulation).bind(**config)
+        arguments.apply_defaults()
+        digest = hashlib.sha256(engine_digest().encode())
+        digest.update(json.dumps(arguments.arguments, sort_keys=True).encode())
+        for event in events:
+            digest.update(b"\n" + serialize_event(event).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the report stored under <key>, or None if there is none,
+        and mark it as used.
+
+        @type self: ResultCache
+        @type key: str
+        @rtype: dict[str, object] | None
+        """
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                report = json.load(file)
+        except (OSError, ValueError):
+            # The report was evicted, or never stored.
+            return None
+        _touch(path)
+        return report
+
+    def put(self, key, report):
+        """Store <report> under <key>, and evict the least recently used
+        reports if the reports no longer fit.
+
+        @type self: ResultCache
+        @type key: str
+        @type report: dict[str, object]
+        @rtype: None
+        """
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory,
+                                                 suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(report, file)
+            os.replace(temporary, self._path(key))
+            _touch(self._path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self._evict()
+
+    def run(self, events, **config):
+        """Return the report of Simulation(**config).run(<events>), from the
+        cache if it holds it, and store it in the cache otherwise.
+
+        A run with a rollup or an activity log, or with a distance backend
+        other than the Manhattan distance, has effects or depends on state
+        that the key does not cover, and is always simulated.
+
+        @type self: ResultCache
+        @type events: list[Event]
+        @rtype: dict[str, object]
+
+        >>> from event import create_event_list
+        >>> cache = ResultCache(tempfile.mkdtemp())
+        >>> report = cache.run(create_event_list("events.txt"))
+        >>> cache.run(create_event_list("events.txt")) == report
+        True
+        >>> cache.run(create_event_list("events.txt"), recycle=True) == report
+        True
+        >>> cache.hits, cache.misses
+        (1, 2)
+
+        Trip distances are computed again under the distance backend of the
+        run, so events loaded under another backend share the key.
+
+        >>> from location import set_distance_backend
+        >>> set_distance_backend(lambda origin, destination: 7)
+        >>> events = create_event_list("events.txt")
+        >>> set_distance_backend(None)
+        >>> ResultCache(tempfile.mkdtemp()).run(events) == report
+        True
+        """
+        if (config.get("rollup") is not None or
+                config.get("activity_log") is not None or
+                distance_backend() is not None):
+            self.misses += 1
+            return Simulation(**config).run(events)
+        key = self.key(events, config)
+        report = self.get(key)
+        if report is not None:
+            self.hits += 1
+            return report
+        self.misses += 1
+        report = Simulation(**config).run(events)
+        self.put(key, report)
+        return report
+
+    def _path(self, key):
+        """Return the path of the file of the report stored under <key>.
+
+        @type self: ResultCache
+        @type key: str
+        @rtype: str
+        """
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def _evict(self):
+        """Remove the least recently used reports until the reports take at
+        most max_bytes.
+
+        @type self: ResultCache
+        @rtype: None
+
+        >>> cache = ResultCache(tempfile.mkdtemp(), 40)
+        >>> for key in ["kal", "bal", "cal"]:
+        ...     cache.put(key, {"rider_wait_time": 1.5})
+        >>> cache.get("kal"), cache.get("cal")
+        (None, {'rider_wait_time': 1.5})
+        """
+        with open(os.path.join(self.directory, _LOCK), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith(_SUFFIX):
+                    continue
+                try:
+                    status = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, name, status.st_size))
+                total += status.st_size
+            entries.sort()
+            for _, name, size in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                total -= size
+
+
+def _touch(path):
+    """Set the modification time of the file at <path> to now.
+
+    The time is set explicitly, as the file system may only keep times as
+    precise as its clock ticks, which would tie files used in a row.
+    A file that no longer exists is left alone.
+
+    @type path: str
+    @rtype: None
+    """
+    now = time.time_ns()
+    try:
+        os.utime(path, ns=(now, now))
+    except FileNotFoundError:
+        # The file was evicted by another process in the meantime.
+        pass
@@ -1,3 +1,7 @@
+import bisect
+import heapq
+
+
 class Container:
     """A container that holds objects.
 
@@ -30,6 +34,69 @@ class Container:
         raise NotImplementedError("Implemented in a subclass")
 
 
+class Handle:
+    """A handle to an item that was added to a container, with which the
+    item can be cancelled in constant time before it is removed.
+
+    === Attributes ===
+    @type cancelled: bool
+        Whether the item has been cancelled.
+    @type key: object
+        The key the item was added under, if the container has keys.
+    """
+
+    # === Private Attributes ===
+    # @type _container: PriorityQueue | TimeoutQueue | None
+    #     The container the item is in, or None once it has been removed or
+    #     cancelled.
+
+    def __init__(self, container, key=None):
+        """Initialize a Handle to an item of <container>.
+
+        @type self: Handle
+        @type container: PriorityQueue | TimeoutQueue
+        @type key: object
+        @rtype: None
+        """
+        self.cancelled = False
+        self.key = key
+        self._container = container
+
+    def cancel(self):
+        """Cancel the item, unless it has already been removed or cancelled.
+
+        @type self: Handle
+        @rtype: None
+
+        >>> pq = PriorityQueue()
+        >>> handle = pq.add("red")
+        >>> _ = pq.add("blue")
+        >>> handle.cancel()
+        >>> pq.remove()
+        'blue'
+        >>> pq.is_empty()
+        True
+        """
+        if self._container is not None:
+            container, self._container = self._container, None
+            self.cancelled = True
+            container._cancel(self)
+
+    def __getstate__(self):
+        """Return the state of this Handle to pickle, without its container.
+
+        A container reattaches the handles of its items when it is
+        unpickled, so that pickling an item on its own does not pickle the
+        whole container along with it.
+
+        @type self: Handle
+        @rtype: dict
+        """
+        state = self.__dict__.copy()
+        state["_container"] = None
+        return state
+
+
 class PriorityQueue(Container):
     """A queue of items that operates in priority order.
 
@@ -48,11 +115,19 @@ class PriorityQueue(Container):
 
     # === Private Attributes ===
     # @type _items: list
-    #     The items stored in the priority queue.
+    #     The items stored in the priority queue, including cancelled ones.
+    # @type _handles: list[Handle]
+    #     The handle of every item in _items, at the same index.
+    # @type _cancelled: int
+    #     The number of cancelled items in _items.
     #
     # === Representation Invariants ===
     # _items is a sorted list, where the first item in the queue is the
     # item with the highest priority.
+    # The first item of _items is not cancelled.
+
+    # The fraction of cancelled items at which they are all dropped at once.
+    _COMPACT_FRACTION = 0.5
 
     def __init__(self):
         """Initialize an empty PriorityQueue.
@@ -61,6 +136,8 @@ class PriorityQueue(Container):
         @rtype: None
         """
         self._items = []
+        self._handles = []
+        self._cancelled = 0
 
     def __lt__(self, other):
         """
@@ -111,10 +188,10 @@ class PriorityQueue(Container):
         @rtype: object
 
         >>> pq = PriorityQueue()
-        >>> pq.add("red")
-        >>> pq.add("blue")
-        >>> pq.add("yellow")
-        >>> pq.add("green")
+        >>> _ = pq.add("red")
+        >>> _ = pq.add("blue")
+        >>> _ = pq.add("yellow")
+        >>> _ = pq.add("green")
         >>> pq.remove()
         'blue'
         >>> pq.remove()
@@ -124,7 +201,46 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'yellow'
         """
-        return self._items.pop(0)
+        self._handles.pop(0)._container = None
+        item = self._items.pop(0)
+        self._skip_cancelled()
+        return item
+
+    def peek(self):
+        """Return the next item from this PriorityQueue without removing it.
+
+        Precondition: <self> should not be empty.
+
+        @type self: PriorityQueue
+        @rtype: object
+
+        >>> pq = PriorityQueue()
+        >>> _ = pq.add("red")
+        >>> _ = pq.add("blue")
+        >>> pq.peek()
+        'blue'
+        >>> len(pq._items)
+        2
+        """
+        return self._items[0]
+
+    def __iter__(self):
+        """Return an iterator over the items of this PriorityQueue, in the
+        order in which they would be removed.
+
+        @type self: PriorityQueue
+        @rtype: iterator
+
+        >>> pq = PriorityQueue()
+        >>> _ = pq.add("red")
+        >>> _ = pq.add("blue")
+        >>> list(pq)
+        ['blue', 'red']
+        """
+        if self._cancelled == 0:
+            return iter(self._items)
+        return (item for item, handle in zip(self._items, self._handles)
+                if not handle.cancelled)
 
     def is_empty(self):
         """
@@ -136,63 +252,218 @@ class PriorityQueue(Container):
         >>> pq = PriorityQueue()
         >>> pq.is_empty()
         True
-        >>> pq.add("thing")
+        >>> _ = pq.add("thing")
         >>> pq.is_empty()
         False
         """
-        return len(self._items) == 0
+        return len(self._items) == self._cancelled
 
     def add(self, item):
-        """Add <item> to this PriorityQueue.
+        """Add <item> to this PriorityQueue, and return a handle with which
+        it can be cancelled.
 
         @type self: PriorityQueue
         @type item: object
-        @rtype: None
+        @rtype: Handle
 
         >>> pq = PriorityQueue()
-        >>> pq.add("yellow")
-        >>> pq.add("blue")
-        >>> pq.add("red")
-        >>> pq.add("green")
+        >>> _ = pq.add("yellow")
+        >>> _ = pq.add("blue")
+        >>> _ = pq.add("red")
+        >>> _ = pq.add("green")
         >>> pq._items
         ['blue', 'green', 'red', 'yellow']
 
         """
-        # TODO
-        # fix this method so that it orders the events based on priority
-        if (self.is_empty()):
-            self._items.append(item)
+        # An item is placed after every item with equal priority, keeping
+        # ties in FIFO order.
+        index = bisect.bisect_right(self._items, item)
+        handle = Handle(self)
+        self._items.insert(index, item)
+        self._handles.insert(index, handle)
+        return handle
+
+    def _cancel(self, handle):
+        """Record that the item of <handle> has been cancelled.
+
+        The item is left in place until it reaches the front of the queue,
+        or until cancelled items make up too much of the queue.
+
+        @type self: PriorityQueue
+        @type handle: Handle
+        @rtype: None
+
+        >>> pq = PriorityQueue()
+        >>> handles = [pq.add(colour) for colour in ["red", "blue", "green"]]
+        >>> handles[0].cancel()
+        >>> pq._items
+        ['blue', 'green', 'red']
+        >>> handles[2].cancel()
+        >>> pq._items
+        ['blue']
+        """
+        self._cancelled += 1
+        if self._cancelled > len(self._items) * self._COMPACT_FRACTION:
+            self._items = [item for item, kept in zip(self._items,
+                                                      self._handles)
+                           if not kept.cancelled]
+            self._handles = [kept for kept in self._handles
+                             if not kept.cancelled]
+            self._cancelled = 0
         else:
-            # self._items.append(item)
-            #  for x in self._items:
-            #     if x > item:
-            #         if(self._items.index(x) == len(self._items)-1):
-            #             self._items.append(item)
-            #         else:
-            #             continue
-            #     else:
-            #         self._items.insert(self._items.index(x)-1,item)
-            self._items.reverse()
-            for x in self._items:
-                if x > item:
-                   # print(x,">",item)
-                    if (self._items.index(x) == len(self._items) - 1):
-                        self._items.append(item)
-                        break
-                    else:
-                        continue
-                else:
-                    self._items.insert(self._items.index(x), item)
-                    break
-                    #print(x, "<", item)
-            self._items.reverse()
+            self._skip_cancelled()
 
+    def _skip_cancelled(self):
+        """Drop the cancelled items from the front of the queue.
 
+        @type self: PriorityQueue
+        @rtype: None
+        """
+        while self._cancelled and self._handles and self._handles[0].cancelled:
+            self._handles.pop(0)
+            self._items.pop(0)
+            self._cancelled -= 1
+
+    def __setstate__(self, state):
+        """Restore the state of an unpickled PriorityQueue, and reattach the
+        handles of its items.
+
+        @type self: PriorityQueue
+        @type state: dict
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        for handle in self._handles:
+            if not handle.cancelled:
+                handle._container = self
 
 
+class TimeoutQueue(Container):
+    """A queue of timeouts that can be disarmed before they expire.
 
+    Every item has a timestamp and a sequence attribute, and items are
+    removed in order of their timestamp, ties in order of their sequence.
+    Every item is added with a key, and the item of a key can be disarmed in
+    constant time, either by its key or by its handle, without searching for
+    it. Disarmed items are left in place, and are skipped once they reach
+    the front of the queue.
+    """
 
+    # === Private Attributes ===
+    # @type _heap: list[(int, int, Handle, object)]
+    #     A heap of the timestamp, sequence, handle and item of every item
+    #     added, including disarmed ones.
+    # @type _armed: dict[object, Handle]
+    #     The handles of the items that are armed, by key.
 
+    def __init__(self):
+        """Initialize an empty TimeoutQueue.
 
+        @type self: TimeoutQueue
+        @rtype: None
+        """
+        self._heap = []
+        self._armed = {}
 
+    def add(self, item, key):
+        """Add <item> to this TimeoutQueue, armed under <key>, and return a
+        handle with which it can be disarmed.
+
+        Precondition: no other armed item has the key <key>, and no other
+        item has the same timestamp and sequence as <item>.
+
+        @type self: TimeoutQueue
+        @type item: object
+        @type key: object
+        @rtype: Handle
+        """
+        handle = Handle(self, key)
+        heapq.heappush(self._heap, (item.timestamp, item.sequence, handle,
+                                    item))
+        self._armed[key] = handle
+        return handle
+
+    def disarm(self, key):
+        """Disarm the item added under <key>, if it is still armed.
+
+        @type self: TimeoutQueue
+        @type key: object
+        @rtype: None
+
+        >>> from types import SimpleNamespace as Timeout
+        >>> timeouts = TimeoutQueue()
+        >>> _ = timeouts.add(Timeout(timestamp=5, sequence=0), "kal")
+        >>> _ = timeouts.add(Timeout(timestamp=3, sequence=1), "bal")
+        >>> timeouts.disarm("bal")
+        >>> timeouts.remove().timestamp
+        5
+        >>> timeouts.is_empty()
+        True
+        """
+        handle = self._armed.get(key)
+        if handle is not None:
+            handle.cancel()
+
+    def peek(self):
+        """Return the next armed item without removing it.
+
+        Precondition: <self> should not be empty.
 
+        @type self: TimeoutQueue
+        @rtype: object
+        """
+        self._skip_disarmed()
+        return self._heap[0][3]
+
+    def remove(self):
+        """Remove and return the next armed item.
+
+        Precondition: <self> should not be empty.
+
+        @type self: TimeoutQueue
+        @rtype: object
+        """
+        self._skip_disarmed()
+        _, _, handle, item = heapq.heappop(self._heap)
+        del self._armed[handle.key]
+        handle._container = None
+        return item
+
+    def is_empty(self):
+        """Return True iff this TimeoutQueue has no armed items.
+
+        @type self: TimeoutQueue
+        @rtype: bool
+        """
+        return len(self._armed) == 0
+
+    def _cancel(self, handle):
+        """Record that the item of <handle> has been disarmed.
+
+        @type self: TimeoutQueue
+        @type handle: Handle
+        @rtype: None
+        """
+        del self._armed[handle.key]
+
+    def _skip_disarmed(self):
+        """Drop the disarmed items from the front of the heap.
+
+        @type self: TimeoutQueue
+        @rtype: None
+        """
+        heap = self._heap
+        while heap[0][2].cancelled:
+            heapq.heappop(heap)
+
+    def __setstate__(self, state):
+        """Restore the state of an unpickled TimeoutQueue, and reattach the
+        handles of its armed items.
+
+        @type self: TimeoutQueue
+        @type state: dict
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        for handle in self._armed.values():
+            handle._container = self
@@ -1,6 +1,18 @@
+import threading
+from collections import OrderedDict
+
 from driver import Driver
 from rider import Rider
-from location import Location
+from location import Location, distance_bound
+from spatial import GridIndex
+
+# The policies with which a driver is assigned a waiting rider.
+LONGEST_WAITING = "longest waiting"
+NEAREST = "nearest"
+TRADE_OFF = "trade-off"
+
+# The travel time of a driver that cannot reach a location.
+_NEVER = float("inf")
 
 
 class Dispatcher:
@@ -17,18 +29,110 @@ class Dispatcher:
     the dispatcher does nothing. Once a driver requests a rider, the driver
     is registered with the dispatcher, and will be used to fulfill future
     rider requests.
+
+    Which waiting rider a driver is assigned depends on the rider policy:
+    the longest waiting rider, the nearest one, or the one with the best
+    trade-off between the distance to them and how long they have waited.
+    The nearest and trade-off policies look riders up in a spatial index.
+
+    A dispatcher for a very large fleet can be made approximate: it then
+    keeps the drivers that are waiting for a rider in a spatial index, and
+    only searches the neighbourhood of a rider for a driver, which may be
+    further away than the nearest driver by a bounded factor.
+
+    A dispatcher with a demand heatmap adds every rider request to it, and
+    can plan to move idle drivers towards the cells with the most demand.
     """
 
-    def __init__(self):
+    # === Private Attributes ===
+    # @type _waiting: OrderedDict[Rider, None]
+    #     The waiting riders, the longest waiting first.
+    # @type _registered: dict[int, int]
+    #     The registration number of every driver in driver_list, by id().
+    # @type _registrations: int
+    #     The number of registrations so far.
+    # @type _policy: str
+    #     The rider policy: LONGEST_WAITING, NEAREST or TRADE_OFF.
+    # @type _wait_weight: int | float
+    #     How much distance a rider that has waited one more unit of time is
+    #     worth under the trade-off policy.
+    # @type _index: GridIndex | None
+    #     The waiting riders at their origins, ranked by the time of their
+    #     request, unless the policy is LONGEST_WAITING.
+    # @type _idle: GridIndex | None
+    #     The drivers that are waiting for a rider, scaled by the inverse of
+    #     their speed, if the dispatcher is approximate.
+    # @type _factor: int | float
+    #     How many times further away than the nearest driver an approximate
+    #     dispatch may choose a driver.
+    # @type _max_candidates: int | None
+    #     The number of drivers after which an approximate dispatch stops
+    #     searching, or None.
+    # @type _monitor: Monitor | None
+    #     The monitor that approximate dispatches are checked for, or None.
+    # @type _check_interval: int
+    #     The number of approximate dispatches per dispatch checked.
+    # @type _unchecked: int
+    #     The number of approximate dispatches left until the next one that
+    #     is checked.
+    # @type _heatmap: DemandHeatmap | None
+    #     The demand of the rider requests, or None.
+
+    def __init__(self, rider_policy=LONGEST_WAITING, wait_weight=1,
+                 approximation=None, max_candidates=None, monitor=None,
+                 heatmap=None, check_interval=1):
         """Initialize a Dispatcher.
 
+        The dispatcher is approximate if <approximation> or <max_candidates>
+        is not None. If <monitor> is not None, one approximate dispatch in
+        every <check_interval>, starting with the first, is also checked
+        against the nearest driver, and recorded in <monitor>.
+        If <heatmap> is not None, every rider request is added to it.
+
         @type self: Dispatcher
+        @type rider_policy: str
+            LONGEST_WAITING, NEAREST or TRADE_OFF.
+        @type wait_weight: int | float
+            How much distance a rider that has waited one more unit of time
+            is worth under the TRADE_OFF policy.
+        @type approximation: int | float | None
+            How many times the travel time of the nearest driver the travel
+            time of a driver may be, at least 1.
+        @type max_candidates: int | None
+            The number of drivers after which a search stops, in which case
+            the driver found may be any further away.
+        @type monitor: Monitor | None
+        @type heatmap: DemandHeatmap | None
+        @type check_interval: int
         @rtype: None
         """
         # TODO
-        self.waiting_list = []
+        self._waiting = OrderedDict()
         self.driver_list = []
         # self.rider_list = []
+        self._registered = {}
+        self._registrations = 0
+        self._policy, self._wait_weight = rider_policy, wait_weight
+        self._index = None
+        if rider_policy != LONGEST_WAITING:
+            self._index = GridIndex()
+        self._idle = None
+        if approximation is not None or max_candidates is not None:
+            self._idle = GridIndex()
+        self._factor = 1 if approximation is None else approximation
+        self._max_candidates = max_candidates
+        self._monitor = monitor
+        self._check_interval, self._unchecked = check_interval, 1
+        self._heatmap = heatmap
+
+    @property
+    def waiting_list(self):
+        """Return the waiting riders, the longest waiting first.
+
+        @type self: Dispatcher
+        @rtype: list[Rider]
+        """
+        return list(self._waiting)
 
     def __str__(self):
         """Return a string representation.
@@ -66,24 +170,93 @@ class Dispatcher:
         >>> print(dis2.request_driver(kal))
         identifier:fire, location:(5,5), speed:5 idle status:True destination:(None)
 
+        A driver that cannot reach the rider is never returned:
+
+        >>> from location import set_distance_backend
+        >>> from roadgraph import LandmarkOracle, RoadGraph
+        >>> set_distance_backend(LandmarkOracle(RoadGraph(["..#..", "..#..",
+        ...                                                "..#.."])))
+        >>> for dis3 in [Dispatcher(), Dispatcher(NEAREST, approximation=2)]:
+        ...     dis3.request_rider(Driver("mud", Location(0,0), 1))
+        ...     bal = Rider("bal", Location(0,4), Location(2,4), 5, 1)
+        ...     print(dis3.request_driver(bal),
+        ...           dis3.request_rider(Driver("sun", Location(2,3), 1)) is bal)
+        None True
+        None True
+        >>> set_distance_backend(None)
         """
         # TODO
+        if self._heatmap is not None:
+            self._heatmap.add(rider.timestamp, rider.origin)
+        if self._idle is not None:
+            return self._request_nearby_driver(rider)
         # checks the dictionary to see if there is an available driver
-        driver = None
-
-        for driver_registered in self.driver_list:
-            if not driver_registered.rider and driver_registered.is_idle:
-                # check for if this is the first person assigned
-                if driver is None:
-                    driver = driver_registered
-                elif driver_registered.get_travel_time(rider.origin) < driver.get_travel_time(rider.origin):
-                    driver = driver_registered
+        driver = self.nearest_driver(rider.origin)
 
         if driver is None:
-            self.waiting_list.append(rider)
+            self._wait(rider)
         else:
             return driver
 
+    def nearest_driver(self, location):
+        """Return the idle driver with the shortest travel time to
+        <location>, the first registered on ties, or None if no idle driver
+        can reach <location>. The driver stays idle.
+
+        @type self: Dispatcher
+        @type location: Location
+        @rtype: Driver | None
+
+        >>> dis = Dispatcher()
+        >>> dis.request_rider(Driver("fire", Location(5,5), 5))
+        >>> dis.request_rider(Driver("ice", Location(5,1), 5))
+        >>> dis.nearest_driver(Location(5,2)).id
+        'ice'
+        """
+        return _nearest_driver([driver for driver in self.driver_list
+                                if not driver.rider and driver.is_idle],
+                               location)
+
+    def request_drivers(self, riders):
+        """Return a driver for every rider in <riders>, in a single pass.
+
+        The result is the same as the one of calling request_driver for each
+        rider in turn, where every driver returned starts driving to its
+        rider before the next call: the idle drivers are collected once, and
+        a driver is assigned to at most one rider of <riders>.
+
+        @type self: Dispatcher
+        @type riders: list[Rider]
+        @rtype: list[Driver | None]
+
+        >>> dis = Dispatcher()
+        >>> dis.request_rider(Driver("fire", Location(5,5), 5))
+        >>> dis.request_rider(Driver("ice", Location(9,9), 5))
+        >>> kal = Rider("kal", Location(5,2), Location(3,2), 5, 3)
+        >>> bal = Rider("bal", Location(5,3), Location(3,2), 5, 3)
+        >>> cal = Rider("cal", Location(1,1), Location(3,2), 5, 3)
+        >>> [driver and driver.id for driver in dis.request_drivers([kal, bal, cal])]
+        ['fire', 'ice', None]
+        >>> dis.waiting_list == [cal]
+        True
+        """
+        if self._heatmap is not None:
+            for rider in riders:
+                self._heatmap.add(rider.timestamp, rider.origin)
+        if self._idle is not None:
+            return [self._request_nearby_driver(rider) for rider in riders]
+        idle = [driver for driver in self.driver_list
+                if not driver.rider and driver.is_idle]
+        drivers = []
+        for rider in riders:
+            driver = _nearest_driver(idle, rider.origin)
+            if driver is None:
+                self._wait(rider)
+            else:
+                idle.remove(driver)
+            drivers.append(driver)
+        return drivers
+
     def request_rider(self, driver):
         """Return a rider for the driver, or None if no rider is available.
 
@@ -107,26 +280,143 @@ class Dispatcher:
         identifier:fire, location:(5,6), speed:5 idle status:True destination:(None)
         >>> print(dis.request_rider(fire))
         unique_identifier: kal , origin: (5,2), destination: (3,2), patience: 5, status: waiting, timestamp: 3
-
+        >>> near = Dispatcher(NEAREST)
+        >>> near.request_driver(kal)
+        >>> near.request_driver(Rider("bal", Location(5,7), destination, 5, 4))
+        >>> print(near.request_rider(fire).id)
+        bal
+        >>> [rider.id for rider in near.waiting_list]
+        ['kal']
         """
         # TODO
         # check if the driver is in the driver_dict
-        if driver not in self.driver_list:
+        # No two drivers are equal, so a driver is registered iff its id() is.
+        if id(driver) not in self._registered:
+            self._registered[id(driver)] = self._registrations
+            self._registrations += 1
             self.driver_list.append(driver)
+        if self._idle is not None:
+            self._idle.remove(driver)
 
 
-        if len(self.waiting_list) == 0:
+        rider = None
+        if self._index is None:
+            # The longest waiting rider that the driver can reach is the
+            # first of them on the waiting list.
+            for waiting in self._waiting:
+                if driver.get_travel_time(waiting.origin) != _NEVER:
+                    rider = waiting
+                    break
+        elif self._waiting:
+            rider = self._index.nearest(
+                driver.location,
+                self._wait_weight if self._policy == TRADE_OFF else 0)
+            # No rider can be reached if the nearest one cannot.
+            if driver.get_travel_time(rider.origin) == _NEVER:
+                rider = None
+            else:
+                self._index.remove(rider)
+        if rider is None:
+            if self._idle is not None:
+                # Ties go to the first registered, as they do without the
+                # index.
+                self._idle.add(driver, driver.location,
+                               self._registered[id(driver)], 1 / driver.speed)
             return None
-        else:
-            # this line will work but just to be safe im adding the loop
-            # return self.waiting_list[0]
-            rider = self.waiting_list[0]
-            #this code returns the closest rider to the driver, but the assignment asks for the longest waiting
-            #i.e the highest priority in the waiting list so I'll comment this bit out
-            # for riders in self.waiting_list:
-            #     if rider.timestamp < riders:
-            #         rider = riders
-            return rider
+        del self._waiting[rider]
+        return rider
+
+    def unregister(self, driver):
+        """Unregister <driver>, which is no longer used to fulfill rider
+        requests until it requests a rider again.
+
+        Precondition: <driver> is registered and is not waiting for a rider.
+
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: None
+
+        >>> dis = Dispatcher()
+        >>> fire = Driver("fire", Location(5,5), 5)
+        >>> fire.is_idle = False
+        >>> dis.request_rider(fire)
+        >>> dis.unregister(fire)
+        >>> dis.driver_list
+        []
+        """
+        del self._registered[id(driver)]
+        self.driver_list.remove(driver)
+
+    def rebalance(self, timestamp, max_moves=None):
+        """Return a plan to move idle drivers towards the demand at
+        <timestamp>, as a list of drivers and the locations to move them to.
+
+        The idle drivers are shared out between the cells with the most
+        demand, in proportion to their demand. Every cell that is short of
+        its share gets the nearest drivers from the cells with more than
+        their share, in order of their travel time, the drivers of the cells
+        with the least demand first on ties. The drivers planned to move are
+        no longer waiting for a rider, and should start driving at once.
+
+        Precondition: this dispatcher has a demand heatmap.
+
+        @type self: Dispatcher
+        @type timestamp: int | float
+        @type max_moves: int | None
+            The most drivers to move, or None for no limit.
+        @rtype: list[(Driver, Location)]
+
+        >>> from heatmap import DemandHeatmap
+        >>> heatmap = DemandHeatmap(8)
+        >>> dis = Dispatcher(heatmap=heatmap)
+        >>> for name, row in [("fire", 1), ("ice", 2), ("mud", 40)]:
+        ...     dis.request_rider(Driver(name, Location(row, 1), 1))
+        >>> heatmap.add(0, Location(1, 1))
+        >>> heatmap.add(0, Location(41, 2))
+        >>> heatmap.add(0, Location(42, 2))
+        >>> [(driver.id, str(location)) for driver, location in
+        ...  dis.rebalance(0)]
+        [('ice', '44,4')]
+        """
+        heatmap = self._heatmap
+        idle = [driver for driver in self.driver_list
+                if not driver.rider and driver.is_idle]
+        hot = heatmap.hottest(timestamp, len(idle))
+        total = sum(demand for _, demand in hot)
+        if not total:
+            return []
+        shares = {cell: int(len(idle) * demand / total + 0.5)
+                  for cell, demand in hot}
+        by_cell = {}
+        for driver in idle:
+            by_cell.setdefault(heatmap.cell_of(driver.location),
+                               []).append(driver)
+
+        # The drivers beyond the share of their cell, added from the cells
+        # with the least demand up, so that they win ties.
+        spare = GridIndex(heatmap.cell_size)
+        for cell in sorted(by_cell, key=lambda cell: heatmap.demand(
+                timestamp, by_cell[cell][0].location)):
+            for driver in by_cell[cell][shares.get(cell, 0):]:
+                spare.add(driver, driver.location, scale=1 / driver.speed)
+
+        moves = []
+        for cell, _ in hot:
+            target = heatmap.center(cell)
+            for _ in range(shares[cell] - len(by_cell.get(cell, ()))):
+                if max_moves is not None and len(moves) >= max_moves:
+                    return moves
+                driver = spare.nearest(target)
+                if driver is None:
+                    return moves
+                if driver.get_travel_time(target) == _NEVER:
+                    # No spare driver can reach the cell.
+                    break
+                spare.remove(driver)
+                if self._idle is not None:
+                    self._idle.remove(driver)
+                moves.append((driver, target))
+        return moves
 
     def cancel_ride(self, rider):
         """Cancel the ride for rider.
@@ -148,6 +438,653 @@ class Dispatcher:
         >>> print(dis.waiting_list)
         []
         """
-        # TODO
-        self.waiting_list.remove(rider)
+        # A rider that has already been assigned a driver is no longer on
+        # the waiting list.
+        if rider in self._waiting:
+            del self._waiting[rider]
+            if self._index is not None:
+                self._index.remove(rider)
         rider.cancel()
+
+    def __getstate__(self):
+        """Return the state of this Dispatcher to pickle, with the
+        registration numbers in the order of the registered drivers, since
+        unpickled drivers do not share their id().
+
+        @type self: Dispatcher
+        @rtype: dict
+
+        >>> import pickle
+        >>> dis = Dispatcher(approximation=1)
+        >>> for name in ["fire", "ice", "mud"]:
+        ...     dis.request_rider(Driver(name, Location(5,5), 5))
+        >>> for name in ["kal", "bal"]:
+        ...     dis.unregister(dis.request_driver(
+        ...         Rider(name, Location(5,5), Location(3,2), 5, 3)))
+        >>> copy = pickle.loads(pickle.dumps(dis))
+        >>> copy.request_rider(Driver("sun", Location(5,5), 5))
+        >>> copy.request_driver(Rider("cal", Location(5,5), Location(3,2),
+        ...                           5, 3)).id
+        'mud'
+        """
+        state = self.__dict__.copy()
+        state["_registered"] = [self._registered[id(driver)]
+                                for driver in self.driver_list]
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state of an unpickled Dispatcher.
+
+        @type self: Dispatcher
+        @type state: dict
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        self._registered = {id(driver): number for driver, number
+                            in zip(self.driver_list, state["_registered"])}
+
+    def _request_nearby_driver(self, rider):
+        """Return a driver near the rider from the drivers waiting for a
+        rider, or None if no driver is waiting.
+
+        Add the rider to the waiting list if no driver is waiting.
+
+        Precondition: this dispatcher is approximate.
+
+        @type self: Dispatcher
+        @type rider: Rider
+        @rtype: Driver | None
+
+        >>> from monitor import Monitor
+        >>> monitor = Monitor()
+        >>> dis = Dispatcher(approximation=4, monitor=monitor)
+        >>> dis.request_rider(Driver("fire", Location(5,9), 5))
+        >>> dis.request_rider(Driver("ice", Location(5,30), 1))
+        >>> kal = Rider("kal", Location(5,2), Location(3,2), 5, 3)
+        >>> print(dis.request_driver(kal).id)
+        fire
+        >>> print(dis.request_driver(kal).id)
+        ice
+        >>> print(dis.request_driver(kal))
+        None
+        >>> monitor.approximation_report()["approximate_dispatches"]
+        2
+        >>> monitor = Monitor()
+        >>> dis = Dispatcher(approximation=4, monitor=monitor, check_interval=3)
+        >>> for number in range(7):
+        ...     dis.request_rider(Driver(str(number), Location(5,9), 5))
+        >>> for number in range(7):
+        ...     _ = dis.request_driver(kal)
+        >>> monitor.approximation_report()["approximate_dispatches"]
+        3
+        """
+        driver = self._idle.nearest(rider.origin, 0, self._factor,
+                                    self._max_candidates)
+        if driver is not None and \
+                driver.get_travel_time(rider.origin) == _NEVER:
+            # A driver that cannot reach the rider scores higher than any
+            # driver that can, so none of the drivers looked at can.
+            driver = None
+        if driver is None:
+            self._wait(rider)
+            return None
+        self._unchecked -= 1
+        if self._monitor is not None and self._unchecked == 0:
+            self._unchecked = self._check_interval
+            nearest = self._idle.nearest(rider.origin)
+            self._monitor.record_approximation(
+                driver.get_travel_time(rider.origin),
+                nearest.get_travel_time(rider.origin))
+        self._idle.remove(driver)
+        return driver
+
+    def _wait(self, rider):
+        """Add <rider> to the waiting list.
+
+        @type self: Dispatcher
+        @type rider: Rider
+        @rtype: None
+        """
+        self._waiting[rider] = None
+        if self._index is not None:
+            self._index.add(rider, rider.origin, rider.timestamp)
+
+
+def _nearest_driver(drivers, location):
+    """Return the driver of <drivers> with the shortest travel time to
+    <location>, the first of them on ties, or None if none of them can reach
+    <location>.
+
+    If the distance backend has lower bounds, the drivers are considered in
+    order of the bounds on their travel times, and the travel time of a
+    driver is only found if its bound could beat the nearest driver so far.
+
+    @type drivers: list[Driver]
+    @type location: Location
+    @rtype: Driver | None
+
+    >>> from location import set_distance_backend
+    >>> from roadgraph import LandmarkOracle, RoadGraph
+    >>> drivers = [Driver("fire", Location(0, 4), 1),
+    ...            Driver("mud", Location(2, 7), 1)]
+    >>> _nearest_driver(drivers, Location(0, 6)).id
+    'fire'
+    >>> set_distance_backend(LandmarkOracle(RoadGraph([".....#....",
+    ...                                                ".....#....",
+    ...                                                ".........."])))
+    >>> _nearest_driver(drivers, Location(0, 6)).id
+    'mud'
+    >>> set_distance_backend(LandmarkOracle(RoadGraph([".....#....",
+    ...                                                ".....#...."])))
+    >>> print(_nearest_driver(drivers[:1], Location(0, 6)))
+    None
+    >>> set_distance_backend(None)
+    """
+    bound = distance_bound()
+    if bound is None:
+        nearest, nearest_time = None, _NEVER
+        for driver in drivers:
+            travel_time = driver.get_travel_time(location)
+            if travel_time < nearest_time:
+                nearest, nearest_time = driver, travel_time
+        return nearest
+
+    nearest = None
+    for estimate, order, driver in sorted(
+            (bound(driver.location, location) / driver.speed, order, driver)
+            for order, driver in enumerate(drivers)):
+        if estimate == _NEVER or (nearest is not None and
+                                  estimate > nearest[0]):
+            # No driver left can be nearer, or reach <location> at all.
+            break
+        travel_time = driver.get_travel_time(location)
+        if travel_time == _NEVER:
+            continue
+        if nearest is None or (travel_time, order) < nearest[:2]:
+            nearest = (travel_time, order, driver)
+    return nearest and nearest[2]
+
+
+class _Region:
+    """A region of the grid, with the idle drivers and the waiting riders in
+    it.
+
+    === Attributes ===
+    @type lock: threading.Lock
+        The lock that guards the drivers and riders of the region.
+    @type idle: dict[int, (int, Driver)]
+        The idle drivers in the region by their id(), with their
+        registration order.
+    @type waiting: dict[Rider, int]
+        The waiting riders in the region, with the order of their requests.
+    """
+
+    def __init__(self):
+        """Initialize an empty _Region.
+
+        @type self: _Region
+        @rtype: None
+        """
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.waiting = {}
+
+    def __getstate__(self):
+        """Return the state of this _Region to pickle, without its lock, and
+        with its idle drivers without their id(), which unpickled drivers do
+        not share.
+
+        @type self: _Region
+        @rtype: dict
+        """
+        state = self.__dict__.copy()
+        del state["lock"]
+        state["idle"] = list(self.idle.values())
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state of an unpickled _Region.
+
+        @type self: _Region
+        @type state: dict
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.idle = {id(driver): (order, driver)
+                     for order, driver in state["idle"]}
+
+
+class StripedDispatcher(Dispatcher):
+    """A dispatcher that can be used from several threads at once.
+
+    The grid is split into square regions, each with its own lock, that hold
+    the idle drivers and the waiting riders in them. A search for the nearest
+    driver or rider locks a growing square of regions around its start, and
+    always takes the locks in the order of the regions, so that two searches
+    can never wait for each other. A request only gives up on finding a match
+    while it holds the locks of every region, so that a rider and a driver
+    can never both end up waiting for each other.
+
+    Unlike a Dispatcher, a driver is only assigned to riders between a
+    request for a rider that was not fulfilled and being assigned, and a
+    driver is assigned the longest waiting rider of the nearest regions that
+    have waiting riders.
+    """
+
+    # === Private Attributes ===
+    # @type _size: int
+    #     The number of rows and columns of a region.
+    # @type _rows: int
+    #     The number of rows of regions.
+    # @type _columns: int
+    #     The number of columns of regions.
+    # @type _max_speed: int
+    #     The speed that no registered driver goes faster than.
+    # @type _regions: list[_Region]
+    #     The regions, row by row.
+    # @type _orders: dict[int, int]
+    #     The registration order of the registered drivers, by their id().
+    # @type _registrations: int
+    #     The number of drivers registered so far.
+    # @type _registry_lock: threading.Lock
+    #     The lock that guards the registered drivers.
+    # @type _requests: int
+    #     The number of riders added to the waiting riders so far.
+
+    def __init__(self, rows, columns, region_size, max_speed):
+        """Initialize a StripedDispatcher for a grid of <rows> by <columns>.
+
+        @type self: StripedDispatcher
+        @type rows: int
+        @type columns: int
+        @type region_size: int
+            The number of rows and columns of a region.
+        @type max_speed: int
+            The speed that no driver goes faster than.
+        @rtype: None
+        """
+        # The waiting riders are kept in the regions.
+        self.driver_list = []
+        self._orders = {}
+        self._registrations = 0
+        self._size, self._max_speed = region_size, max_speed
+        self._rows = -(-rows // region_size)
+        self._columns = -(-columns // region_size)
+        self._regions = [_Region() for _ in range(self._rows * self._columns)]
+        self._registry_lock = threading.Lock()
+        self._requests = 0
+
+    @property
+    def waiting_list(self):
+        """Return the waiting riders, the longest waiting first.
+
+        @type self: StripedDispatcher
+        @rtype: list[Rider]
+        """
+        waiting = []
+        for region in self._regions:
+            with region.lock:
+                waiting.extend(region.waiting.items())
+        return [rider for rider, _ in sorted(waiting, key=lambda item: item[1])]
+
+    def request_driver(self, rider):
+        """Return a driver for the rider, or None if no driver is available.
+
+        Add the rider to the waiting riders if there is no available driver.
+        The driver returned is no longer available to other riders.
+
+        @type self: StripedDispatcher
+        @type rider: Rider
+        @rtype: Driver | None
+
+        >>> dis = StripedDispatcher(20, 20, 5, 5)
+        >>> dis.request_rider(Driver("fire", Location(5,5), 5))
+        >>> dis.request_rider(Driver("inferno", Location(5,19), 5))
+        >>> kal = Rider("kal", Location(5,2), Location(3,2), 5, 3)
+        >>> bal = Rider("bal", Location(5,3), Location(3,2), 5, 3)
+        >>> print(dis.request_driver(kal).id)
+        fire
+        >>> print(dis.request_driver(bal).id)
+        inferno
+        >>> print(dis.request_driver(kal))
+        None
+        >>> print(dis.waiting_list[0].id)
+        kal
+
+        A driver that cannot reach the rider is never returned, nor is a
+        rider that the driver cannot reach:
+
+        >>> from location import set_distance_backend
+        >>> from roadgraph import LandmarkOracle, RoadGraph
+        >>> set_distance_backend(LandmarkOracle(RoadGraph(["..#..", "..#..",
+        ...                                                "..#.."])))
+        >>> dis = StripedDispatcher(3, 5, 2, 1)
+        >>> dis.request_rider(Driver("mud", Location(0,0), 1))
+        >>> print(dis.request_driver(Rider("cal", Location(0,4), kal.origin,
+        ...                                5, 1)))
+        None
+        >>> print(dis.request_rider(Driver("sun", Location(1,1), 1)))
+        None
+        >>> set_distance_backend(None)
+        """
+        def claim(found, radius, everywhere):
+            if self._is_nearest(found, radius, everywhere):
+                del found[2].idle[id(found[1])]
+                return found[1]
+            if everywhere:
+                self._wait(rider)
+            return None
+
+        return self._search(rider.origin, lambda regions: self._nearest_idle(
+            rider.origin, regions), claim)
+
+    def nearest_driver(self, location):
+        """Return the idle driver with the shortest travel time to
+        <location>, the first registered on ties, or None if no idle driver
+        can reach <location>. The driver stays idle.
+
+        @type self: StripedDispatcher
+        @type location: Location
+        @rtype: Driver | None
+
+        >>> dis = StripedDispatcher(20, 20, 5, 5)
+        >>> dis.request_rider(Driver("fire", Location(5,5), 5))
+        >>> dis.request_rider(Driver("ice", Location(5,1), 5))
+        >>> dis.nearest_driver(Location(5,2)).id
+        'ice'
+        >>> dis.request_driver(Rider("kal", Location(5,2), Location(3,2), 5,
+        ...                          3)).id
+        'ice'
+        """
+        def claim(found, radius, everywhere):
+            if self._is_nearest(found, radius, everywhere):
+                return found[1]
+            return None
+
+        return self._search(location, lambda regions: self._nearest_idle(
+            location, regions), claim)
+
+    def request_drivers(self, riders):
+        """Return a driver for every rider in <riders>, as request_driver
+        would for each rider in turn.
+
+        @type self: StripedDispatcher
+        @type riders: list[Rider]
+        @rtype: list[Driver | None]
+
+        >>> dis = StripedDispatcher(20, 20, 5, 5)
+        >>> dis.request_rider(Driver("fire", Location(5,5), 5))
+        >>> kal = Rider("kal", Location(5,2), Location(3,2), 5, 3)
+        >>> bal = Rider("bal", Location(5,3), Location(3,2), 5, 3)
+        >>> [driver and driver.id for driver in dis.request_drivers([kal, bal])]
+        ['fire', None]
+        >>> dis.waiting_list == [bal]
+        True
+        """
+        return [self.request_driver(rider) for rider in riders]
+
+    def request_rider(self, driver):
+        """Return a rider for the driver, or None if no rider is available.
+
+        If this is a new driver, register the driver for future rider
+        requests. If no rider is available, the driver is available to
+        future riders.
+
+        @type self: StripedDispatcher
+        @type driver: Driver
+        @rtype: Rider | None
+
+        >>> dis = StripedDispatcher(20, 20, 5, 5)
+        >>> kal = Rider("kal", Location(1,1), Location(3,2), 5, 3)
+        >>> bal = Rider("bal", Location(18,18), Location(3,2), 5, 3)
+        >>> dis.request_driver(kal)
+        >>> dis.request_driver(bal)
+        >>> print(dis.request_rider(Driver("fire", Location(19,19), 5)).id)
+        bal
+        >>> print(dis.request_rider(Driver("ice", Location(19,19), 5)).id)
+        kal
+        >>> print(dis.request_rider(Driver("ice", Location(19,19), 5)))
+        None
+        >>> len(dis.driver_list)
+        3
+        """
+        with self._registry_lock:
+            if id(driver) not in self._orders:
+                if driver.speed > self._max_speed:
+                    raise ValueError("driver is faster than the max speed")
+                self._orders[id(driver)] = self._registrations
+                self._registrations += 1
+                self.driver_list.append(driver)
+            order = self._orders[id(driver)]
+
+        def oldest(regions):
+            best = None
+            for region in regions:
+                for rider, request in region.waiting.items():
+                    if (driver.get_travel_time(rider.origin) != _NEVER and
+                            (best is None or request < best[0])):
+                        best = (request, rider, region)
+            return best
+
+        def claim(found, radius, everywhere):
+            if found is not None:
+                del found[2].waiting[found[1]]
+                return found[1]
+            if everywhere:
+                self._region_of(driver.location).idle[id(driver)] = (order,
+                                                                     driver)
+            return None
+
+        return self._search(driver.location, oldest, claim)
+
+    def cancel_ride(self, rider):
+        """Cancel the ride for rider.
+
+        @type self: StripedDispatcher
+        @type rider: Rider
+        @rtype: None
+
+        >>> dis = StripedDispatcher(20, 20, 5, 5)
+        >>> kal = Rider("kal", Location(5,2), Location(3,2), 5, 3)
+        >>> dis.request_driver(kal)
+        >>> dis.cancel_ride(kal)
+        >>> print(kal.status, dis.waiting_list)
+        cancelled []
+        """
+        region = self._region_of(rider.origin)
+        with region.lock:
+            region.waiting.pop(rider, None)
+            rider.cancel()
+
+    def unregister(self, driver):
+        """Unregister <driver>, which is no longer used to fulfill rider
+        requests until it requests a rider again.
+
+        Precondition: <driver> is registered and is not waiting for a rider.
+
+        @type self: StripedDispatcher
+        @type driver: Driver
+        @rtype: None
+
+        >>> dis = StripedDispatcher(20, 20, 5, 5)
+        >>> fire = Driver("fire", Location(5,5), 5)
+        >>> dis.request_driver(Rider("kal", Location(5,2), Location(3,2), 5, 3))
+        >>> _ = dis.request_rider(fire)
+        >>> dis.unregister(fire)
+        >>> dis.driver_list
+        []
+        """
+        with self._registry_lock:
+            del self._orders[id(driver)]
+            self.driver_list.remove(driver)
+
+    def rebalance(self, timestamp, max_moves=None):
+        """Return a plan to move idle drivers towards the demand at
+        <timestamp>. A StripedDispatcher has no demand heatmap, so the plan
+        is always empty.
+
+        @type self: StripedDispatcher
+        @type timestamp: int
+        @type max_moves: int | None
+        @rtype: list[(Driver, Location)]
+
+        >>> StripedDispatcher(20, 20, 5, 5).rebalance(0)
+        []
+        """
+        return []
+
+    def __getstate__(self):
+        """Return the state of this StripedDispatcher to pickle, without its
+        lock, and with the registration orders in the order of the
+        registered drivers, since unpickled drivers do not share their id().
+
+        @type self: StripedDispatcher
+        @rtype: dict
+
+        >>> import pickle
+        >>> dis = StripedDispatcher(20, 20, 5, 5)
+        >>> dis.request_rider(Driver("fire", Location(5,5), 5))
+        >>> dis.request_rider(Driver("ice", Location(15,15), 5))
+        >>> copy = pickle.loads(pickle.dumps(dis))
+        >>> copy.request_driver(Rider("kal", Location(14,14), Location(3,2),
+        ...                           5, 3)).id
+        'ice'
+        >>> copy.request_rider(copy.driver_list[1])
+        >>> copy.request_driver(Rider("bal", Location(9,9), Location(3,2),
+        ...                           5, 3)).id
+        'fire'
+        >>> len(copy.driver_list)
+        2
+        """
+        state = self.__dict__.copy()
+        del state["_registry_lock"]
+        state["_orders"] = [self._orders[id(driver)]
+                            for driver in self.driver_list]
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state of an unpickled StripedDispatcher.
+
+        @type self: StripedDispatcher
+        @type state: dict
+        @rtype: None
+        """
+        self.__dict__.update(state)
+        self._registry_lock = threading.Lock()
+        self._orders = {id(driver): order for driver, order
+                        in zip(self.driver_list, state["_orders"])}
+
+    def _search(self, location, find, claim):
+        """Search growing squares of regions around <location>.
+
+        For every square, the locks of its regions are taken in order, and
+        <claim> is called with the result of <find> on its regions, the
+        radius of the square, and whether the square covers every region.
+        The search stops at the first result of <claim> that is not None, or
+        once every region has been covered.
+
+        @type self: StripedDispatcher
+        @type location: Location
+        @type find: (list[_Region]) -> object
+        @type claim: (object, int, bool) -> object
+        @rtype: object
+        """
+        row, column = self._coordinates(location)
+        radius = 0
+        while True:
+            regions = [self._regions[r * self._columns + c]
+                       for r in range(max(row - radius, 0),
+                                      min(row + radius + 1, self._rows))
+                       for c in range(max(column - radius, 0),
+                                      min(column + radius + 1, self._columns))]
+            everywhere = len(regions) == len(self._regions)
+            for region in regions:
+                region.lock.acquire()
+            try:
+                result = claim(find(regions), radius, everywhere)
+            finally:
+                for region in regions:
+                    region.lock.release()
+            if result is not None or everywhere:
+                return result
+            radius = 2 * radius + 1
+
+    def _nearest_idle(self, location, regions):
+        """Return the key, driver and region of the idle driver of <regions>
+        with the shortest travel time to <location>, the first registered on
+        ties, or None if none of them can reach <location>. The key is the
+        travel time and the registration order of the driver.
+
+        Precondition: the locks of <regions> are held.
+
+        @type self: StripedDispatcher
+        @type location: Location
+        @type regions: list[_Region]
+        @rtype: ((float, int), Driver, _Region) | None
+        """
+        best = None
+        for region in regions:
+            for order, driver in region.idle.values():
+                key = (driver.get_travel_time(location), order)
+                if key[0] != _NEVER and (best is None or key < best[0]):
+                    best = (key, driver, region)
+        return best
+
+    def _is_nearest(self, found, radius, everywhere):
+        """Return whether the driver <found> by _nearest_idle in a square of
+        regions of <radius> is the nearest driver of all, given whether the
+        square covers every region.
+
+        @type self: StripedDispatcher
+        @type found: ((float, int), Driver, _Region) | None
+        @type radius: int
+        @type everywhere: bool
+        @rtype: bool
+        """
+        # No driver outside the radius can be closer than the nearest driver
+        # found inside it.
+        return found is not None and (everywhere or found[0][0] <=
+                                      self._lower_bound(radius + 1))
+
+    def _lower_bound(self, radius):
+        """Return a lower bound on the travel time to any location at least
+        <radius> regions away.
+
+        @type self: StripedDispatcher
+        @type radius: int
+        @rtype: float
+        """
+        return ((radius - 1) * self._size + 1) / self._max_speed
+
+    def _wait(self, rider):
+        """Add <rider> to the waiting riders.
+
+        Precondition: the locks of every region are held.
+
+        @type self: StripedDispatcher
+        @type rider: Rider
+        @rtype: None
+        """
+        self._region_of(rider.origin).waiting[rider] = self._requests
+        self._requests += 1
+
+    def _coordinates(self, location):
+        """Return the row and column of the region of <location>.
+
+        @type self: StripedDispatcher
+        @type location: Location
+        @rtype: (int, int)
+        """
+        return (min(max(location.row // self._size, 0), self._rows - 1),
+                min(max(location.column // self._size, 0), self._columns - 1))
+
+    def _region_of(self, location):
+        """Return the region of <location>.
+
+        @type self: StripedDispatcher
+        @type location: Location
+        @rtype: _Region
+        """
+        row, column = self._coordinates(location)
+        return self._regions[row * self._columns + column]
@@ -1,4 +1,4 @@
-from location import Location, manhattan_distance
+from location import Location, travel_distance
 from rider import Rider
 
 
@@ -14,6 +14,9 @@ class Driver:
         A property that is True if the driver is idle and False otherwise.
     @type destination: str
         A location the driver must drive towards, which may not exist
+    @type leg_distance: int | float
+        The distance to the destination from where the driver started
+        driving towards it, or 0 if the driver is idle.
     """
 
     def __init__(self, identifier, origin, speed):
@@ -31,6 +34,7 @@ class Driver:
         self.destination = None
         self.is_idle = True
         self.rider = False
+        self.leg_distance = 0
 
     def __str__(self):
         """Return a string representation of the driver.
@@ -88,7 +92,7 @@ class Driver:
         6
         """
         # TODO
-        travel_time = (manhattan_distance(self.location, destination) /
+        travel_time = (travel_distance(self.location, destination) /
                        self.speed)
         return travel_time
 
@@ -110,8 +114,9 @@ class Driver:
         # TODO
         self.destination = location
         self.is_idle = False
+        self.leg_distance = travel_distance(self.location, location)
 
-        return self.get_travel_time(self.destination)
+        return self.leg_distance / self.speed
 
     def end_drive(self):
         """End the drive and arrive at the destination.
@@ -134,6 +139,7 @@ class Driver:
         self.location = self.destination
         self.destination = None
         self.is_idle = True
+        self.leg_distance = 0
 
     def start_ride(self, rider):
         """Start a ride and return the time the ride will take.
@@ -155,11 +161,13 @@ class Driver:
         identifier:fire, location:(30,2), speed:5 idle status:False destination:(30,32)
         """
         # TODO
-        ride_time = (manhattan_distance(rider.origin, rider.destination) /
-                     self.speed)
+        distance = rider.ride_distance()
+        ride_time = distance / self.speed
+        self.leg_distance = distance
         self.destination = rider.destination
         self.is_idle = False
         self.rider = rider
+        rider.picked_up = True
         return ride_time
 
     def end_ride(self):
@@ -191,3 +199,4 @@ class Driver:
         self.is_idle = True
         self.destination = None
         self.rider = False
+        self.leg_distance = 0
@@ -0,0 +1,441 @@
+"""Equivalence Harness
+
+This module checks that the engines and modes of the simulation give the
+same results as the reference engine: a Simulation that does one event at a
+time, with the PriorityQueue, the linear search of the Dispatcher for the
+nearest driver, and a Monitor that keeps every activity.
+
+Every engine is run on many small random traces, made to hit the corner
+cases: many events share a timestamp, drivers request riders after riders
+have been waiting, and riders run out of patience as drivers arrive. For
+every trace, an engine must notify its monitor of the same activities as the
+reference, in the same order, must record them at the same times and
+locations for every rider and driver, and must return the same report and
+fleet report. An engine with another rider policy is checked against the
+reference with the same policy. A PartitionedSimulation merges the monitors
+of its regions, which do not keep the order of all activities and add up the
+fleet report in another order, so only the activities of every rider and
+driver are compared, and the fleet report up to rounding.
+
+A PooledSimulation is not checked, not even with a capacity of 1: it only
+assigns a rider to a driver that can pick them up before their patience runs
+out, and its drivers queue up riders to pick up after their current ride, so
+it is not meant to give the same results as a Simulation.
+
+A trace on which an engine differs is shrunk to a minimal trace on which it
+still differs, by delta debugging over the lines of the trace, so that the
+difference can be reproduced from a handful of events.
+
+Run this module to check every engine in ENGINES:
+
+    python equivalence.py [number of traces] [seed]
+"""
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import weakref
+
+from activitylog import ActivityLog
+from array_engine import ArraySimulation
+from dispatcher import (LONGEST_WAITING, NEAREST, TRADE_OFF,
+                        StripedDispatcher)
+from event import create_lazy_event_list, parse_event_lines
+from monitor import Monitor, RIDER, DRIVER
+from partition import PartitionedSimulation
+from simulation import Simulation
+
+
+class _RecordingMonitor(Monitor):
+    """A monitor that also records every activity it is notified of, in
+    the order it is notified of them.
+
+    === Attributes ===
+    @type sequence: list[(float, str, str, str)]
+        The time, category, identifier and description of every activity,
+        in the order the monitor was notified of them.
+    """
+
+    def __init__(self, log=None):
+        """Initialize a _RecordingMonitor.
+
+        @type self: _RecordingMonitor
+        @type log: ActivityLog | None
+        @rtype: None
+        """
+        Monitor.__init__(self, log=log)
+        self.sequence = []
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """Notify the monitor of the activity, and record it.
+
+        @type self: _RecordingMonitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+        """
+        self.sequence.append((timestamp, category, identifier, description))
+        Monitor.notify(self, timestamp, category, description, identifier,
+                       location)
+
+
+class _RecordingSimulation(Simulation):
+    """A Simulation whose monitor records the order of activities, even
+    after a rerun starts it over."""
+
+    def __init__(self, *args, **config):
+        """Initialize a _RecordingSimulation with the arguments of
+        Simulation.
+
+        @type self: _RecordingSimulation
+        @rtype: None
+        """
+        Simulation.__init__(self, *args, **config)
+        _recording(self, self._monitor._log)
+
+
+def _recording(simulation, log=None):
+    """Give <simulation> a monitor that records the order of activities,
+    spilling them to <log> if it is not None, and return the simulation.
+
+    Precondition: <simulation> has not been run yet.
+
+    @type simulation: Simulation | ArraySimulation
+    @type log: ActivityLog | None
+    @rtype: Simulation | ArraySimulation
+    """
+    simulation._monitor = _RecordingMonitor(log)
+    return simulation
+
+
+def reference(lines, rider_policy=LONGEST_WAITING):
+    """Run the reference engine with <rider_policy> on the trace <lines>,
+    and return its report and its monitor.
+
+    @type lines: list[str]
+    @type rider_policy: str
+    @rtype: (dict[str, object], Monitor)
+    """
+    simulation = _RecordingSimulation(rider_policy=rider_policy)
+    # Running until before the first event schedules the events without
+    # doing any, and stepping then does them one at a time.
+    simulation.run(parse_event_lines(lines), -1)
+    while simulation.step(1024):
+        pass
+    return simulation.report(), simulation._monitor
+
+
+def _simulation(**config):
+    """Return an engine that runs a Simulation with the keyword arguments
+    <config>, and that is checked against the reference with the same rider
+    policy.
+
+    @rtype: (list[str]) -> (dict[str, object], Monitor)
+    """
+    def engine(lines):
+        simulation = _RecordingSimulation(**config)
+        return simulation.run(parse_event_lines(lines)), simulation._monitor
+    engine.rider_policy = config.get("rider_policy", LONGEST_WAITING)
+    return engine
+
+
+def _array(lines):
+    """Run an ArraySimulation on the trace <lines>.
+
+    @type lines: list[str]
+    @rtype: (dict[str, object], Monitor)
+    """
+    simulation = _recording(ArraySimulation())
+    return simulation.run(parse_event_lines(lines)), simulation._monitor
+
+
+def _striped(lines):
+    """Run a Simulation with a StripedDispatcher on the trace <lines>.
+
+    The dispatcher has a single region, which covers the grid of every
+    random trace: with more regions, a driver is assigned a rider of the
+    nearest regions instead of the longest waiting one.
+
+    @type lines: list[str]
+    @rtype: (dict[str, object], Monitor)
+    """
+    simulation = _RecordingSimulation()
+    simulation._dispatcher = StripedDispatcher(8, 8, 8, 3)
+    return simulation.run(parse_event_lines(lines)), simulation._monitor
+
+
+def _partitioned(lines):
+    """Run a PartitionedSimulation with three regions on the trace <lines>.
+
+    Its monitor is merged from the monitors of its regions, so it does not
+    record the order of all activities.
+
+    @type lines: list[str]
+    @rtype: (dict[str, object], Monitor)
+    """
+    simulation = PartitionedSimulation(3)
+    return simulation.run(parse_event_lines(lines)), simulation._monitor
+
+
+def _restored(lines):
+    """Run a Simulation on the trace <lines> halfway, restore a snapshot of
+    it, and run the restored simulation to the end.
+
+    @type lines: list[str]
+    @rtype: (dict[str, object], Monitor)
+    """
+    events = parse_event_lines(lines)
+    simulation = _RecordingSimulation()
+    middle = max([event.timestamp for event in events], default=0) // 2
+    simulation.run(events, middle)
+    simulation = _RecordingSimulation.restore(simulation.snapshot())
+    return simulation.resume(), simulation._monitor
+
+
+def _lazy(lines):
+    """Run a Simulation on the trace <lines>, read in lazily from a file.
+
+    @type lines: list[str]
+    @rtype: (dict[str, object], Monitor)
+    """
+    descriptor, filename = tempfile.mkstemp(suffix=".txt")
+    try:
+        with os.fdopen(descriptor, "w") as file:
+            file.write("".join(line + "\n" for line in lines))
+        simulation = _RecordingSimulation()
+        report = simulation.run(create_lazy_event_list(filename))
+    finally:
+        os.remove(filename)
+    return report, simulation._monitor
+
+
+def _logged(lines):
+    """Run a Simulation on the trace <lines> that spills its activities to
+    an activity log in a temporary directory, which is removed once its
+    monitor is.
+
+    @type lines: list[str]
+    @rtype: (dict[str, object], Monitor)
+    """
+    directory = tempfile.mkdtemp()
+    simulation = _RecordingSimulation(activity_log=ActivityLog(directory, 16))
+    weakref.finalize(simulation._monitor, shutil.rmtree, directory, True)
+    return simulation.run(parse_event_lines(lines)), simulation._monitor
+
+
+def _rerun(lines):
+    """Run a Simulation that records snapshots on the trace <lines> without
+    its last line, and then rerun it on the whole trace, so that the last
+    line is added at a timestamp that may already be in the trace.
+
+    @type lines: list[str]
+    @rtype: (dict[str, object], Monitor)
+    """
+    simulation = _RecordingSimulation(snapshot_interval=1)
+    simulation.run(parse_event_lines(lines[:-1]))
+    return simulation.rerun(parse_event_lines(lines)), simulation._monitor
+
+
+# The engines checked against the reference, by name.
+ENGINES = {
+    "batched": _simulation(),
+    "timeouts": _simulation(patience_timeouts=True),
+    "recycled": _simulation(recycle=True),
+    "snapshots": _simulation(snapshot_interval=3),
+    "restored": _restored,
+    "lazy": _lazy,
+    "array": _array,
+    "activity_log": _logged,
+    "rerun": _rerun,
+    "approximate": _simulation(approximation=1),
+    "nearest": _simulation(rider_policy=NEAREST),
+    "trade_off": _simulation(rider_policy=TRADE_OFF),
+    "striped": _striped,
+    "partitioned": _partitioned,
+}
+
+
+def random_lines(generator):
+    """Return the lines of a small random trace, ordered by timestamp.
+
+    @type generator: random.Random
+    @rtype: list[str]
+
+    >>> lines = random_lines(random.Random(0))
+    >>> len(parse_event_lines(lines)) == len(lines)
+    True
+    """
+    size = generator.randint(1, 8)
+    duration = generator.randint(0, 20)
+
+    def location():
+        return "{},{}".format(generator.randrange(size),
+                              generator.randrange(size))
+
+    events = []
+    for number in range(generator.randint(1, 6)):
+        # Most drivers start at once, and some join later.
+        timestamp = 0 if generator.random() < 0.6 else generator.randint(
+            0, duration)
+        events.append((timestamp, "DriverRequest D{} {} {}".format(
+            number, location(), generator.randint(1, 3))))
+    for number in range(generator.randint(0, 20)):
+        events.append((generator.randint(0, duration),
+                       "RiderRequest R{} {} {} {}".format(
+                           number, location(), location(),
+                           generator.randint(0, 8))))
+    events.sort(key=lambda event: event[0])
+    return ["{} {}".format(timestamp, line) for timestamp, line in events]
+
+
+def signature(monitor):
+    """Return the activities recorded by <monitor>, in order for every rider
+    and driver, with their times and locations, whether it keeps them in
+    memory or spills them to an activity log.
+
+    @type monitor: Monitor
+    @rtype: dict[(str, str), list[(float, str, str)]]
+    """
+    if monitor._log is None:
+        recorded = ((category, activity)
+                    for category in (RIDER, DRIVER)
+                    for activities in monitor._activities[category].values()
+                    for activity in activities)
+    else:
+        recorded = monitor._log.scan()
+    activities = {}
+    for category, activity in recorded:
+        activities.setdefault((category, activity.id), []).append(
+            (activity.time, activity.description, str(activity.location)))
+    return activities
+
+
+def difference(lines, engine):
+    """Return how <engine> differs from the reference on the trace <lines>,
+    or None if it does not.
+
+    @type lines: list[str]
+    @type engine: (list[str]) -> (dict[str, object], Monitor)
+    @rtype: str | None
+
+    >>> print(difference(["0 DriverRequest D0 1,1 1"], _array))
+    None
+    >>> print(difference(["0 DriverRequest D0 1,1 1"],
+    ...                  lambda lines: ({}, None)))
+    report: {'rider_wait_time': 0, 'driver_total_distance': 0.0, 'driver_ride_distance': 0.0} != {}
+    """
+    expected, expected_monitor = reference(
+        lines, getattr(engine, "rider_policy", LONGEST_WAITING))
+    try:
+        report, monitor = engine(lines)
+    except Exception as error:
+        return "raised {!r}".format(error)
+    if report != expected:
+        return "report: {} != {}".format(expected, report)
+    # A monitor that an engine merges from several of its own only keeps the
+    # order of the activities of every rider and driver, and adds up the
+    # distances and times of the fleet in another order.
+    merged = not hasattr(monitor, "sequence")
+    sequence = expected_monitor.sequence if merged else monitor.sequence
+    for position, (expected_activity, activity) in enumerate(
+            zip(expected_monitor.sequence, sequence)):
+        if activity != expected_activity:
+            return "activity {}: {} != {}".format(position, expected_activity,
+                                                  activity)
+    if len(sequence) != len(expected_monitor.sequence):
+        return "activities: {} != {}".format(len(expected_monitor.sequence),
+                                             len(sequence))
+    expected_order, order = signature(expected_monitor), signature(monitor)
+    for key in sorted(set(expected_order) | set(order)):
+        if expected_order.get(key) != order.get(key):
+            return "activities of {} {}: {} != {}".format(
+                key[0], key[1], expected_order.get(key), order.get(key))
+    fleet = monitor.fleet_report()
+    expected_fleet = expected_monitor.fleet_report()
+    if fleet != expected_fleet and not (merged and all(
+            math.isclose(fleet[key], expected_fleet[key], abs_tol=1e-9)
+            for key in expected_fleet)):
+        return "fleet report: {} != {}".format(expected_fleet, fleet)
+    return None
+
+
+def shrink(lines, fails):
+    """Return a minimal subsequence of the trace <lines> on which <fails> is
+    still True: removing any one line of it makes <fails> False.
+
+    Precondition: fails(lines) is True.
+
+    @type lines: list[str]
+    @type fails: (list[str]) -> bool
+    @rtype: list[str]
+
+    >>> shrink(list("abcdefgh"), lambda lines: "c" in lines and "f" in lines)
+    ['c', 'f']
+    """
+    parts = 2
+    while len(lines) >= 2:
+        size = -(-len(lines) // parts)
+        chunks = [lines[start:start + size]
+                  for start in range(0, len(lines), size)]
+        for chunk in chunks:
+            if fails(chunk):
+                lines, parts = chunk, 2
+                break
+        else:
+            for position in range(len(chunks)):
+                complement = [line for index, chunk in enumerate(chunks)
+                              if index != position for line in chunk]
+                if fails(complement):
+                    lines, parts = complement, max(parts - 1, 2)
+                    break
+            else:
+                if parts >= len(lines):
+                    break
+                parts = min(2 * parts, len(lines))
+    return lines
+
+
+def check(engines=None, count=1000, seed=0):
+    """Check every engine of <engines>, or of ENGINES if it is None, against
+    the reference on <count> random traces made from <seed>.
+
+    Return the name of the first engine that differs, the minimal trace on
+    which it differs and how, or None if no engine differs.
+
+    @type engines: dict[str, (list[str]) -> (dict[str, object], Monitor)]
+    @type count: int
+    @type seed: int
+    @rtype: (str, list[str], str) | None
+
+    >>> check(count=20) is None
+    True
+    """
+    if engines is None:
+        engines = ENGINES
+    generator = random.Random(seed)
+    for _ in range(count):
+        lines = random_lines(generator)
+        for name, engine in engines.items():
+            if difference(lines, engine) is not None:
+                lines = shrink(lines, lambda trace: difference(
+                    trace, engine) is not None)
+                return name, lines, difference(lines, engine)
+    return None
+
+
+if __name__ == "__main__":
+    failure = check(count=int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+                    seed=int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    if failure is None:
+        print("every engine is equivalent to the reference")
+    else:
+        name, lines, how = failure
+        print("{} differs from the reference on:".format(name))
+        print("\n".join(lines))
+        print(how)
+        sys.exit(1)
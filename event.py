@@ -3,8 +3,12 @@
 This file should contain all of the classes necessary to model the different
 kinds of events in the simulation.
 """
+import mmap
+import threading
+from array import array
+
 from driver import Driver
-from location import deserialize_location
+from location import deserialize_location, distance_backend, trip_distances
 from monitor import RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
 from rider import Rider, WAITING, CANCELLED, SATISFIED
 from container import PriorityQueue
@@ -12,6 +16,139 @@ from location import Location
 from dispatcher import Dispatcher
 from monitor import Monitor
 
+# The most events of a single class kept for reuse.
+MAX_RELEASED = 1024
+
+
+class EventPool:
+    """The events that a simulation has released for reuse, by class.
+
+    While a pool is used by a thread, with recycle_events, the events
+    spawned in that thread are taken from the pool, and do() returns the
+    same list every time, which only holds the events spawned until do() is
+    called again.
+    """
+
+    # === Private Attributes ===
+    # @type _released: dict[type, list[Event]]
+    #     The events released for reuse, by class.
+    # @type _results: list[Event]
+    #     The list that do() returns while the pool is used.
+
+    def __init__(self):
+        """Initialize an empty EventPool.
+
+        @type self: EventPool
+        @rtype: None
+        """
+        self._released = {}
+        self._results = []
+
+    def obtain(self, cls, timestamp, *args):
+        """Return an event of class <cls> with <timestamp> and the other
+        arguments <args> of the initializer, reusing a released event if
+        there is one.
+
+        @type self: EventPool
+        @type cls: type
+        @type timestamp: int
+        @rtype: Event
+        """
+        released = self._released.get(cls)
+        if released:
+            event = released.pop()
+            event.__init__(timestamp, *args)
+            return event
+        return cls(timestamp, *args)
+
+    def release(self, event):
+        """Release <event>, which has been done, for reuse, if it was
+        spawned by another event. An event that was given to a simulation
+        belongs to its caller, and is never reused.
+
+        Precondition: nothing refers to <event> any more, other than
+        references that are no longer used, such as the Cancellation of a
+        rider that has cancelled.
+
+        @type self: EventPool
+        @type event: Event
+        @rtype: None
+
+        >>> pool = EventPool()
+        >>> kal = Rider("kal", Location(5, 2), Location(3, 2), 5, 3)
+        >>> previous = recycle_events(pool)
+        >>> cancellation = Cancellation.obtain(8, kal)
+        >>> pool.release(cancellation)
+        >>> Cancellation.obtain(9, kal) is cancellation
+        True
+        >>> given = Cancellation(10, kal)
+        >>> pool.release(given)
+        >>> Cancellation.obtain(11, kal) is given
+        False
+        >>> recycle_events(previous) is pool
+        True
+        """
+        if not event.spawned:
+            return
+        released = self._released.setdefault(type(event), [])
+        if len(released) < MAX_RELEASED:
+            released.append(event)
+
+
+class _Recycling(threading.local):
+    """The recycling of events of a thread.
+
+    === Attributes ===
+    @type pool: EventPool | None
+        The pool that the events spawned in the thread are taken from, or
+        None if they are not recycled.
+    """
+
+    pool = None
+
+
+# The recycling of events of every thread.
+_recycling = _Recycling()
+
+
+def recycle_events(pool):
+    """Recycle the events spawned in the current thread through <pool>, or
+    stop recycling them if <pool> is None. Return the pool used before, or
+    None.
+
+    Every thread recycles through its own pool, if any, so that simulations
+    that run in different threads never share events.
+
+    @type pool: EventPool | None
+    @rtype: EventPool | None
+
+    >>> pool = EventPool()
+    >>> previous = recycle_events(pool)
+    >>> dis, mon = Dispatcher(), Monitor()
+    >>> driver = Driver("fire", Location(5,5), 5)
+    >>> first = DriverRequest(0, driver).do(dis, mon)
+    >>> first is DriverRequest(1, driver).do(dis, mon)
+    True
+    >>> recycle_events(previous) is pool
+    True
+    """
+    previous = _recycling.pool
+    _recycling.pool = pool
+    return previous
+
+
+def _new_results():
+    """Return an empty list for the events spawned by do().
+
+    @rtype: list[Event]
+    """
+    pool = _recycling.pool
+    if pool is None:
+        return []
+    results = pool._results
+    results.clear()
+    return results
+
 
 class Event:
     """An event.
@@ -31,8 +168,22 @@ class Event:
     === Attributes ===
     @type timestamp: int
         A timestamp for this event.
+    @type sequence: int
+        The order in which the event was scheduled among events with the
+        same timestamp. It is only kept up to date by simulations that keep
+        some events outside of their event queue.
+    @type handle: Handle | asyncio.TimerHandle | None
+        The handle with which the event can be cancelled while it is
+        scheduled, if the simulation that scheduled it keeps one.
+    @type spawned: bool
+        True iff the event was spawned by another event, or by a
+        simulation, with obtain().
     """
 
+    # Subclasses that do not declare __slots__ still get a __dict__, but a
+    # LazyRequest, of which there is one for every line of a trace, does not.
+    __slots__ = ("timestamp", "sequence", "handle", "spawned")
+
     def __init__(self, timestamp):
         """Initialize an Event with a given timestamp.
 
@@ -46,6 +197,50 @@ class Event:
         7
         """
         self.timestamp = timestamp
+        self.sequence = 0
+        self.handle = None
+        self.spawned = False
+
+    def cancel(self):
+        """Cancel this event, so that it is not done, if it is still
+        scheduled and can be cancelled.
+
+        @type self: Event
+        @rtype: None
+
+        >>> events = PriorityQueue()
+        >>> kal = Rider("kal", Location(5, 2), Location(3, 2), 5, 3)
+        >>> cancellation = Cancellation(8, kal)
+        >>> cancellation.handle = events.add(cancellation)
+        >>> cancellation.cancel()
+        >>> events.is_empty()
+        True
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+
+    @classmethod
+    def obtain(cls, timestamp, *args):
+        """Return a spawned event of this class with <timestamp> and the
+        other arguments <args> of the initializer, reusing an event released
+        to the pool of the current thread if events are recycled.
+
+        @type cls: type
+        @type timestamp: int
+        @rtype: Event
+
+        >>> kal = Rider("kal", Location(5, 2), Location(3, 2), 5, 3)
+        >>> cancellation = Cancellation.obtain(8, kal)
+        >>> cancellation.spawned, Cancellation(8, kal).spawned
+        (True, False)
+        """
+        pool = _recycling.pool
+        if pool is None:
+            event = cls(timestamp, *args)
+        else:
+            event = pool.obtain(cls, timestamp, *args)
+        event.spawned = True
+        return event
 
     # The following six 'magic methods' are overridden to allow for easy
     # comparison of Event instances. All comparisons simply perform the
@@ -204,9 +399,9 @@ class RiderRequest(Event):
         >>> rider1 = RiderRequest(7, Rider("kal",Location(5,4),Location(2,3),2,5))
         >>> rider2 = RiderRequest(2, Rider("bal",Location(5,4),Location(2,3),2,5))
         >>> rider3 = RiderRequest(5, Rider("cal",Location(5,4),Location(2,3),2,5))
-        >>> events.add(rider1)
-        >>> events.add(rider2)
-        >>> events.add(rider3)
+        >>> _ = events.add(rider1)
+        >>> _ = events.add(rider2)
+        >>> _ = events.add(rider3)
         >>> for x in events._items: print(x)
         2 -- unique_identifier: bal , origin: (5,4), destination: (2,3), patience: 2, status: waiting, timestamp: 5: Request a driver
         5 -- unique_identifier: cal , origin: (5,4), destination: (2,3), patience: 2, status: waiting, timestamp: 5: Request a driver
@@ -233,19 +428,67 @@ class RiderRequest(Event):
         >>> rider1 = RiderRequest(7, Rider("kal",Location(5,4),Location(2,3),2,5))
         >>> rider2 = RiderRequest(2, Rider("bal",Location(5,4),Location(2,3),2,5))
         >>> rider3 = RiderRequest(5, Rider("cal",Location(5,4),Location(2,3),2,5))
-        >>> events.add(rider1)
-        >>> events.add(rider2)
-        >>> events.add(rider3)
+        >>> _ = events.add(rider1)
+        >>> _ = events.add(rider2)
+        >>> _ = events.add(rider3)
         """
         monitor.notify(self.timestamp, RIDER, REQUEST,
                        self.rider.id, self.rider.origin)
 
-        events = []
+        events = _new_results()
         driver = dispatcher.request_driver(self.rider)
         if driver is not None:
             travel_time = driver.start_drive(self.rider.origin)
-            events.append(Pickup(self.timestamp + travel_time, self.rider, driver))
-        events.append(Cancellation(self.timestamp + self.rider.patience, self.rider))
+            monitor.notify_leg(self.timestamp, driver.id, driver.leg_distance,
+                               travel_time, False)
+            events.append(Pickup.obtain(self.timestamp + travel_time, driver,
+                                        self.rider))
+        # The rider keeps their Cancellation, so that it can be cancelled
+        # once they are picked up.
+        self.rider.cancellation = Cancellation.obtain(
+            self.timestamp + self.rider.patience, self.rider)
+        events.append(self.rider.cancellation)
+        return events
+
+    @staticmethod
+    def do_all(requests, dispatcher, monitor):
+        """Do the RiderRequest events <requests> in order, with a single pass
+        of the dispatcher over its drivers.
+
+        Return the events spawned, in the order in which doing the requests
+        one at a time would spawn them.
+
+        @type requests: list[RiderRequest]
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: list[Event]
+
+        >>> dis = Dispatcher()
+        >>> dis.request_rider(Driver("fire", Location(5,5), 5))
+        >>> events = RiderRequest.do_all([
+        ...     RiderRequest(3, Rider("kal", Location(5,2), Location(3,2), 5, 3)),
+        ...     RiderRequest(3, Rider("bal", Location(5,3), Location(3,2), 5, 3))],
+        ...     dis, Monitor())
+        >>> [type(event).__name__ for event in events]
+        ['Pickup', 'Cancellation', 'Cancellation']
+        """
+        riders = [request.rider for request in requests]
+        for request in requests:
+            monitor.notify(request.timestamp, RIDER, REQUEST,
+                           request.rider.id, request.rider.origin)
+
+        events = []
+        drivers = dispatcher.request_drivers(riders)
+        for request, rider, driver in zip(requests, riders, drivers):
+            if driver is not None:
+                travel_time = driver.start_drive(rider.origin)
+                monitor.notify_leg(request.timestamp, driver.id,
+                                   driver.leg_distance, travel_time, False)
+                events.append(Pickup.obtain(request.timestamp + travel_time,
+                                            driver, rider))
+            rider.cancellation = Cancellation.obtain(
+                request.timestamp + rider.patience, rider)
+            events.append(rider.cancellation)
         return events
 
     def __str__(self):
@@ -317,15 +560,18 @@ class DriverRequest(Event):
                        self.driver.id, self.driver.location)
 
         # Request a rider from the dispatcher.
-        events = []
+        events = _new_results()
         rider = dispatcher.request_rider(self.driver)
         # If there is one available, the driver starts driving towards the
         # rider, and the method returns a Pickup event for when the driver
         # arrives at the riders location.
         if rider is not None:
             travel_time = self.driver.start_drive(rider.origin)
+            monitor.notify_leg(self.timestamp, self.driver.id,
+                               self.driver.leg_distance, travel_time, False)
             #REMEMBER TO CHECK THE OREDER OF THE PICKUP CALL AND WHETHER IT AFFECTS ANYTHING
-            events.append(Pickup(self.timestamp + travel_time,self.driver,rider))
+            events.append(Pickup.obtain(self.timestamp + travel_time,
+                                        self.driver, rider))
         return events
 
     def __str__(self):
@@ -362,17 +608,13 @@ class Cancellation(Event):
         @type monitor: Monitor
         @rtype: list[Events]
         """
-        # Notify the monitor about the request.
-
-
-        if self.rider.status is not SATISFIED:
-            self.rider.cancel()
+        # A rider who has already been picked up keeps their ride.
+        if self.rider.status == WAITING and not self.rider.picked_up:
+            dispatcher.cancel_ride(self.rider)
             # Notify the monitor about the request.
             monitor.notify(self.timestamp, RIDER, CANCEL,
-                       self.rider.id, self.rider.origin)
-        event = []
-
-        return event
+                           self.rider.id, self.rider.origin)
+        return _new_results()
 
     def __str__(self):
         """Return String Representation of this event
@@ -420,12 +662,19 @@ class Pickup(Event):
         @rtype: list[Event]
         """
 
-        event=[]
-        self.driver.start_drive(self.rider.origin)
+        event = _new_results()
+        # The driver has been driving towards the rider since the request.
         self.driver.end_drive()
-        if self.rider.status is WAITING:
-            self.driver.start_ride(self.rider)
-            event.append(Dropoff(self.timestamp, self.driver, self.rider))
+        if self.rider.status == WAITING:
+            # The rider can no longer cancel.
+            if self.rider.cancellation is not None:
+                self.rider.cancellation.cancel()
+                self.rider.cancellation = None
+            ride_time = self.driver.start_ride(self.rider)
+            monitor.notify_leg(self.timestamp, self.driver.id,
+                               self.driver.leg_distance, ride_time, True)
+            event.append(Dropoff.obtain(self.timestamp + ride_time,
+                                        self.driver, self.rider))
             # Notify the monitor about the successful pickup request
             monitor.notify(self.timestamp, RIDER, PICKUP,
                        self.rider.id, self.rider.origin)
@@ -433,8 +682,8 @@ class Pickup(Event):
             monitor.notify(self.timestamp, DRIVER, PICKUP,
                        self.driver.id, self.driver.location
                            )
-        elif self.rider.status is CANCELLED:
-            event.append(DriverRequest(self.timestamp, self.driver))
+        elif self.rider.status == CANCELLED:
+            event.append(DriverRequest.obtain(self.timestamp, self.driver))
         return event
 
     def __str__(self):
@@ -482,11 +731,11 @@ class Dropoff(Event):
         @return:
         @rtype:
         """
-        event = []
+        event = _new_results()
         self.driver.end_ride()
         self.rider.satisfied()
 
-        event.append(DriverRequest(self.timestamp, self.driver))
+        event.append(DriverRequest.obtain(self.timestamp, self.driver))
         # Notify the monitor about the request.
         monitor.notify(self.timestamp, DRIVER, DROPOFF,
                        self.driver.id, self.driver.location)
@@ -497,6 +746,94 @@ class Dropoff(Event):
         return event
 
 
+class Rebalance(Event):
+    """The dispatcher moves idle drivers towards the demand for drivers.
+
+    This event is not read from event files: a simulation that rebalances
+    its drivers schedules one at regular intervals.
+    """
+
+    def do(self, dispatcher, monitor):
+        """Start the drives of the idle drivers that the dispatcher plans to
+        move, and return a Reposition event for the end of every drive.
+
+        @type self: Rebalance
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: list[Event]
+
+        >>> from heatmap import DemandHeatmap
+        >>> dis = Dispatcher(heatmap=DemandHeatmap(8))
+        >>> fire = Driver("fire", Location(1, 1), 2)
+        >>> dis.request_rider(fire)
+        >>> dis.request_driver(Rider("kal", Location(5, 2), Location(1, 1),
+        ...                          5, 3)) is fire
+        True
+        >>> dis.request_rider(Driver("ice", Location(40, 40), 2))
+        >>> [str(event) for event in Rebalance(3).do(dis, Monitor())]
+        ['39.0 -- ice: Reposition to (4,4)']
+        """
+        events = _new_results()
+        for driver, location in dispatcher.rebalance(self.timestamp):
+            travel_time = driver.start_drive(location)
+            monitor.notify_leg(self.timestamp, driver.id, driver.leg_distance,
+                               travel_time, False)
+            events.append(Reposition.obtain(self.timestamp + travel_time,
+                                            driver))
+        return events
+
+    def __str__(self):
+        """Return a string representation of this event.
+
+        @type self: Rebalance
+        @rtype: str
+        """
+        return "{} -- Rebalance".format(self.timestamp)
+
+
+class Reposition(Event):
+    """A driver arrives where the dispatcher moved them to.
+
+    === Attributes ===
+    @type driver: Driver
+        The driver.
+    """
+
+    def __init__(self, timestamp, driver):
+        """Initialize a Reposition event.
+
+        @type self: Reposition
+        @type timestamp: int | float
+        @type driver: Driver
+        @rtype: None
+        """
+        super().__init__(timestamp)
+        self.driver = driver
+
+    def do(self, dispatcher, monitor):
+        """End the drive of the driver, and return a DriverRequest event for
+        the driver to request a rider again.
+
+        @type self: Reposition
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: list[Event]
+        """
+        events = _new_results()
+        self.driver.end_drive()
+        events.append(DriverRequest.obtain(self.timestamp, self.driver))
+        return events
+
+    def __str__(self):
+        """Return a string representation of this event.
+
+        @type self: Reposition
+        @rtype: str
+        """
+        return "{} -- {}: Reposition to ({})".format(
+            self.timestamp, self.driver.id, self.driver.destination)
+
+
 
 def create_event_list(filename):
     """Return a list of Events based on raw list of events in <filename>.
@@ -508,50 +845,281 @@ def create_event_list(filename):
         The name of a file that contains the list of events.
     @rtype: list[Event]
     """
-    events = []
     with open(filename, "r") as file:
-        for line in file:
-            line = line.strip()
-
-            if not line or line.startswith("#"):
-                # Skip lines that are blank or start with #.
-                continue
-
-            # Create a list of words in the line, e.g.
-            # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
-            # Note that these are strings, and you'll need to convert some
-            # of them to a different type.
-            tokens = line.split()
-            timestamp = int(tokens[0])
-            event_type = tokens[1]
-            if event_type == 'DriverRequest':
-                driver_id = tokens[2]
-                location = tokens[3]
-                speed = int(tokens[4])
-                driver = Driver(driver_id,deserialize_location(location), speed)
-            elif event_type == 'RiderRequest':
-                rider_id = tokens[2]
-                origin = tokens[3]
-                destination = tokens[4]
-                patience = int(tokens[5])
-                rider = Rider(rider_id, deserialize_location(origin),
-                              deserialize_location(destination), WAITING,
-                              patience)
-
-
-
-            # HINT: Use Location.deserialize to convert the location string to
-            # a location.
-
-            if event_type == "DriverRequest":
-                # TODO
-                # Create a DriverRequest event.
-                event = DriverRequest(timestamp, driver)
-            elif event_type == "RiderRequest":
-                # TODO
-                # Create a RiderRequest event.
-                event = RiderRequest(timestamp, rider)
+        return parse_event_lines(file)
+
+
+def create_lazy_event_list(filename):
+    """Return a list of LazyRequest events for the raw list of events in
+    <filename>.
+
+    The file is memory-mapped and read once, to find the timestamp and the
+    offset of every line. The riders and drivers of the events are only
+    created when the events are done.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout.
+
+    @type filename: str
+    @rtype: list[LazyRequest]
+
+    >>> from simulation import Simulation
+    >>> lazy = Simulation().run(create_lazy_event_list("events.txt"))
+    >>> lazy == Simulation().run(create_event_list("events.txt"))
+    True
+    """
+    trace = TraceFile(filename)
+    return [LazyRequest(timestamp, trace, offset)
+            for timestamp, offset in zip(trace.timestamps, trace.offsets)]
+
+
+class TraceFile:
+    """An event file that is memory-mapped, with an index of its lines.
+
+    === Attributes ===
+    @type filename: str
+        The name of the file.
+    @type timestamps: array[int]
+        The timestamp of every event line of the file, in file order.
+    @type offsets: array[int]
+        The offset of every event line of the file, in file order.
+    """
+
+    # === Private Attributes ===
+    # @type _map: mmap.mmap | bytes
+    #     The contents of the file.
+
+    def __init__(self, filename):
+        """Map the file <filename> into memory and index its event lines.
+
+        @type self: TraceFile
+        @type filename: str
+        @rtype: None
+        """
+        self.filename = filename
+        self.timestamps = array("q")
+        self.offsets = array("q")
+        with open(filename, "rb") as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file cannot be mapped.
+                self._map = b""
+
+        offset = 0
+        while offset < len(self._map):
+            end = self._map.find(b"\n", offset)
+            if end == -1:
+                end = len(self._map)
+            line = self._map[offset:end].strip()
+            if line and not line.startswith(b"#"):
+                self.timestamps.append(int(line.split(None, 1)[0]))
+                self.offsets.append(offset)
+            offset = end + 1
+
+    def line_at(self, offset):
+        """Return the line of the file that starts at <offset>.
+
+        @type self: TraceFile
+        @type offset: int
+        @rtype: str
+        """
+        end = self._map.find(b"\n", offset)
+        if end == -1:
+            end = len(self._map)
+        return self._map[offset:end].decode()
+
+
+class LazyRequest(Event):
+    """A RiderRequest or DriverRequest that is read from its line of a trace
+    file only when it is done.
+
+    A LazyRequest holds the offset of its line instead of a rider or driver,
+    and when pickled, it is pickled as its line, and unpickled as the event
+    the line describes.
 
+    === Attributes ===
+    @type trace: TraceFile
+        The trace file of the event.
+    @type offset: int
+        The offset of the line of the event in the trace file.
+    """
+
+    __slots__ = ("trace", "offset")
+
+    def __init__(self, timestamp, trace, offset):
+        """Initialize a LazyRequest for the line of <trace> at <offset>.
+
+        @type self: LazyRequest
+        @type timestamp: int
+        @type trace: TraceFile
+        @type offset: int
+        @rtype: None
+        """
+        super().__init__(timestamp)
+        self.trace, self.offset = trace, offset
+
+    def materialize(self):
+        """Return the RiderRequest or DriverRequest described by the line of
+        this event.
+
+        @type self: LazyRequest
+        @rtype: RiderRequest | DriverRequest
+
+        >>> print(create_lazy_event_list("events.txt")[0].materialize())
+        0 -- identifier:Amaranth, location:(1,1), speed:1 idle status:True destination:(None): Request a rider
+        """
+        event = _parse_event_line(self.trace.line_at(self.offset))
+        event.sequence, event.handle = self.sequence, self.handle
+        return event
+
+    def do(self, dispatcher, monitor):
+        """Do the event described by the line of this event.
+
+        @type self: LazyRequest
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: list[Event]
+        """
+        return self.materialize().do(dispatcher, monitor)
+
+    def __str__(self):
+        """Return a string representation of this event.
+
+        @type self: LazyRequest
+        @rtype: str
+        """
+        return str(self.materialize())
+
+    def __reduce__(self):
+        """Return how to pickle this event: as the event its line describes.
+
+        @type self: LazyRequest
+        @rtype: tuple
+        """
+        return _unpickle_request, (self.trace.line_at(self.offset),
+                                   self.sequence, self.handle)
+
+
+def _unpickle_request(line, sequence, handle):
+    """Return the event described by <line>, with <sequence> and <handle>.
+
+    @type line: str
+    @type sequence: int
+    @type handle: Handle | None
+    @rtype: RiderRequest | DriverRequest
+    """
+    event = _parse_event_line(line)
+    event.sequence, event.handle = sequence, handle
+    return event
+
+
+def parse_event_lines(lines):
+    """Return a list of Events based on the raw event lines in <lines>.
+
+    The trip distance of every rider is computed once, in a single pass over
+    all riders, with the distance backend that is set when the lines are
+    parsed.
+
+    Precondition: each line is in the format specified by the assignment
+    handout.
+
+    @type lines: iterable[str]
+        The lines of an event file.
+    @rtype: list[Event]
+
+    >>> events = parse_event_lines(["# comment", "",
+    ...                             "0 DriverRequest Amaranth 1,1 1",
+    ...                             "5 RiderRequest Bisque 3,2 2,3 5"])
+    >>> for event in events: print(event)
+    0 -- identifier:Amaranth, location:(1,1), speed:1 idle status:True destination:(None): Request a rider
+    5 -- unique_identifier: Bisque , origin: (3,2), destination: (2,3), patience: 5, status: waiting, timestamp: 5: Request a driver
+    """
+    events = []
+    for line in lines:
+        event = _parse_event_line(line)
+        if event is not None:
             events.append(event)
 
+    riders = [event.rider for event in events
+              if isinstance(event, RiderRequest)]
+    distances = trip_distances([rider.origin for rider in riders],
+                               [rider.destination for rider in riders])
+    backend = distance_backend()
+    for rider, distance in zip(riders, distances):
+        rider.trip_distance, rider.trip_backend = distance, backend
     return events
+
+
+def _parse_event_line(line):
+    """Return the Event described by the raw event <line>, or None if the
+    line is blank or a comment.
+
+    Raise ValueError if the event type of the line is unknown.
+
+    @type line: str
+    @rtype: Event | None
+    """
+    line = line.strip()
+
+    if not line or line.startswith("#"):
+        # Skip lines that are blank or start with #.
+        return None
+
+    # Create a list of words in the line, e.g.
+    # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
+    # Note that these are strings, and you'll need to convert some
+    # of them to a different type.
+    tokens = line.split()
+    timestamp = int(tokens[0])
+    event_type = tokens[1]
+    if event_type == 'DriverRequest':
+        driver_id = tokens[2]
+        location = tokens[3]
+        speed = int(tokens[4])
+        driver = Driver(driver_id, deserialize_location(location), speed)
+        event = DriverRequest(timestamp, driver)
+    elif event_type == 'RiderRequest':
+        rider_id = tokens[2]
+        origin = tokens[3]
+        destination = tokens[4]
+        patience = int(tokens[5])
+        rider = Rider(rider_id, deserialize_location(origin),
+                      deserialize_location(destination), patience,
+                      timestamp)
+        event = RiderRequest(timestamp, rider)
+    else:
+        raise ValueError("unknown event type: {}".format(event_type))
+
+    return event
+
+
+def serialize_event(event):
+    """Return the line of an event file that describes <event>.
+
+    This is the inverse of parse_event_lines.
+
+    Precondition: <event> is a RiderRequest, a DriverRequest or a
+    LazyRequest that has not been done yet.
+
+    @type event: RiderRequest | DriverRequest | LazyRequest
+    @rtype: str
+
+    >>> line = "5 RiderRequest Bisque 3,2 2,3 5"
+    >>> serialize_event(parse_event_lines([line])[0]) == line
+    True
+    >>> serialize_event(parse_event_lines(["0 DriverRequest Amaranth 1,1 1"])[0])
+    '0 DriverRequest Amaranth 1,1 1'
+    >>> serialize_event(create_lazy_event_list("events.txt")[0])
+    '0 DriverRequest Amaranth 1,1 1'
+    """
+    if isinstance(event, LazyRequest):
+        return " ".join(event.trace.line_at(event.offset).split())
+    if isinstance(event, DriverRequest):
+        return "{} DriverRequest {} {} {}".format(
+            event.timestamp, event.driver.id, event.driver.location,
+            event.driver.speed)
+    return "{} RiderRequest {} {} {} {}".format(
+        event.timestamp, event.rider.id, event.rider.origin,
+        event.rider.destination, event.rider.patience)
@@ -0,0 +1,193 @@
+"""Demand Heatmap
+
+This module contains the DemandHeatmap class, which keeps track of where
+riders have recently requested drivers, so that idle drivers can be moved
+towards the parts of the grid with the most demand.
+
+The grid is split into square cells, and the demand of a cell is the number
+of requests from it, each weighted by an exponential decay of its age: a
+request counts half as much once another half-life has passed.
+
+The decay is lazy. The weight of a request is scaled up by the decay since a
+reference time instead of every weight being scaled down as time passes, so
+that adding a request only updates its own cell. All weights share the same
+scale, so the cells rank the same either way. The weights are rescaled, and
+the reference time moved, before they grow too large for a float.
+"""
+import heapq
+import math
+from array import array
+
+from location import Location
+
+# The largest exponent by which a weight is scaled up before the weights are
+# rescaled.
+_MAX_EXPONENT = 512
+
+
+class DemandHeatmap:
+    """The demand for drivers over the cells of the grid, decaying over
+    time.
+
+    === Attributes ===
+    @type cell_size: int
+        The number of rows and columns of a cell.
+    @type half_life: int | float
+        The time after which a request counts half as much.
+    """
+
+    # === Private Attributes ===
+    # @type _rate: float
+    #     The decay rate of a request per unit of time.
+    # @type _reference: int | float
+    #     The time since which the weights are scaled up.
+    # @type _weights: array[float]
+    #     The weight of every cell with a request, scaled up by the decay
+    #     since the reference time, in the order in which the cells got their
+    #     first request.
+    # @type _cells: list[(int, int)]
+    #     The cell of every weight.
+    # @type _slots: dict[(int, int), int]
+    #     The position of the weight of every cell with a request.
+
+    def __init__(self, cell_size=8, half_life=600):
+        """Initialize an empty DemandHeatmap.
+
+        @type self: DemandHeatmap
+        @type cell_size: int
+        @type half_life: int | float
+        @rtype: None
+        """
+        self.cell_size, self.half_life = cell_size, half_life
+        self._rate = math.log(2) / half_life
+        self._reference = 0
+        self._weights = array("d")
+        self._cells = []
+        self._slots = {}
+
+    def __len__(self):
+        """Return the number of cells with a request.
+
+        @type self: DemandHeatmap
+        @rtype: int
+        """
+        return len(self._cells)
+
+    def cell_of(self, location):
+        """Return the cell of <location>.
+
+        @type self: DemandHeatmap
+        @type location: Location
+        @rtype: (int, int)
+        """
+        return (location.row // self.cell_size,
+                location.column // self.cell_size)
+
+    def center(self, cell):
+        """Return the location at the center of <cell>.
+
+        @type self: DemandHeatmap
+        @type cell: (int, int)
+        @rtype: Location
+
+        >>> print(DemandHeatmap(8).center((1, 2)))
+        12,20
+        """
+        half = self.cell_size // 2
+        return Location(cell[0] * self.cell_size + half,
+                        cell[1] * self.cell_size + half)
+
+    def add(self, timestamp, location, weight=1):
+        """Add a request with <weight> at <location> at <timestamp>.
+
+        @type self: DemandHeatmap
+        @type timestamp: int | float
+        @type location: Location
+        @type weight: int | float
+        @rtype: None
+        """
+        exponent = self._rate * (timestamp - self._reference)
+        if exponent > _MAX_EXPONENT:
+            self._rescale(timestamp)
+            exponent = 0
+        cell = self.cell_of(location)
+        slot = self._slots.get(cell)
+        if slot is None:
+            slot = self._slots[cell] = len(self._cells)
+            self._cells.append(cell)
+            self._weights.append(0)
+        self._weights[slot] += weight * math.exp(exponent)
+
+    def demand(self, timestamp, location):
+        """Return the demand at <timestamp> of the cell of <location>.
+
+        @type self: DemandHeatmap
+        @type timestamp: int | float
+        @type location: Location
+        @rtype: float
+
+        >>> heatmap = DemandHeatmap(8, 10)
+        >>> heatmap.add(0, Location(1, 1))
+        >>> heatmap.add(10, Location(2, 2))
+        >>> heatmap.demand(10, Location(0, 0))
+        1.5
+        >>> round(heatmap.demand(30, Location(0, 0)), 6)
+        0.375
+        >>> heatmap.demand(30, Location(9, 0))
+        0
+        """
+        slot = self._slots.get(self.cell_of(location))
+        if slot is None:
+            return 0
+        return self._weights[slot] * self._decay(timestamp)
+
+    def hottest(self, timestamp, count):
+        """Return the cells with the highest demand at <timestamp>, at most
+        <count> of them, with their demand, from the highest demand down.
+
+        @type self: DemandHeatmap
+        @type timestamp: int | float
+        @type count: int
+        @rtype: list[((int, int), float)]
+
+        >>> heatmap = DemandHeatmap(8, 10)
+        >>> heatmap.add(0, Location(1, 1), 4)
+        >>> heatmap.add(10, Location(9, 9), 3)
+        >>> heatmap.add(10, Location(20, 1))
+        >>> heatmap.hottest(10, 2)
+        [((1, 1), 3.0), ((0, 0), 2.0)]
+        """
+        weights = self._weights
+        decay = self._decay(timestamp)
+        return [(self._cells[slot], weights[slot] * decay)
+                for slot in heapq.nlargest(count, range(len(weights)),
+                                           weights.__getitem__)]
+
+    def _decay(self, timestamp):
+        """Return the factor by which the weights are scaled down to get the
+        demand at <timestamp>.
+
+        @type self: DemandHeatmap
+        @type timestamp: int | float
+        @rtype: float
+        """
+        return math.exp(-self._rate * (timestamp - self._reference))
+
+    def _rescale(self, timestamp):
+        """Scale the weights down to the demand at <timestamp>, and move the
+        reference time to <timestamp>.
+
+        @type self: DemandHeatmap
+        @type timestamp: int | float
+        @rtype: None
+
+        >>> heatmap = DemandHeatmap(8, 1)
+        >>> heatmap.add(0, Location(1, 1))
+        >>> heatmap.add(1000, Location(1, 1))
+        >>> heatmap.demand(1000, Location(1, 1))
+        1.0
+        """
+        decay = self._decay(timestamp)
+        self._weights = array("d", (weight * decay
+                                    for weight in self._weights))
+        self._reference = timestamp
@@ -1,4 +1,9 @@
 import math
+from array import array
+
+# The function that gives the travel distance between two locations, or None
+# if it is the Manhattan distance.
+_distance_backend = None
 
 
 class Location:
@@ -63,6 +68,84 @@ def manhattan_distance(p1, p2):
     return distance
 
 
+def set_distance_backend(backend):
+    """Make <backend> give the travel distance between two locations from
+    now on, or restore the Manhattan distance if <backend> is None.
+
+    @type backend: callable | None
+        A function of the origin and destination Locations that returns the
+        distance between them.
+    @rtype: None
+
+    >>> set_distance_backend(lambda origin, destination: 7)
+    >>> travel_distance(Location(5, 3), Location(5, 6))
+    7
+    >>> set_distance_backend(None)
+    >>> travel_distance(Location(5, 3), Location(5, 6))
+    3
+    """
+    global _distance_backend
+    _distance_backend = backend
+
+
+def distance_backend():
+    """Return the function that gives the travel distance between two
+    locations, or None if it is the Manhattan distance.
+
+    @rtype: callable | None
+    """
+    return _distance_backend
+
+
+def distance_bound():
+    """Return a function that gives a lower bound on the travel distance
+    between two locations, much faster than the distance itself, or None if
+    the distance backend has none.
+
+    @rtype: callable | None
+
+    >>> distance_bound() is None
+    True
+    """
+    return getattr(_distance_backend, "lower_bound", None)
+
+
+def travel_distance(origin, destination):
+    """Return the distance a driver travels from <origin> to <destination>.
+
+    This is the Manhattan distance, unless another distance backend has been
+    set with set_distance_backend.
+
+    @type origin: Location
+    @type destination: Location
+    @rtype: int | float
+    """
+    if _distance_backend is None:
+        return manhattan_distance(origin, destination)
+    return _distance_backend(origin, destination)
+
+
+def trip_distances(origins, destinations):
+    """Return the travel distance from every location in <origins> to the
+    location at the same index of <destinations>, in a single pass.
+
+    @type origins: list[Location]
+    @type destinations: list[Location]
+    @rtype: array[int] | array[float]
+        Integers for the Manhattan distance, and floats for a distance
+        backend, which may return infinity for unreachable locations.
+
+    >>> list(trip_distances([Location(5, 3), Location(1, 1)],
+    ...                     [Location(5, 6), Location(13, 7)]))
+    [3, 18]
+    """
+    if _distance_backend is not None:
+        return array("d", map(_distance_backend, origins, destinations))
+    return array("l", [abs(origin.row - destination.row) +
+                       abs(origin.column - destination.column)
+                       for origin, destination in zip(origins, destinations)])
+
+
 def deserialize_location(location_str):
     """Deserialize a location.
 
@@ -75,13 +158,8 @@ def deserialize_location(location_str):
     >>> comp = deserialize_location(loc_str)
     >>> comp == compare
     True
+    >>> print(deserialize_location('12,40'))
+    12,40
     """
-    # TODO
-    location_list = []
-    for char in location_str:
-        location_list.append(char)
-
-    row = int(location_list[0])
-    column = int(location_list[2])
-
-    return Location(row, column)
+    row, column = location_str.split(",")
+    return Location(int(row), int(column))
@@ -0,0 +1,111 @@
+"""Multi-market Simulation
+
+This module contains the MultiMarketSimulation class, which simulates many
+independent markets in a single process. Every market has its own event
+queue, dispatcher and monitor. The event streams of the markets are merged
+by next event timestamp with a heap that holds one entry per market.
+"""
+import heapq
+
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from monitor import Monitor
+
+
+class MultiMarketSimulation:
+    """A simulation of many independent markets.
+
+    Every event belongs to the market it was added to, and so do the events
+    it spawns.
+    """
+
+    # === Private Attributes ===
+    # @type _markets: dict[object, (PriorityQueue, Dispatcher, Monitor)]
+    #     The event queue, dispatcher and monitor of every market, by name.
+
+    def __init__(self):
+        """Initialize a MultiMarketSimulation without any markets.
+
+        @type self: MultiMarketSimulation
+        @rtype: None
+        """
+        self._markets = {}
+
+    def add_events(self, market, events):
+        """Add <events> to the market named <market>.
+
+        The market is created if this is the first time it is named.
+
+        @type self: MultiMarketSimulation
+        @type market: object
+        @type events: list[Event]
+        @rtype: None
+        """
+        if market not in self._markets:
+            self._markets[market] = (PriorityQueue(), Dispatcher(), Monitor())
+        queue = self._markets[market][0]
+        for event in events:
+            event.handle = queue.add(event)
+
+    def run(self):
+        """Run every market until no events are left.
+
+        Return a dictionary with the report of every market under its name,
+        and a "combined" report over the activities of all markets.
+
+        @type self: MultiMarketSimulation
+        @rtype: dict[str, object]
+
+        >>> from event import create_event_list
+        >>> from simulation import Simulation
+        >>> expected = Simulation().run(create_event_list("events.txt"))
+        >>> sim = MultiMarketSimulation()
+        >>> sim.add_events("toronto", create_event_list("events.txt"))
+        >>> sim.add_events("ottawa", create_event_list("events.txt"))
+        >>> reports = sim.run()
+        >>> reports["markets"]["toronto"] == reports["combined"] == expected
+        True
+        """
+        # One entry per market that has events left. The position of the
+        # market breaks ties between markets with equal next timestamps.
+        heap = []
+        for position, (market, (queue, dispatcher, monitor)) in enumerate(
+                self._markets.items()):
+            if not queue.is_empty():
+                heap.append((queue.peek().timestamp, position, queue,
+                             dispatcher, monitor))
+        heapq.heapify(heap)
+
+        while heap:
+            _, position, queue, dispatcher, monitor = heap[0]
+            # A market keeps going for as long as it is still first in time,
+            # which saves a heap operation for each event of a burst. The
+            # runner-up is one of the two children of the root.
+            limit = min([entry[0] for entry in heap[1:3]],
+                        default=float("inf"))
+            while True:
+                event = queue.remove()
+                for new_event in event.do(dispatcher, monitor):
+                    new_event.handle = queue.add(new_event)
+                if queue.is_empty() or queue.peek().timestamp > limit:
+                    break
+            if queue.is_empty():
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (queue.peek().timestamp, position,
+                                         queue, dispatcher, monitor))
+
+        return self.report()
+
+    def report(self):
+        """Return the report of every market and the combined report.
+
+        @type self: MultiMarketSimulation
+        @rtype: dict[str, object]
+        """
+        combined = Monitor()
+        reports = {}
+        for market, (_, _, monitor) in self._markets.items():
+            reports[market] = monitor.report()
+            combined.merge(monitor, market)
+        return {"markets": reports, "combined": combined.report()}
@@ -22,6 +22,10 @@ request, cancel, pickup, or dropoff.
     A constant used for the dropoff activity description.
 """
 
+import heapq
+import math
+from array import array
+
 RIDER = "rider"
 DRIVER = "driver"
 
@@ -45,6 +49,9 @@ class Activity:
         The location at which the activity occurred.
     """
 
+    # A monitor keeps every activity, so activities do without a __dict__.
+    __slots__ = ("description", "time", "id", "location")
+
     def __init__(self, timestamp, description, identifier, location):
         """Initialize an Activity.
 
@@ -61,6 +68,370 @@ class Activity:
         self.location = location
 
 
+class FleetLedger:
+    """The distances and times driven by every driver, kept up to date as
+    drivers start drives and rides, so that they never have to be summed
+    up from the activities of the drivers.
+
+    A drive or ride is counted up to the current time: a leg that is still
+    in progress is counted in proportion to the part of it that is done. A
+    driver is idle whenever it is not driving, from the time it is first
+    seen.
+
+    === Attributes ===
+    @type now: float
+        The current time, up to which the distances, times and
+        utilizations are reported.
+    """
+
+    # === Private Attributes ===
+    # @type _numbers: dict[object, int]
+    #     The number of every driver, by identifier.
+    # @type _ids: list[object]
+    #     The identifier of every driver, by number.
+    # @type _first: array[float]
+    #     The time every driver was first seen.
+    # @type _total_distance, _ride_distance: array[float]
+    #     The distance every driver has driven or is driving, in total and
+    #     with a rider, counting every leg in full.
+    # @type _en_route_time, _ride_time: array[float]
+    #     The time every driver has driven or is driving without and with a
+    #     rider, counting every leg in full.
+    # @type _totals: list[float]
+    #     The sum of the first times, of the total distances, of the ride
+    #     distances, of the en route times and of the ride times of all
+    #     drivers.
+    # @type _leg_end: array[float]
+    #     The time the leg of every driver that is still in progress ends,
+    #     or -1 if the driver has no leg in progress.
+    # @type _leg_speed: array[float]
+    #     The distance per unit of time of the leg of every driver.
+    # @type _leg_riding: array[int]
+    #     1 iff the leg of every driver is a ride.
+    # @type _ends: list[(float, int)]
+    #     A heap of the end and the driver number of every leg in progress,
+    #     including legs that have since been replaced.
+    # @type _active: list[list[float]]
+    #     For the drives and for the rides in progress: how many there are,
+    #     the sum of their ends, of their speeds and of their speeds times
+    #     their ends.
+
+    def __init__(self):
+        """Initialize an empty FleetLedger.
+
+        @type self: FleetLedger
+        @rtype: None
+        """
+        self._numbers = {}
+        self._ids = []
+        self._first = array("d")
+        self._total_distance, self._ride_distance = array("d"), array("d")
+        self._en_route_time, self._ride_time = array("d"), array("d")
+        self._totals = [0, 0, 0, 0, 0]
+        self._leg_end, self._leg_speed = array("d"), array("d")
+        self._leg_riding = array("b")
+        self._ends = []
+        self._active = [[0, 0, 0, 0], [0, 0, 0, 0]]
+        self.now = 0
+
+    def __len__(self):
+        """Return the number of drivers in this FleetLedger.
+
+        @type self: FleetLedger
+        @rtype: int
+        """
+        return len(self._ids)
+
+    def add(self, timestamp, identifier):
+        """Add the driver <identifier>, first seen at <timestamp>, and return
+        its number.
+
+        @type self: FleetLedger
+        @type timestamp: float
+        @type identifier: object
+        @rtype: int
+        """
+        number = self._numbers.get(identifier)
+        if number is not None:
+            return number
+        number = self._numbers[identifier] = len(self._ids)
+        self._ids.append(identifier)
+        self._first.append(timestamp)
+        for column in (self._total_distance, self._ride_distance,
+                       self._en_route_time, self._ride_time,
+                       self._leg_speed, self._leg_riding):
+            column.append(0)
+        self._leg_end.append(-1)
+        self._totals[0] += timestamp
+        self.now = max(self.now, timestamp)
+        return number
+
+    def start_leg(self, timestamp, identifier, distance, duration, riding):
+        """Record that the driver <identifier> started to drive <distance>
+        at <timestamp>, for <duration>, with a rider iff <riding>.
+
+        A leg that the driver had still in progress is counted as done.
+
+        @type self: FleetLedger
+        @type timestamp: float
+        @type identifier: object
+        @type distance: float
+        @type duration: float
+        @type riding: bool
+        @rtype: None
+        """
+        number = self.add(timestamp, identifier)
+        self.now = max(self.now, timestamp)
+        self._total_distance[number] += distance
+        self._totals[1] += distance
+        if riding:
+            self._ride_distance[number] += distance
+            self._ride_time[number] += duration
+            self._totals[2] += distance
+            self._totals[4] += duration
+        else:
+            self._en_route_time[number] += duration
+            self._totals[3] += duration
+        if self._leg_end[number] >= 0:
+            self._finish(number)
+        if duration > 0:
+            self._begin(number, timestamp + duration, distance / duration,
+                        riding)
+
+    def merge(self, other, namespace=None):
+        """Add the drivers and legs recorded by <other> to this FleetLedger,
+        with their identifiers in <namespace> if it is not None.
+
+        The legs of a driver recorded by both ledgers are added up.
+
+        @type self: FleetLedger
+        @type other: FleetLedger
+        @type namespace: object
+        @rtype: None
+        """
+        other._settle()
+        for number, identifier in enumerate(other._ids):
+            if namespace is not None:
+                identifier = (namespace, identifier)
+            first = other._first[number]
+            mine = self._numbers.get(identifier)
+            if mine is None:
+                mine = self.add(first, identifier)
+            elif first < self._first[mine]:
+                self._totals[0] += first - self._first[mine]
+                self._first[mine] = first
+            self._total_distance[mine] += other._total_distance[number]
+            self._ride_distance[mine] += other._ride_distance[number]
+            self._en_route_time[mine] += other._en_route_time[number]
+            self._ride_time[mine] += other._ride_time[number]
+            if other._leg_end[number] >= 0:
+                if self._leg_end[mine] >= 0:
+                    self._finish(mine)
+                self._begin(mine, other._leg_end[number],
+                            other._leg_speed[number],
+                            other._leg_riding[number])
+        for column in range(1, 5):
+            self._totals[column] += other._totals[column]
+        self.now = max(self.now, other.now)
+
+    def fleet_report(self):
+        """Return the average distances and times of the drivers, and the
+        fraction of the time of the fleet spent on rides, in constant
+        amortized time.
+
+        @type self: FleetLedger
+        @rtype: dict[str, float]
+
+        >>> ledger = FleetLedger()
+        >>> ledger.start_leg(0, "fire", 4, 2, False)
+        >>> ledger.start_leg(2, "fire", 6, 3, True)
+        >>> ledger.add(5, "ice")
+        1
+        >>> ledger.now = 10
+        >>> for item in sorted(ledger.fleet_report().items()): print(item)
+        ('en_route_time', 1.0)
+        ('idle_time', 5.0)
+        ('ride_distance', 3.0)
+        ('ride_time', 1.5)
+        ('total_distance', 5.0)
+        ('utilization', 0.2)
+
+        A leg in progress is only counted up to the current time.
+
+        >>> ledger = FleetLedger()
+        >>> ledger.start_leg(0, "fire", 100, 100, True)
+        >>> ledger.now = 5
+        >>> report = ledger.fleet_report()
+        >>> report["ride_time"], report["ride_distance"], report["utilization"]
+        (5.0, 5.0, 1.0)
+        >>> ledger.now = 50
+        >>> ledger.fleet_report()["ride_distance"]
+        50.0
+        """
+        count = len(self._ids)
+        if count == 0:
+            return {"total_distance": 0, "ride_distance": 0, "idle_time": 0,
+                    "en_route_time": 0, "ride_time": 0, "utilization": 0}
+        self._settle()
+        first, total, ride, en_route, ride_time = self._totals
+        # Take off the parts of the legs in progress that are still to come.
+        now = self.now
+        for riding, (legs, ends, speeds, products) in enumerate(self._active):
+            if legs:
+                time_left = ends - legs * now
+                distance_left = products - speeds * now
+                total -= distance_left
+                if riding:
+                    ride -= distance_left
+                    ride_time -= time_left
+                else:
+                    en_route -= time_left
+        elapsed = count * now - first
+        return {"total_distance": total / count,
+                "ride_distance": ride / count,
+                "idle_time": max(elapsed - en_route - ride_time, 0) / count,
+                "en_route_time": en_route / count,
+                "ride_time": ride_time / count,
+                "utilization": min(ride_time / elapsed, 1) if elapsed else 0}
+
+    def driver_report(self, identifier):
+        """Return the distances and times of the driver <identifier>, and
+        the fraction of its time spent on rides.
+
+        Precondition: the driver is in this FleetLedger.
+
+        @type self: FleetLedger
+        @type identifier: object
+        @rtype: dict[str, float]
+
+        >>> ledger = FleetLedger()
+        >>> ledger.start_leg(0, "fire", 4, 2, False)
+        >>> ledger.start_leg(2, "fire", 6, 3, True)
+        >>> ledger.now = 10
+        >>> ledger.driver_report("fire")["idle_time"]
+        5.0
+        >>> ledger.start_leg(10, "fire", 6, 3, True)
+        >>> ledger.now = 12
+        >>> ledger.driver_report("fire")["ride_distance"]
+        10.0
+        """
+        self._settle()
+        number = self._numbers[identifier]
+        elapsed = self.now - self._first[number]
+        total = self._total_distance[number]
+        ride = self._ride_distance[number]
+        en_route, ride_time = self._en_route_time[number], self._ride_time[
+            number]
+        time_left = self._leg_end[number] - self.now
+        if time_left > 0:
+            distance_left = self._leg_speed[number] * time_left
+            total -= distance_left
+            if self._leg_riding[number]:
+                ride -= distance_left
+                ride_time -= time_left
+            else:
+                en_route -= time_left
+        return {"total_distance": total,
+                "ride_distance": ride,
+                "idle_time": max(elapsed - en_route - ride_time, 0),
+                "en_route_time": en_route,
+                "ride_time": ride_time,
+                "utilization": self._utilization(number)}
+
+    def least_utilized(self, count):
+        """Return the identifiers and utilizations of the <count> drivers
+        with the lowest fraction of their time spent on rides, lowest first.
+
+        @type self: FleetLedger
+        @type count: int
+        @rtype: list[(object, float)]
+
+        >>> ledger = FleetLedger()
+        >>> ledger.start_leg(0, "fire", 4, 4, True)
+        >>> ledger.start_leg(0, "ice", 4, 2, True)
+        >>> ledger.add(0, "water")
+        2
+        >>> ledger.now = 8
+        >>> ledger.least_utilized(2)
+        [('water', 0.0), ('ice', 0.25)]
+        """
+        self._settle()
+        numbers = heapq.nsmallest(count, range(len(self._ids)),
+                                  key=self._utilization)
+        return [(self._ids[number], self._utilization(number))
+                for number in numbers]
+
+    def _utilization(self, number):
+        """Return the fraction of the time of the driver <number> spent on
+        rides.
+
+        Precondition: the legs that have ended are settled.
+
+        @type self: FleetLedger
+        @type number: int
+        @rtype: float
+        """
+        elapsed = self.now - self._first[number]
+        if elapsed <= 0:
+            return 0
+        ride_time = self._ride_time[number]
+        if self._leg_riding[number] and self._leg_end[number] > self.now:
+            ride_time -= self._leg_end[number] - self.now
+        return min(ride_time / elapsed, 1)
+
+    def _begin(self, number, end, speed, riding):
+        """Record that the driver <number> has a leg in progress until <end>,
+        at <speed>, with a rider iff <riding>.
+
+        @type self: FleetLedger
+        @type number: int
+        @type end: float
+        @type speed: float
+        @type riding: bool | int
+        @rtype: None
+        """
+        self._leg_end[number], self._leg_speed[number] = end, speed
+        self._leg_riding[number] = 1 if riding else 0
+        active = self._active[self._leg_riding[number]]
+        active[0] += 1
+        active[1] += end
+        active[2] += speed
+        active[3] += speed * end
+        heapq.heappush(self._ends, (end, number))
+
+    def _finish(self, number):
+        """Record that the leg in progress of the driver <number> is done.
+
+        @type self: FleetLedger
+        @type number: int
+        @rtype: None
+        """
+        end, speed = self._leg_end[number], self._leg_speed[number]
+        active = self._active[self._leg_riding[number]]
+        active[0] -= 1
+        if active[0] == 0:
+            # No rounding errors are left behind once no leg is in progress.
+            active[1:] = [0, 0, 0]
+        else:
+            active[1] -= end
+            active[2] -= speed
+            active[3] -= speed * end
+        self._leg_end[number] = -1
+
+    def _settle(self):
+        """Record that every leg in progress that ends by now is done.
+
+        @type self: FleetLedger
+        @rtype: None
+        """
+        ends, leg_end = self._ends, self._leg_end
+        while ends and ends[0][0] <= self.now:
+            end, number = heapq.heappop(ends)
+            # A leg replaced by a later one is already done.
+            if leg_end[number] == end:
+                self._finish(number)
+
+
 class Monitor:
     """A monitor keeps a record of activities that it is notified about.
     When required, it generates a report of the activities it has recorded.
@@ -71,17 +442,68 @@ class Monitor:
     #       A dictionary whose key is a category, and value is another
     #       dictionary. The key of the second dictionary is an identifier
     #       and its value is a list of Activities.
+    # @type _approximations: int
+    #       The number of approximate dispatches that were checked against
+    #       the nearest driver.
+    # @type _changed: int
+    #       The number of those dispatches that chose another driver than
+    #       the nearest one.
+    # @type _excess_time: float
+    #       The total travel time by which those dispatches exceeded the
+    #       travel time of the nearest driver.
+    # @type _worst_ratio: float
+    #       The highest ratio of the travel time of a chosen driver to the
+    #       travel time of the nearest driver.
+    # @type _fleet: FleetLedger
+    #       The distances and times driven by every driver.
+    # @type _rollup: Rollup | None
+    #       The rollup that every activity is also added to, if any.
+    # @type _log: ActivityLog | None
+    #       The log that activities are spilled to instead of being kept in
+    #       _activities, if any.
+    # @type _requested: dict[str, int]
+    #       The time of the request of every rider that is waiting, if
+    #       activities are spilled.
+    # @type _riders: int
+    #       The number of riders, if activities are spilled.
+    # @type _wait_time: list[float]
+    #       Partial sums that add up exactly to the total wait time of the
+    #       riders that have finished waiting, if activities are spilled.
+    # @type _waits: int
+    #       The number of riders that have finished waiting, if activities
+    #       are spilled.
 
-    def __init__(self):
+    def __init__(self, rollup=None, log=None):
         """Initialize a Monitor.
 
+        If <rollup> is not None, every activity the monitor is notified
+        about is also added to <rollup>. A monitor is pickled without its
+        rollup.
+
+        If <log> is not None, activities are spilled to <log> instead of
+        being kept in memory, and the wait time of riders is kept up to
+        date as activities happen.
+
         @type self: Monitor
+        @type rollup: Rollup | None
+        @type log: ActivityLog | None
         """
         self._activities = {
             RIDER: {},
             DRIVER: {}
         }
         """@type _activities: dict[str, dict[str, list[Activity]]]"""
+        self._approximations = 0
+        self._changed = 0
+        self._excess_time = 0
+        self._worst_ratio = 1
+        self._fleet = FleetLedger()
+        self._rollup = rollup
+        self._log = log
+        self._requested = {}
+        self._riders = 0
+        self._wait_time = []
+        self._waits = 0
 
     def __str__(self):
         """Return a string representation.
@@ -89,6 +511,9 @@ class Monitor:
         @type self: Monitor
         @rtype: str
         """
+        if self._log is not None:
+            return "Monitor ({} drivers, {} riders)".format(
+                len(self._fleet), self._riders)
         return "Monitor ({} drivers, {} riders)".format(
                 len(self._activities[DRIVER]), len(self._activities[RIDER]))
 
@@ -108,12 +533,239 @@ class Monitor:
             The location of the activity.
         @rtype: None
         """
+        if self._log is not None:
+            self._spill(timestamp, category, description, identifier,
+                        location)
+            return
         if identifier not in self._activities[category]:
             self._activities[category][identifier] = []
+            if category == DRIVER:
+                self._fleet.add(timestamp, identifier)
+        if timestamp > self._fleet.now:
+            self._fleet.now = timestamp
+        if self._rollup is not None:
+            self._rollup.notify(timestamp, category, description, identifier)
 
         activity = Activity(timestamp, description, identifier, location)
         self._activities[category][identifier].append(activity)
 
+    def _spill(self, timestamp, category, description, identifier,
+               location):
+        """Record the activity in the log and in the running totals.
+
+        @type self: Monitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+
+        >>> import tempfile
+        >>> from activitylog import ActivityLog
+        >>> monitor = Monitor(log=ActivityLog(tempfile.mkdtemp(), 2))
+        >>> monitor.notify(0, RIDER, REQUEST, "kal", None)
+        >>> monitor.notify(1, DRIVER, REQUEST, "fire", None)
+        >>> monitor.notify(4, RIDER, PICKUP, "kal", None)
+        >>> monitor.notify(9, RIDER, DROPOFF, "kal", None)
+        >>> print(monitor, monitor.report()["rider_wait_time"])
+        Monitor (1 drivers, 1 riders) 4.0
+        """
+        if category == DRIVER:
+            self._fleet.add(timestamp, identifier)
+        elif identifier in self._requested:
+            # The activity after the request ends the wait of the rider.
+            _add_exactly(self._wait_time,
+                         timestamp - self._requested.pop(identifier))
+            self._waits += 1
+        elif description == REQUEST:
+            self._requested[identifier] = timestamp
+            self._riders += 1
+        if timestamp > self._fleet.now:
+            self._fleet.now = timestamp
+        if self._rollup is not None:
+            self._rollup.notify(timestamp, category, description, identifier)
+        self._log.append(timestamp, category, description, identifier,
+                         location)
+
+    def __getstate__(self):
+        """Return the state of this Monitor to pickle, without its rollup.
+
+        @type self: Monitor
+        @rtype: dict
+
+        >>> import os, pickle, tempfile
+        >>> from rollup import Rollup, CsvSink
+        >>> directory = tempfile.mkdtemp()
+        >>> sink = CsvSink(os.path.join(directory, "windows.csv"))
+        >>> monitor = Monitor(Rollup(sink, 10))
+        >>> monitor.notify(0, RIDER, REQUEST, "kal", None)
+        >>> copy = pickle.loads(pickle.dumps(monitor))
+        >>> copy._rollup is None, len(copy._activities[RIDER]["kal"])
+        (True, 1)
+        >>> sink.close()
+        """
+        state = self.__dict__.copy()
+        state["_rollup"] = None
+        return state
+
+    def merge(self, other, namespace=None):
+        """Add the activities recorded by the monitor <other> to this monitor.
+
+        The activities of every identifier are kept in chronological order.
+        If <namespace> is not None, the identifiers of <other> are recorded
+        as (namespace, identifier) pairs, so that actors of monitors that
+        share identifiers are kept apart.
+
+        @type self: Monitor
+        @type other: Monitor
+        @type namespace: object
+        @rtype: None
+
+        >>> first = Monitor()
+        >>> second = Monitor()
+        >>> first.notify(0, RIDER, REQUEST, "kal", None)
+        >>> second.notify(3, RIDER, DROPOFF, "kal", None)
+        >>> second.notify(1, RIDER, PICKUP, "kal", None)
+        >>> first.merge(second)
+        >>> [activity.description for activity in first._activities[RIDER]["kal"]]
+        ['request', 'pickup', 'dropoff']
+        >>> first.merge(second, "toronto")
+        >>> sorted(first._activities[RIDER], key=str)
+        [('toronto', 'kal'), 'kal']
+        """
+        if self._log is not None or other._log is not None:
+            raise ValueError("monitors that spill activities cannot be "
+                             "merged")
+        for category, actors in other._activities.items():
+            for identifier, activities in actors.items():
+                if namespace is not None:
+                    identifier = (namespace, identifier)
+                merged = self._activities[category].setdefault(identifier, [])
+                merged.extend(activities)
+                merged.sort(key=lambda activity: activity.time)
+        self._fleet.merge(other._fleet, namespace)
+        self._approximations += other._approximations
+        self._changed += other._changed
+        self._excess_time += other._excess_time
+        self._worst_ratio = max(self._worst_ratio, other._worst_ratio)
+
+    def notify_leg(self, timestamp, identifier, distance, duration, riding):
+        """Notify the monitor that the driver <identifier> started to drive
+        <distance> at <timestamp>, for <duration>, with a rider iff <riding>.
+
+        @type self: Monitor
+        @type timestamp: float
+        @type identifier: str
+        @type distance: float
+        @type duration: float
+        @type riding: bool
+        @rtype: None
+        """
+        self._fleet.start_leg(timestamp, identifier, distance, duration,
+                              riding)
+
+    def flush(self):
+        """Write the activities the activity log of the monitor still
+        buffers to disk, if activities are spilled.
+
+        @type self: Monitor
+        @rtype: None
+        """
+        if self._log is not None:
+            self._log.flush()
+
+    def advance(self, timestamp):
+        """Notify the monitor that the time has reached <timestamp>, even if
+        no activity happened then.
+
+        @type self: Monitor
+        @type timestamp: float
+        @rtype: None
+        """
+        if timestamp > self._fleet.now:
+            self._fleet.now = timestamp
+
+    def fleet_report(self):
+        """Return the average distances, idle, en route and ride times of
+        the drivers, and the fraction of the time of the fleet spent on
+        rides, up to the latest activity or the time the monitor was
+        advanced to, whichever is later.
+
+        @type self: Monitor
+        @rtype: dict[str, float]
+        """
+        return self._fleet.fleet_report()
+
+    def driver_report(self, identifier):
+        """Return the distances, idle, en route and ride times of the driver
+        <identifier>, and the fraction of its time spent on rides, up to the
+        latest activity or the time the monitor was advanced to, whichever
+        is later.
+
+        Precondition: the monitor has been notified of an activity of the
+        driver.
+
+        @type self: Monitor
+        @type identifier: str
+        @rtype: dict[str, float]
+        """
+        return self._fleet.driver_report(identifier)
+
+    def least_utilized(self, count):
+        """Return the identifiers and utilizations of the <count> drivers
+        with the lowest fraction of their time spent on rides, lowest first.
+
+        @type self: Monitor
+        @type count: int
+        @rtype: list[(str, float)]
+        """
+        return self._fleet.least_utilized(count)
+
+    def record_approximation(self, chosen_time, nearest_time):
+        """Record an approximate dispatch that chose a driver <chosen_time>
+        away from the rider, when the nearest driver was <nearest_time> away.
+
+        @type self: Monitor
+        @type chosen_time: float
+        @type nearest_time: float
+        @rtype: None
+        """
+        self._approximations += 1
+        if chosen_time > nearest_time:
+            self._changed += 1
+            self._excess_time += chosen_time - nearest_time
+            if nearest_time > 0:
+                self._worst_ratio = max(self._worst_ratio,
+                                        chosen_time / nearest_time)
+            else:
+                self._worst_ratio = float("inf")
+
+    def approximation_report(self):
+        """Return a report of the approximate dispatches that have been
+        recorded: how many there were, how many of them chose a driver
+        further away than the nearest one, the average travel time they
+        added, and the worst ratio of chosen to nearest travel time.
+
+        @type self: Monitor
+        @rtype: dict[str, object]
+
+        >>> monitor = Monitor()
+        >>> monitor.record_approximation(4, 4)
+        >>> monitor.record_approximation(6, 4)
+        >>> for item in sorted(monitor.approximation_report().items()):
+        ...     print(item)
+        ('approximate_dispatches', 2)
+        ('average_excess_time', 1.0)
+        ('changed_dispatches', 1)
+        ('worst_ratio', 1.5)
+        """
+        return {"approximate_dispatches": self._approximations,
+                "changed_dispatches": self._changed,
+                "average_excess_time": (self._excess_time /
+                                        max(self._approximations, 1)),
+                "worst_ratio": self._worst_ratio}
+
     def report(self):
         """Return a report of the activities that have occurred.
 
@@ -128,10 +780,17 @@ class Monitor:
         """Return the average wait time of riders that have either been picked
         up or have cancelled their ride.
 
+        The wait times are added up exactly, so that the average does not
+        depend on the order in which they are added.
+
         @type self: Monitor
         @rtype: float
         """
-        wait_time = 0
+        if self._log is not None:
+            if not self._waits:
+                return 0
+            return math.fsum(self._wait_time) / self._waits
+        wait_times = []
         count = 0
         for activities in self._activities[RIDER].values():
             # A rider that has less than two activities hasn't finished
@@ -139,9 +798,12 @@ class Monitor:
             if len(activities) >= 2:
                 # The first activity is REQUEST, and the second is PICKUP
                 # or CANCEL. The wait time is the difference between the two.
-                wait_time += activities[1].time - activities[0].time
+                wait_times.append(activities[1].time - activities[0].time)
                 count += 1
-        return wait_time / count
+        if count == 0:
+            # No rider has finished waiting yet.
+            return 0
+        return math.fsum(wait_times) / count
 
     def _average_total_distance(self):
         """Return the average distance drivers have driven.
@@ -149,8 +811,7 @@ class Monitor:
         @type self: Monitor
         @rtype: float
         """
-        # TODO
-        pass
+        return self._fleet.fleet_report()["total_distance"]
 
     def _average_ride_distance(self):
         """Return the average distance drivers have driven on rides.
@@ -158,5 +819,31 @@ class Monitor:
         @type self: Monitor
         @rtype: float
         """
-        # TODO
-        pass
+        return self._fleet.fleet_report()["ride_distance"]
+
+
+def _add_exactly(partials, value):
+    """Add <value> to the sum of <partials>, keeping the partials such that
+    they add up exactly to the sum, as math.fsum does.
+
+    @type partials: list[float]
+    @type value: float
+    @rtype: None
+
+    >>> partials = []
+    >>> for value in [0.1] * 10 + [1e100, 1.0, -1e100]:
+    ...     _add_exactly(partials, value)
+    >>> math.fsum(partials)
+    2.0
+    """
+    count = 0
+    for partial in partials:
+        if abs(value) < abs(partial):
+            value, partial = partial, value
+        high = value + partial
+        low = partial - (high - value)
+        if low:
+            partials[count] = low
+            count += 1
+        value = high
+    partials[count:] = [value]
@@ -0,0 +1,503 @@
+"""Partitioned Simulation
+
+This module contains the PartitionedSimulation class, which splits the grid
+into regions and simulates every region in its own process. Each region has
+its own event queue, dispatcher and monitor.
+
+Riders are matched with drivers of any region, as a Simulation would match
+them. A region that has to match a rider or a driver asks every other region
+for its best candidate, and the regions search their own drivers or riders at
+once. The best candidate of all, the driver registered first or the rider
+waiting first on ties, is then moved to the region that asked. A driver
+matched with a rider of another region is handed off to that region together
+with the Pickup event, and a driver whose ride ends in another region is
+handed off to that region together with the Dropoff event that ends the ride.
+
+A match depends on the state of every region at the time of the event that
+asks for it, so the regions take turns: the region with the earliest event
+does its events until another region has an earlier one, or until it hands
+off an earlier one. Events with the same timestamp are done in the order in
+which they were scheduled, which their sequence records across all regions,
+as a Simulation would do them. The report is therefore the same for any
+number of regions, and the same as the one of a Simulation.
+"""
+import bisect
+import multiprocessing
+
+from container import TimeoutQueue
+from dispatcher import Dispatcher
+from event import DriverRequest, Dropoff, LazyRequest, Pickup
+from monitor import Monitor
+
+# The messages that the regions and the simulation exchange. A region is
+# told to run, or asked for its best candidate and then to give it up, and
+# asks for a driver or a rider in turn while it runs.
+_RUN = "run"
+_DONE = "done"
+_REQUEST_DRIVER = "request driver"
+_REQUEST_RIDER = "request rider"
+_OFFER_DRIVER = "offer driver"
+_OFFER_RIDER = "offer rider"
+_TAKE_DRIVER = "take driver"
+_TAKE_RIDER = "take rider"
+
+# The key of an event after every event.
+_END = (float("inf"), 0)
+
+
+class RegionMap:
+    """A partition of the grid into horizontal bands of rows.
+
+    === Attributes ===
+    @type rows: int
+        The number of rows in the grid.
+    @type regions: int
+        The number of regions the grid is split into.
+    """
+
+    def __init__(self, rows, regions):
+        """Initialize a RegionMap.
+
+        @type self: RegionMap
+        @type rows: int
+        @type regions: int
+        @rtype: None
+        """
+        self.rows, self.regions = rows, regions
+
+    def region_of(self, location):
+        """Return the region that <location> belongs to.
+
+        @type self: RegionMap
+        @type location: Location
+        @rtype: int
+
+        >>> from location import Location
+        >>> regions = RegionMap(10, 3)
+        >>> [regions.region_of(Location(row, 0)) for row in (0, 3, 4, 9, 12)]
+        [0, 0, 1, 2, 2]
+        """
+        return min(location.row * self.regions // self.rows,
+                   self.regions - 1)
+
+
+def _event_location(event):
+    """Return the location that decides which region owns <event>.
+
+    @type event: Event
+    @rtype: Location
+    """
+    if isinstance(event, DriverRequest):
+        return event.driver.location
+    if isinstance(event, Dropoff):
+        return event.rider.destination
+    return event.rider.origin
+
+
+
+
+def _key(event):
+    """Return the key that orders <event> among all events: its timestamp,
+    ties going to the event scheduled first.
+
+    @type event: Event
+    @rtype: (float, int)
+    """
+    return event.timestamp, event.sequence
+
+
+def _next_key(events):
+    """Return the key of the next event in <events>, or None if there are no
+    events left.
+
+    @type events: TimeoutQueue
+    @rtype: (float, int) | None
+    """
+    if events.is_empty():
+        return None
+    return _key(events.peek())
+
+
+class _RegionDispatcher(Dispatcher):
+    """The dispatcher of a single region, which matches its riders and
+    drivers with the ones of every region by asking the simulation for them.
+
+    === Attributes ===
+    @type now: (float, int) | None
+        The key of the event being done.
+    """
+
+    # === Private Attributes ===
+    # @type _connection: multiprocessing.connection.Connection
+    #     The connection to the simulation.
+    # @type _ranks: dict[str, int]
+    #     The rank of every registered driver, by id: the number of drivers
+    #     of the whole simulation that requested a rider before it first did.
+    #     driver_list is kept in order of rank.
+    #
+    # The waiting list maps every waiting rider to the key of the request
+    # that made them wait.
+
+    def __init__(self, connection):
+        """Initialize a _RegionDispatcher that asks the simulation for
+        drivers and riders over <connection>.
+
+        @type self: _RegionDispatcher
+        @type connection: multiprocessing.connection.Connection
+        @rtype: None
+        """
+        Dispatcher.__init__(self)
+        self._connection = connection
+        self._ranks = {}
+        self.now = None
+
+    def request_driver(self, rider):
+        """Return the driver of any region for the rider, or None if no
+        driver can reach them. Add the rider to the waiting list if there is
+        no driver.
+
+        @type self: _RegionDispatcher
+        @type rider: Rider
+        @rtype: Driver | None
+        """
+        driver = self.nearest_driver(rider.origin)
+        self._connection.send((_REQUEST_DRIVER, rider.origin,
+                               self._driver_offer(driver, rider.origin)))
+        driver = self._connection.recv() or driver
+        if driver is None:
+            self._wait(rider)
+        return driver
+
+    def request_rider(self, driver):
+        """Register the driver, if this is its first request in this region,
+        and return the waiting rider of any region for the driver, or None if
+        the driver cannot reach any of them.
+
+        A rider of another region is a copy, which the Pickup event of the
+        driver is handed off to that region with.
+
+        @type self: _RegionDispatcher
+        @type driver: Driver
+        @rtype: Rider | None
+        """
+        rider = self.first_rider(driver)
+        self._connection.send((_REQUEST_RIDER, driver,
+                               rider and self._waiting[rider]))
+        rank, other = self._connection.recv()
+        if driver.id not in self._ranks:
+            index = bisect.bisect([self._ranks[registered.id]
+                                   for registered in self.driver_list], rank)
+            self._ranks[driver.id] = rank
+            self._registered[id(driver)] = rank
+            self.driver_list.insert(index, driver)
+        if other is not None:
+            return other
+        if rider is not None:
+            del self._waiting[rider]
+        return rider
+
+    def unregister(self, driver):
+        """Unregister <driver>, if it is registered in this region.
+
+        @type self: _RegionDispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+        if self._ranks.pop(driver.id, None) is not None:
+            Dispatcher.unregister(self, driver)
+
+    def first_rider(self, driver):
+        """Return the rider that has waited the longest of the riders of this
+        region that <driver> can reach, or None if there is none. The rider
+        keeps waiting.
+
+        @type self: _RegionDispatcher
+        @type driver: Driver
+        @rtype: Rider | None
+        """
+        for rider in self._waiting:
+            if driver.get_travel_time(rider.origin) != float("inf"):
+                return rider
+        return None
+
+    def offer(self, message):
+        """Return the best candidate of this region for the request in
+        <message>: the travel time and rank of the driver nearest to a
+        location, or the key of the request of the rider that has waited the
+        longest for a driver. Return None if there is no candidate.
+
+        @type self: _RegionDispatcher
+        @type message: tuple
+        @rtype: (float, int) | None
+        """
+        if message[0] == _OFFER_DRIVER:
+            return self._driver_offer(self.nearest_driver(message[1]),
+                                      message[1])
+        rider = self.first_rider(message[1])
+        return rider and self._waiting[rider]
+
+    def take(self, message):
+        """Give up the best candidate of this region for the request in
+        <message>, and return it. A driver is unregistered, and a rider is
+        no longer waiting.
+
+        @type self: _RegionDispatcher
+        @type message: tuple
+        @rtype: Driver | Rider
+        """
+        if message[0] == _TAKE_DRIVER:
+            driver = self.nearest_driver(message[1])
+            self.unregister(driver)
+            return driver
+        rider = self.first_rider(message[1])
+        del self._waiting[rider]
+        return rider
+
+    def _driver_offer(self, driver, location):
+        """Return the travel time of <driver> to <location> and its rank, or
+        None if <driver> is None.
+
+        @type self: _RegionDispatcher
+        @type driver: Driver | None
+        @type location: Location
+        @rtype: (float, int) | None
+        """
+        if driver is None:
+            return None
+        return driver.get_travel_time(location), self._ranks[driver.id]
+
+    def _wait(self, rider):
+        """Add <rider> to the waiting list, under the key of the event being
+        done.
+
+        @type self: _RegionDispatcher
+        @type rider: Rider
+        @rtype: None
+        """
+        self._waiting[rider] = self.now
+
+
+def _region_worker(connection, region, region_map):
+    """Simulate a single region, taking orders from <connection>.
+
+    Every message is a tuple that starts with its kind, or None once the
+    simulation is over. A region told to run adds the events that arrived to
+    its event queue, and does every event before a bound key. It answers
+    with the events handed off to other regions, the key of its next event
+    and the next sequence. A region asked for a candidate answers with its
+    offer, or with the candidate it gives up. When the simulation is over,
+    the region answers with its monitor.
+
+    @type connection: multiprocessing.connection.Connection
+    @type region: int
+    @type region_map: RegionMap
+    @rtype: None
+    """
+    events = TimeoutQueue()
+    dispatcher = _RegionDispatcher(connection)
+    monitor = Monitor()
+    # The riders of this region that a driver of another region was matched
+    # with, by id, until the Pickup event of the driver arrives.
+    reserved = {}
+
+    message = connection.recv()
+    while message is not None:
+        if message[0] in (_OFFER_DRIVER, _OFFER_RIDER):
+            connection.send(dispatcher.offer(message))
+        elif message[0] == _TAKE_DRIVER:
+            connection.send(dispatcher.take(message))
+        elif message[0] == _TAKE_RIDER:
+            rider = dispatcher.take(message)
+            reserved[rider.id] = rider
+            connection.send(rider)
+        else:
+            _, bound, arrivals, sequence = message
+            for event in arrivals:
+                if isinstance(event, Pickup):
+                    event.rider = reserved.pop(event.rider.id)
+                event.handle = events.add(event, event.sequence)
+
+            handoffs = []
+            while not events.is_empty() and _key(events.peek()) < bound:
+                event = events.remove()
+                dispatcher.now = _key(event)
+                for new_event in event.do(dispatcher, monitor):
+                    new_event.sequence = sequence
+                    sequence += 1
+                    if (region_map.region_of(_event_location(new_event)) !=
+                            region):
+                        # The driver leaves this region with the event, which
+                        # may come before the next event of any other region.
+                        dispatcher.unregister(new_event.driver)
+                        handoffs.append(new_event)
+                        bound = min(bound, _key(new_event))
+                    else:
+                        new_event.handle = events.add(new_event,
+                                                      new_event.sequence)
+            connection.send((_DONE, handoffs, _next_key(events), sequence))
+        message = connection.recv()
+
+    connection.send(monitor)
+    connection.close()
+
+
+def _match(connections, region, message, ranks):
+    """Answer the request in <message> of the region <region> for a driver or
+    a rider, with the best candidate of every region.
+
+    A driver is ranked the first time it requests a rider, in <ranks>.
+
+    @type connections: list[multiprocessing.connection.Connection]
+    @type region: int
+    @type message: tuple
+    @type ranks: dict[str, int]
+    @rtype: None
+    """
+    kind, subject, best = message
+    if kind == _REQUEST_DRIVER:
+        query, take = (_OFFER_DRIVER, subject), (_TAKE_DRIVER, subject)
+    else:
+        query, take = (_OFFER_RIDER, subject), (_TAKE_RIDER, subject)
+        ranks.setdefault(subject.id, len(ranks))
+    others = [other for other in range(len(connections)) if other != region]
+    for other in others:
+        connections[other].send(query)
+
+    # The offers are never equal, since no two drivers have the same rank,
+    # and no two requests the same key.
+    winner = region
+    for other in others:
+        offer = connections[other].recv()
+        if offer is not None and (best is None or offer < best):
+            best, winner = offer, other
+    candidate = None
+    if winner != region:
+        connections[winner].send(take)
+        candidate = connections[winner].recv()
+
+    if kind == _REQUEST_DRIVER:
+        connections[region].send(candidate)
+    else:
+        connections[region].send((ranks[subject.id], candidate))
+
+
+class PartitionedSimulation:
+    """A simulation that is split into regions simulated in their own
+    processes.
+
+    The API is the same as the one of Simulation, and a PartitionedSimulation
+    gives the same report as a Simulation for any number of regions.
+    """
+
+    # === Private Attributes ===
+    # @type _regions: int
+    #     The number of regions, and therefore of worker processes.
+    # @type _monitor: Monitor
+    #     The monitors of all regions, merged once the simulation is over.
+
+    def __init__(self, regions):
+        """Initialize a PartitionedSimulation with <regions> regions.
+
+        @type self: PartitionedSimulation
+        @type regions: int
+        @rtype: None
+        """
+        self._regions = regions
+        self._monitor = Monitor()
+
+    def run(self, initial_events):
+        """Run the simulation on the list of events in <initial_events>.
+
+        Return a dictionary containing statistics of the simulation, merged
+        over all regions.
+
+        @type self: PartitionedSimulation
+        @type initial_events: list[Event]
+            An initial list of events.
+        @rtype: dict[str, object]
+
+        >>> from simulation import Simulation
+        >>> from event import create_event_list
+        >>> expected = Simulation().run(create_event_list("events.txt"))
+        >>> all(PartitionedSimulation(regions).run(
+        ...     create_event_list("events.txt")) == expected
+        ...     for regions in (1, 2, 3, 4))
+        True
+
+        A rider is matched with the nearest driver of any region, and a
+        driver with the rider of any region that has waited the longest.
+
+        >>> from event import parse_event_lines
+        >>> lines = ["0 DriverRequest D0 1,1 1", "0 DriverRequest D1 13,1 1",
+        ...          "1 RiderRequest R0 6,1 6,5 20",
+        ...          "2 RiderRequest R1 14,4 14,9 20",
+        ...          "3 RiderRequest R2 2,8 9,8 20",
+        ...          "5 DriverRequest D2 9,1 2"]
+        >>> expected = Simulation().run(parse_event_lines(lines))
+        >>> all(PartitionedSimulation(regions).run(parse_event_lines(lines)) ==
+        ...     expected for regions in (1, 2, 4))
+        True
+        """
+        # The regions of the events depend on their locations.
+        initial_events = [event.materialize() if isinstance(event, LazyRequest)
+                          else event for event in initial_events]
+        rows = 1 + max(_event_location(event).row
+                       for event in initial_events)
+        region_map = RegionMap(rows, self._regions)
+
+        # The initial events are scheduled first, in order, as a Simulation
+        # schedules them.
+        inboxes = [[] for _ in range(self._regions)]
+        for sequence, event in enumerate(initial_events):
+            event.sequence = sequence
+            inboxes[region_map.region_of(_event_location(event))].append(
+                event)
+        sequence = len(initial_events)
+
+        connections = []
+        workers = []
+        for region in range(self._regions):
+            parent, child = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_region_worker, args=(child, region, region_map),
+                daemon=True)
+            worker.start()
+            connections.append(parent)
+            workers.append(worker)
+
+        ranks = {}
+        next_keys = [None] * self._regions
+        while True:
+            heads = [(min([_key(event) for event in inboxes[region]] +
+                          ([] if next_keys[region] is None
+                           else [next_keys[region]])), region)
+                     for region in range(self._regions)
+                     if inboxes[region] or next_keys[region] is not None]
+            if not heads:
+                break
+            # The region with the earliest event runs until the earliest
+            # event of any other region.
+            first, region = min(heads)
+            bound = min([head for head, other in heads if other != region] +
+                        [_END])
+            connections[region].send((_RUN, bound, inboxes[region],
+                                      sequence))
+            inboxes[region] = []
+
+            message = connections[region].recv()
+            while message[0] != _DONE:
+                _match(connections, region, message, ranks)
+                message = connections[region].recv()
+            _, handoffs, next_keys[region], sequence = message
+            for event in handoffs:
+                inboxes[region_map.region_of(_event_location(event))].append(
+                    event)
+
+        for connection in connections:
+            connection.send(None)
+        for connection in connections:
+            self._monitor.merge(connection.recv())
+        for worker in workers:
+            worker.join()
+
+        return self._monitor.report()
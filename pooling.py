@@ -0,0 +1,620 @@
+"""Pooled Rides
+
+This module contains the PooledSimulation class, an engine in which a driver
+can carry several riders at once, and the Route and Pool classes it matches
+riders with.
+
+Every driver follows a route: the stop it is driving to, and an ordered list
+of the stops after it, each the pickup or the dropoff of a rider. A driver
+is committed to the stop it is driving to, and a new rider is inserted into
+the stops after it, at the pickup and dropoff positions that delay the end
+of the route the least, as long as:
+
+- no more riders than the capacity are ever on board at once,
+- every rider is picked up before their patience runs out, and
+- every rider is dropped off within a detour factor of their direct ride
+  time after the pickup planned when they were inserted. As later
+  insertions only ever delay a pickup, the ride time of a rider never
+  exceeds the detour factor times their direct ride time.
+
+Every route keeps the planned arrival time, the number of riders on board
+after, and the slack of every stop in typed arrays, where the slack of a
+stop is how long it and every stop after it can be delayed without missing
+a deadline. An insertion is checked against them without walking the stops
+it delays, so that evaluating every insertion into a route takes time
+quadratic in the number of its stops, which the capacity bounds. Only the
+routes whose next free location is close enough for the driver to reach
+the rider in time are evaluated, and these are found in a spatial index.
+
+A rider that cannot be inserted into any route waits, and is offered to
+every route that runs out of stops close enough to reach them in time, until
+their patience runs out and they cancel. The waiting riders are kept in a
+spatial index as well, so that a route is only offered the riders near it.
+A rider is evaluated against at most 32 routes by default, the nearest
+first. The reports of a PooledSimulation are those of a Simulation, and
+with a capacity of 1, drivers still queue up riders to pick up after their
+current ride.
+"""
+import heapq
+from array import array
+
+from event import DriverRequest, LazyRequest
+from location import travel_distance
+from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+from spatial import GridIndex
+
+# The codes of the kinds of events.
+_REQUEST = 0
+_ARRIVAL = 1
+_EXPIRY = 2
+
+
+class Route:
+    """The stops of a driver that carries several riders at once.
+
+    === Attributes ===
+    @type driver: Driver
+        The driver.
+    @type location: Location
+        The location of the stop the driver is driving to, or of the driver
+        if it has no stops.
+    @type ready: int | float
+        The time at which the driver arrives at <location>, or at which it
+        got there if it has no stops.
+    @type current: (Location, Rider, bool, float) | None
+        The stop the driver is driving to, or None.
+    @type stops: list[(Location, Rider, bool, float)]
+        The stops after the current one, in order. A stop is its location,
+        its rider, whether it is a pickup, and the latest time at which it
+        may be reached.
+    @type load: int
+        The number of riders on board after the current stop.
+    """
+
+    # === Private Attributes ===
+    # @type _times: array[float]
+    #     The planned arrival time at every stop after the current one.
+    # @type _loads: array[int]
+    #     The number of riders on board after every stop after the current
+    #     one.
+    # @type _slack: array[float]
+    #     How long every stop after the current one, and every stop after
+    #     it, can be delayed.
+
+    def __init__(self, driver, timestamp):
+        """Initialize a Route without stops for <driver> at <timestamp>.
+
+        @type self: Route
+        @type driver: Driver
+        @type timestamp: int | float
+        @rtype: None
+        """
+        self.driver = driver
+        self.location, self.ready = driver.location, timestamp
+        self.current = None
+        self.stops = []
+        self.load = 0
+        self._times, self._loads = array("d"), array("l")
+        self._slack = array("d")
+
+    def __len__(self):
+        """Return the number of stops of this route, including the current
+        one.
+
+        @type self: Route
+        @rtype: int
+        """
+        return len(self.stops) + (self.current is not None)
+
+    def best_insertion(self, rider, timestamp, capacity, detour):
+        """Return the delay to the end of this route, and the positions in
+        the stops after the current one, of the best insertion of the pickup
+        and the dropoff of <rider> at <timestamp>, or None if the rider
+        cannot be inserted. The dropoff is inserted after the pickup, so a
+        dropoff position equal to the pickup position drops the rider off
+        right after picking them up.
+
+        @type self: Route
+        @type rider: Rider
+        @type timestamp: int | float
+        @type capacity: int
+        @type detour: int | float
+        @rtype: (float, int, int) | None
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> route = Route(Driver("fire", Location(0, 0), 1), 0)
+        >>> kal = Rider("kal", Location(0, 2), Location(0, 10), 5, 0)
+        >>> route.best_insertion(kal, 0, 2, 1.5)
+        (10.0, 0, 0)
+        >>> route.insert(kal, 0, 0, 0, 1.5)
+        >>> bal = Rider("bal", Location(0, 4), Location(0, 8), 5, 0)
+        >>> route.best_insertion(bal, 0, 2, 1.5)
+        (0.0, 1, 1)
+        >>> route.best_insertion(bal, 0, 1, 1.5) is None
+        True
+        """
+        speed = self.driver.speed
+        start = max(self.ready, timestamp)
+        ride = _trip_distance(rider) / speed
+        pickup_deadline = rider.timestamp + rider.patience
+        stops, times, loads, slack = (self.stops, self._times, self._loads,
+                                      self._slack)
+        count = len(stops)
+        end = times[-1] if count else start
+        best = None
+        for i in range(count + 1):
+            if i == 0:
+                before, then, load = self.location, start, self.load
+            else:
+                before, then = stops[i - 1][0], times[i - 1]
+                load = loads[i - 1]
+            if load + 1 > capacity:
+                continue
+            pickup = then + travel_distance(before, rider.origin) / speed
+            if pickup > pickup_deadline:
+                continue
+            dropoff_deadline = pickup + detour * ride
+            # The rider is dropped off right after the pickup.
+            dropoff = pickup + ride
+            if i == count:
+                cost = dropoff - end
+            else:
+                cost = (dropoff + travel_distance(rider.destination,
+                                                  stops[i][0]) / speed -
+                        times[i])
+                if cost > slack[i]:
+                    cost = None
+            if cost is not None and (best is None or cost < best[0]):
+                best = (cost, i, i)
+            if i == count:
+                break
+            # The rider stays on board through stops i to j - 1.
+            delay = (pickup + travel_distance(rider.origin, stops[i][0]) /
+                     speed - times[i])
+            if delay > slack[i]:
+                continue
+            for j in range(i + 1, count + 1):
+                if loads[j - 1] + 1 > capacity:
+                    break
+                dropoff = (times[j - 1] + delay +
+                           travel_distance(stops[j - 1][0],
+                                           rider.destination) / speed)
+                if dropoff > dropoff_deadline:
+                    continue
+                if j == count:
+                    cost = dropoff - end
+                else:
+                    cost = (dropoff + travel_distance(rider.destination,
+                                                      stops[j][0]) / speed -
+                            times[j])
+                    if cost > slack[j]:
+                        continue
+                if best is None or cost < best[0]:
+                    best = (cost, i, j)
+        return best
+
+    def insert(self, rider, timestamp, pickup, dropoff, detour):
+        """Insert the pickup of <rider> at position <pickup> and the dropoff
+        at position <dropoff> of the stops after the current one, as found
+        by best_insertion at <timestamp>.
+
+        @type self: Route
+        @type rider: Rider
+        @type timestamp: int | float
+        @type pickup: int
+        @type dropoff: int
+        @type detour: int | float
+        @rtype: None
+        """
+        if self.current is None:
+            self.ready = max(self.ready, timestamp)
+        before = self.location if pickup == 0 else self.stops[pickup - 1][0]
+        then = self.ready if pickup == 0 else self._times[pickup - 1]
+        speed = self.driver.speed
+        planned = then + travel_distance(before, rider.origin) / speed
+        self.stops.insert(dropoff, (rider.destination, rider, False,
+                                    planned + detour *
+                                    _trip_distance(rider) / speed))
+        self.stops.insert(pickup, (rider.origin, rider, True,
+                                   rider.timestamp + rider.patience))
+        self.plan()
+
+    def advance(self):
+        """Make the first of the stops after the current one the current
+        stop, and return the distance to it.
+
+        Precondition: the route has stops after the current one.
+
+        @type self: Route
+        @rtype: int | float
+        """
+        stop = self.stops.pop(0)
+        distance = travel_distance(self.location, stop[0])
+        self.ready += distance / self.driver.speed
+        self.location, self.current = stop[0], stop
+        self.load += 1 if stop[2] else -1
+        self.plan()
+        return distance
+
+    def plan(self):
+        """Compute the planned arrival time, the load and the slack of every
+        stop after the current one.
+
+        @type self: Route
+        @rtype: None
+        """
+        speed = self.driver.speed
+        count = len(self.stops)
+        times, loads = array("d", [0]) * count, array("l", [0]) * count
+        location, then, load = self.location, self.ready, self.load
+        for position, stop in enumerate(self.stops):
+            then += travel_distance(location, stop[0]) / speed
+            load += 1 if stop[2] else -1
+            times[position], loads[position] = then, load
+            location = stop[0]
+        slack = array("d", [0]) * count
+        least = float("inf")
+        for position in range(count - 1, -1, -1):
+            least = min(least, self.stops[position][3] - times[position])
+            slack[position] = least
+        self._times, self._loads, self._slack = times, loads, slack
+
+
+class Pool:
+    """The routes of the drivers of pooled rides, indexed by the location
+    at which they next stop.
+
+    === Attributes ===
+    @type capacity: int
+        The most riders a driver carries at once.
+    @type detour: int | float
+        How many times their direct ride time a ride may take.
+    @type max_candidates: int | None
+        The most routes a rider is evaluated against, the nearest first, or
+        None for no limit.
+    @type evaluated: int
+        The number of routes riders have been evaluated against so far.
+    """
+
+    # === Private Attributes ===
+    # @type _routes: dict[int, Route]
+    #     The route of every driver, by id() of the driver.
+    # @type _index: GridIndex
+    #     The routes at the location at which they next stop, scaled by the
+    #     inverse of the speed of their driver.
+
+    def __init__(self, capacity=4, detour=1.5, max_candidates=32):
+        """Initialize an empty Pool.
+
+        @type self: Pool
+        @type capacity: int
+        @type detour: int | float
+        @type max_candidates: int | None
+        @rtype: None
+        """
+        self.capacity, self.detour = capacity, detour
+        self.max_candidates = max_candidates
+        self.evaluated = 0
+        self._routes = {}
+        self._index = GridIndex()
+
+    def __len__(self):
+        """Return the number of routes of this Pool.
+
+        @type self: Pool
+        @rtype: int
+        """
+        return len(self._routes)
+
+    def route_of(self, driver, timestamp):
+        """Return the route of <driver>, with a new route without stops at
+        <timestamp> if the driver has none.
+
+        @type self: Pool
+        @type driver: Driver
+        @type timestamp: int | float
+        @rtype: Route
+        """
+        route = self._routes.get(id(driver))
+        if route is None:
+            route = self._routes[id(driver)] = Route(driver, timestamp)
+            self.move(route)
+        return route
+
+    def move(self, route):
+        """Update the index of <route>, after its next stop changed.
+
+        @type self: Pool
+        @type route: Route
+        @rtype: None
+        """
+        self._index.remove(route)
+        self._index.add(route, route.location, scale=1 / route.driver.speed)
+
+    def match(self, rider, timestamp, routes=None):
+        """Insert <rider> at <timestamp> into the route, out of <routes>, or
+        out of the routes that can reach the rider in time if <routes> is
+        None, whose end it delays the least. Return the route, or None if
+        the rider cannot be inserted into any of them.
+
+        @type self: Pool
+        @type rider: Rider
+        @type timestamp: int | float
+        @type routes: list[Route] | None
+        @rtype: Route | None
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> pool = Pool(2)
+        >>> fire = pool.route_of(Driver("fire", Location(0, 0), 1), 0)
+        >>> ice = pool.route_of(Driver("ice", Location(0, 20), 1), 0)
+        >>> kal = Rider("kal", Location(0, 2), Location(0, 10), 5, 0)
+        >>> pool.match(kal, 0).driver.id
+        'fire'
+        >>> bal = Rider("bal", Location(0, 4), Location(0, 8), 5, 0)
+        >>> pool.match(bal, 0).driver.id, len(fire), pool.evaluated
+        ('fire', 4, 2)
+        >>> cal = Rider("cal", Location(0, 19), Location(0, 8), 0, 0)
+        >>> pool.match(cal, 0) is None
+        True
+        """
+        if routes is None:
+            # No driver reaches the rider sooner than the distance to them
+            # from the location at which it next stops.
+            routes = self._index.within(
+                rider.origin, rider.timestamp + rider.patience - timestamp,
+                self.max_candidates)
+        self.evaluated += len(routes)
+        best, best_route = None, None
+        for route in routes:
+            insertion = route.best_insertion(rider, timestamp, self.capacity,
+                                             self.detour)
+            if insertion is not None and (best is None or
+                                          insertion[0] < best[0]):
+                best, best_route = insertion, route
+        if best_route is not None:
+            best_route.insert(rider, timestamp, best[1], best[2], self.detour)
+        return best_route
+
+
+class PooledSimulation:
+    """A simulation in which drivers carry several riders at once."""
+
+    # === Private Attributes ===
+    # @type _monitor: Monitor
+    #     The monitor of the simulation.
+    # @type _pool: Pool
+    #     The routes of the drivers.
+    # @type _heap: list[(float, int, int, object)]
+    #     The timestamp, sequence, kind and subject of every pending event:
+    #     the input event of a request, the route of an arrival, or the rider
+    #     of an expiry.
+    # @type _sequence: int
+    #     The number of events scheduled so far.
+    # @type _waiting: dict[int, (int, Rider)]
+    #     The number of every rider waiting to be inserted into a route, in
+    #     the order they started to wait, and the rider, by id(), longest
+    #     waiting first.
+    # @type _waiting_index: GridIndex
+    #     The riders waiting to be inserted into a route, at their origins.
+    # @type _waits: int
+    #     The number of riders that have started to wait so far.
+    # @type _deadline: int | float
+    #     A time by which every waiting rider runs out of patience.
+
+    def __init__(self, capacity=4, detour=1.5, max_candidates=32):
+        """Initialize a PooledSimulation.
+
+        @type self: PooledSimulation
+        @type capacity: int
+            The most riders a driver carries at once.
+        @type detour: int | float
+            How many times their direct ride time a ride may take.
+        @type max_candidates: int | None
+            The most routes a rider is evaluated against, or None.
+        @rtype: None
+        """
+        self._monitor = Monitor()
+        self._pool = Pool(capacity, detour, max_candidates)
+        self._heap = []
+        self._sequence = 0
+        self._waiting = {}
+        self._waiting_index = GridIndex()
+        self._waits = 0
+        self._deadline = 0
+
+    def run(self, initial_events):
+        """Run the simulation on the list of events in <initial_events>.
+
+        Return a dictionary containing statistics of the simulation,
+        according to the specifications in the assignment handout.
+
+        Precondition: every event of <initial_events> is a RiderRequest, a
+        DriverRequest or a LazyRequest.
+
+        @type self: PooledSimulation
+        @type initial_events: list[Event]
+        @rtype: dict[str, object]
+
+        >>> from event import create_event_list
+        >>> PooledSimulation(1).run(create_event_list("events.txt"))
+        {'rider_wait_time': 0.5, 'driver_total_distance': 4.166666666666667, 'driver_ride_distance': 3.8333333333333335}
+        """
+        for event in initial_events:
+            if isinstance(event, LazyRequest):
+                event = event.materialize()
+            self._schedule(event.timestamp, _REQUEST, event)
+        heap = self._heap
+        while heap:
+            timestamp, _, kind, subject = heapq.heappop(heap)
+            if kind == _REQUEST:
+                if isinstance(subject, DriverRequest):
+                    self._driver_request(timestamp, subject.driver)
+                else:
+                    self._rider_request(timestamp, subject.rider)
+            elif kind == _ARRIVAL:
+                self._arrival(timestamp, subject)
+            else:
+                self._expiry(timestamp, subject)
+        return self._monitor.report()
+
+    def report(self):
+        """Return a dictionary containing statistics of the simulation so far.
+
+        @type self: PooledSimulation
+        @rtype: dict[str, object]
+        """
+        return self._monitor.report()
+
+    def _schedule(self, timestamp, kind, subject):
+        """Schedule an event of <kind> for <subject> at <timestamp>.
+
+        @type self: PooledSimulation
+        @type timestamp: int | float
+        @type kind: int
+        @type subject: object
+        @rtype: None
+        """
+        heapq.heappush(self._heap, (timestamp, self._sequence, kind, subject))
+        self._sequence += 1
+
+    def _driver_request(self, timestamp, driver):
+        """Add the route of <driver>, and offer it the waiting riders.
+
+        @type self: PooledSimulation
+        @type timestamp: int | float
+        @type driver: Driver
+        @rtype: None
+        """
+        self._monitor.notify(timestamp, DRIVER, REQUEST, driver.id,
+                             driver.location)
+        route = self._pool.route_of(driver, timestamp)
+        if route.current is None:
+            self._offer(timestamp, route)
+
+    def _rider_request(self, timestamp, rider):
+        """Insert <rider> into a route, or have them wait until their
+        patience runs out.
+
+        @type self: PooledSimulation
+        @type timestamp: int | float
+        @type rider: Rider
+        @rtype: None
+        """
+        self._monitor.notify(timestamp, RIDER, REQUEST, rider.id,
+                             rider.origin)
+        route = self._pool.match(rider, timestamp)
+        if route is None:
+            deadline = rider.timestamp + rider.patience
+            self._waiting[id(rider)] = (self._waits, rider)
+            self._waiting_index.add(rider, rider.origin)
+            self._waits += 1
+            self._deadline = max(self._deadline, deadline)
+            self._schedule(deadline, _EXPIRY, rider)
+        else:
+            self._start(timestamp, route)
+
+    def _arrival(self, timestamp, route):
+        """Serve the stop <route> has arrived at, and drive on to the next
+        one, or offer the route the waiting riders if it has no more stops.
+
+        @type self: PooledSimulation
+        @type timestamp: int | float
+        @type route: Route
+        @rtype: None
+        """
+        location, rider, is_pickup, _ = route.current
+        driver = route.driver
+        driver.location = location
+        route.current = None
+        if is_pickup:
+            rider.picked_up = True
+            self._monitor.notify(timestamp, RIDER, PICKUP, rider.id, location)
+            self._monitor.notify(timestamp, DRIVER, PICKUP, driver.id,
+                                 location)
+        else:
+            rider.satisfied()
+            self._monitor.notify(timestamp, DRIVER, DROPOFF, driver.id,
+                                 location)
+            self._monitor.notify(timestamp, RIDER, DROPOFF, rider.id,
+                                 location)
+        if route.stops:
+            self._start(timestamp, route)
+        else:
+            self._monitor.notify(timestamp, DRIVER, REQUEST, driver.id,
+                                 location)
+            self._offer(timestamp, route)
+
+    def _expiry(self, timestamp, rider):
+        """Cancel the request of <rider> if they are still waiting.
+
+        @type self: PooledSimulation
+        @type timestamp: int | float
+        @type rider: Rider
+        @rtype: None
+        """
+        if self._waiting.pop(id(rider), None) is not None:
+            self._waiting_index.remove(rider)
+            rider.cancel()
+            self._monitor.notify(timestamp, RIDER, CANCEL, rider.id,
+                                 rider.origin)
+
+    def _offer(self, timestamp, route):
+        """Insert the waiting riders that fit into <route>, longest waiting
+        first, and start the route if any does.
+
+        Only the riders close enough for the driver of the route to reach
+        them before the latest deadline of any waiting rider are tried.
+
+        Precondition: <route> has no stops.
+
+        @type self: PooledSimulation
+        @type timestamp: int | float
+        @type route: Route
+        @rtype: None
+        """
+        if self._waiting:
+            waiting = self._waiting
+            riders = self._waiting_index.within(
+                route.location,
+                route.driver.speed * (self._deadline - timestamp))
+            riders.sort(key=lambda rider: waiting[id(rider)][0])
+            for rider in riders:
+                if len(route) >= 2 * self._pool.capacity:
+                    break
+                if self._pool.match(rider, timestamp, [route]) is not None:
+                    del waiting[id(rider)]
+                    self._waiting_index.remove(rider)
+        if route.stops:
+            self._start(timestamp, route)
+
+    def _start(self, timestamp, route):
+        """Have the driver of <route> drive to its next stop, if it is not
+        driving to one already.
+
+        @type self: PooledSimulation
+        @type timestamp: int | float
+        @type route: Route
+        @rtype: None
+        """
+        if route.current is not None:
+            return
+        riding = route.load > 0
+        distance = route.advance()
+        self._monitor.notify_leg(timestamp, route.driver.id, distance,
+                                 route.ready - timestamp, riding)
+        self._pool.move(route)
+        self._schedule(route.ready, _ARRIVAL, route)
+
+
+def _trip_distance(rider):
+    """Return the travel distance from the origin to the destination of
+    <rider>.
+
+    @type rider: Rider
+    @rtype: int | float
+    """
+    return rider.ride_distance()
@@ -0,0 +1,344 @@
+"""Real-time Simulation
+
+This module contains the RealTimeSimulation class, which runs the dispatcher
+and the events of the simulation against live requests instead of a list of
+events read from a file.
+
+Simulated time is tied to the clock of an asyncio event loop. A request is
+done as soon as it arrives, with the current simulated time as its
+timestamp, and every event it spawns is scheduled as a timer on the event
+loop for the wall-clock time that matches its timestamp.
+
+Requests come either from an in-process asyncio.Queue, or from a local TCP
+socket, one line per request in the format of the event files. The leading
+timestamp of such a line is ignored. Every request is answered with the
+driver or rider it was assigned, if any.
+
+Run this module to serve a local socket and measure it with a load
+generator client.
+"""
+import asyncio
+import time
+import weakref
+
+from event import DriverRequest, Pickup, parse_event_lines
+from dispatcher import Dispatcher
+from monitor import Monitor
+
+
+class RealTimeSimulation:
+    """A simulation that answers live requests.
+
+    === Attributes ===
+    @type requests: int
+        The number of requests answered.
+    @type slo_misses: int
+        The number of requests that took longer than the latency SLO to
+        answer.
+    @type max_latency: float
+        The longest time in seconds it took to answer a request.
+    """
+
+    # === Private Attributes ===
+    # @type _dispatcher: Dispatcher
+    #     The dispatcher associated with the simulation.
+    # @type _monitor: Monitor
+    #     The monitor associated with the simulation.
+    # @type _scale: float
+    #     The number of wall-clock seconds per unit of simulated time.
+    # @type _slo: float
+    #     The latency SLO in seconds.
+    # @type _loop: asyncio.AbstractEventLoop | None
+    #     The event loop of the simulation, once it is serving.
+    # @type _origin: float
+    #     The time of the event loop clock at simulated time 0.
+    # @type _timers: weakref.WeakSet[asyncio.TimerHandle]
+    #     The timers of the scheduled events, which the event loop keeps
+    #     until they are done or cancelled.
+
+    def __init__(self, time_scale=1.0, slo=0.005):
+        """Initialize a RealTimeSimulation.
+
+        @type self: RealTimeSimulation
+        @type time_scale: float
+            The number of wall-clock seconds per unit of simulated time.
+        @type slo: float
+            The latency SLO in seconds.
+        @rtype: None
+        """
+        self._dispatcher = Dispatcher()
+        self._monitor = Monitor()
+        self._scale, self._slo = time_scale, slo
+        self._loop = None
+        self._origin = 0.0
+        self._timers = weakref.WeakSet()
+        self.requests = 0
+        self.slo_misses = 0
+        self.max_latency = 0.0
+
+    def now(self):
+        """Return the current simulated time.
+
+        @type self: RealTimeSimulation
+        @rtype: float
+        """
+        return (self._loop.time() - self._origin) / self._scale
+
+    def submit(self, event):
+        """Do the request <event> now, and return the answer to it.
+
+        The answer names the actor of the request, followed by either the
+        identifier of the driver or rider it was assigned, or "waiting".
+
+        Precondition: the simulation is serving, and <event> is a
+        RiderRequest or a DriverRequest.
+
+        @type self: RealTimeSimulation
+        @type event: RiderRequest | DriverRequest
+        @rtype: str
+        """
+        event.timestamp = self.now()
+        if isinstance(event, DriverRequest):
+            actor = event.driver.id
+        else:
+            actor = event.rider.id
+            event.rider.timestamp = event.timestamp
+
+        match = "waiting"
+        for new_event in event.do(self._dispatcher, self._monitor):
+            if isinstance(new_event, Pickup):
+                match = (new_event.rider.id if isinstance(event, DriverRequest)
+                         else new_event.driver.id)
+            self._schedule(new_event)
+        return "{} {}".format(actor, match)
+
+    def report(self):
+        """Return a dictionary containing statistics of the simulation so
+        far, and of the latency of the answers.
+
+        @type self: RealTimeSimulation
+        @rtype: dict[str, object]
+        """
+        report = self._monitor.report()
+        report.update(requests=self.requests, slo_misses=self.slo_misses,
+                      max_latency=self.max_latency)
+        return report
+
+    async def serve_queue(self, queue):
+        """Answer the requests put on <queue> until None is put on it, and
+        then close the simulation.
+
+        Every item of the queue is a pair of a request event and a future,
+        which is given the answer to the request.
+
+        @type self: RealTimeSimulation
+        @type queue: asyncio.Queue
+        @rtype: None
+
+        >>> from event import create_event_list
+        >>> async def main():
+        ...     sim = RealTimeSimulation(time_scale=0.001)
+        ...     queue = asyncio.Queue()
+        ...     serving = asyncio.ensure_future(sim.serve_queue(queue))
+        ...     answers = []
+        ...     for event in create_event_list("events.txt")[:7]:
+        ...         answer = asyncio.get_running_loop().create_future()
+        ...         await queue.put((event, answer))
+        ...         answers.append(await answer)
+        ...     await queue.put(None)
+        ...     await serving
+        ...     return answers, sim.requests
+        >>> answers, requests = asyncio.run(main())
+        >>> answers[-1], requests
+        ('Almond Amaranth', 7)
+        """
+        self._start()
+        item = await queue.get()
+        while item is not None:
+            event, answer = item
+            start = time.perf_counter()
+            answer.set_result(self.submit(event))
+            self._record(time.perf_counter() - start)
+            item = await queue.get()
+        self.close()
+
+    async def serve(self, host="127.0.0.1", port=0):
+        """Start serving requests on a local TCP socket and return the
+        asyncio Server.
+
+        @type self: RealTimeSimulation
+        @type host: str
+        @type port: int
+            The port to listen on, or 0 for any free port.
+        @rtype: asyncio.AbstractServer
+        """
+        self._start()
+        return await asyncio.start_server(self._handle, host, port)
+
+    def close(self):
+        """Stop the simulation, by cancelling the timers of every event that
+        is still scheduled.
+
+        @type self: RealTimeSimulation
+        @rtype: None
+        """
+        for timer in list(self._timers):
+            timer.cancel()
+        self._timers.clear()
+
+    async def _handle(self, reader, writer):
+        """Answer the requests of a single client connection.
+
+        A request that cannot be parsed is answered with a line that starts
+        with "error", and the connection keeps being served.
+
+        @type self: RealTimeSimulation
+        @type reader: asyncio.StreamReader
+        @type writer: asyncio.StreamWriter
+        @rtype: None
+
+        >>> async def main():
+        ...     sim = RealTimeSimulation(time_scale=0.001)
+        ...     server = await sim.serve()
+        ...     port = server.sockets[0].getsockname()[1]
+        ...     reader, writer = await asyncio.open_connection("127.0.0.1",
+        ...                                                   port)
+        ...     answers = []
+        ...     for line in ["garbage", "0 RiderRequest kal 1,1",
+        ...                  "0 Teleport kal", "0 DriverRequest fire 1,1 1"]:
+        ...         writer.write(line.encode() + b"\\n")
+        ...         answers.append((await reader.readline()).decode().strip())
+        ...     writer.close()
+        ...     await writer.wait_closed()
+        ...     server.close()
+        ...     await server.wait_closed()
+        ...     sim.close()
+        ...     return answers
+        >>> for answer in asyncio.run(main()): print(answer)
+        error invalid literal for int() with base 10: 'garbage'
+        error list index out of range
+        error unknown event type: Teleport
+        fire waiting
+        """
+        line = await reader.readline()
+        while line:
+            start = time.perf_counter()
+            try:
+                events = parse_event_lines([line.decode()])
+                if not events:
+                    raise ValueError("no request")
+            except (ValueError, IndexError) as error:
+                # A malformed request is answered, and the connection kept.
+                writer.write("error {}\n".format(error).encode())
+            else:
+                writer.write(self.submit(events[0]).encode() + b"\n")
+                self._record(time.perf_counter() - start)
+            await writer.drain()
+            line = await reader.readline()
+        writer.close()
+
+    def _start(self):
+        """Tie simulated time 0 to the current time of the running event
+        loop, unless the simulation is already serving.
+
+        @type self: RealTimeSimulation
+        @rtype: None
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._origin = self._loop.time()
+
+    def _schedule(self, event):
+        """Schedule <event> to be done at the wall-clock time matching its
+        timestamp.
+
+        An event that is already due is done right away, so that no request
+        can slip in between an event and the events it spawns for the same
+        time, such as a Dropoff and the DriverRequest that follows it.
+
+        @type self: RealTimeSimulation
+        @type event: Event
+        @rtype: None
+        """
+        when = self._origin + event.timestamp * self._scale
+        if when <= self._loop.time():
+            self._fire(event)
+        else:
+            event.handle = self._loop.call_at(when, self._fire, event)
+            self._timers.add(event.handle)
+
+    def _fire(self, event):
+        """Do the scheduled event <event>, and schedule the events it spawns.
+
+        @type self: RealTimeSimulation
+        @type event: Event
+        @rtype: None
+        """
+        for new_event in event.do(self._dispatcher, self._monitor):
+            self._schedule(new_event)
+
+    def _record(self, latency):
+        """Record that a request was answered in <latency> seconds.
+
+        @type self: RealTimeSimulation
+        @type latency: float
+        @rtype: None
+        """
+        self.requests += 1
+        if latency > self._slo:
+            self.slo_misses += 1
+        self.max_latency = max(self.max_latency, latency)
+
+
+async def load_client(host, port, lines, connections=8):
+    """Send the request <lines> to the server at <host> and <port> over
+    <connections> connections, and return the number of requests answered
+    per second and the latencies in seconds, sorted.
+
+    Every connection sends its next request as soon as the previous one has
+    been answered.
+
+    @type host: str
+    @type port: int
+    @type lines: list[str]
+    @type connections: int
+    @rtype: (float, list[float])
+    """
+    latencies = []
+
+    async def connection(share):
+        reader, writer = await asyncio.open_connection(host, port)
+        for line in share:
+            start = time.perf_counter()
+            writer.write(line.encode() + b"\n")
+            await reader.readline()
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[connection(lines[number::connections])
+                           for number in range(connections)])
+    return len(lines) / (time.perf_counter() - start), sorted(latencies)
+
+
+async def _main():
+    """Serve a local socket and measure it with the load generator client.
+
+    @rtype: None
+    """
+    from benchmark import random_trace
+
+    sim = RealTimeSimulation(time_scale=0.001)
+    server = await sim.serve()
+    port = server.sockets[0].getsockname()[1]
+    throughput, latencies = await load_client(
+        "127.0.0.1", port, random_trace(200, 20000, 100, 100, 1))
+    server.close()
+    sim.close()
+    print("{:.0f} requests/s, p50 {:.2f}ms, p99 {:.2f}ms, {} SLO misses".format(
+        throughput, 1000 * latencies[len(latencies) // 2],
+        1000 * latencies[len(latencies) * 99 // 100], sim.slo_misses))
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
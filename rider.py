@@ -1,4 +1,4 @@
-from location import Location
+from location import Location, distance_backend, travel_distance
 
 """
 The rider module contains the Rider class. It also contains
@@ -36,7 +36,13 @@ class Rider:
         self.destination, self.patience = destination, patience
         self.status = WAITING
         self.picked_up = False
+        self.cancellation = None
         self.timestamp = timestamp
+        # The travel distance from origin to destination, if it was computed
+        # when the rider was loaded, and the distance backend it was
+        # computed with.
+        self.trip_distance = None
+        self.trip_backend = None
 
     def __str__(self):
         """
@@ -59,6 +65,54 @@ class Rider:
                                                                 self.status,
                                                                 self.timestamp)
 
+    def ride_distance(self):
+        """
+        Returns the travel distance from the origin to the destination of
+        Rider self, under the current distance backend.
+
+        A distance computed when the rider was loaded is only used if it was
+        computed with the current distance backend.
+
+        @type self: Rider
+        @rtype: int | float
+
+        >>> from location import set_distance_backend
+        >>> kal = Rider("kal", Location(5,2), Location(3,2), 5, 3)
+        >>> kal.ride_distance()
+        2
+        >>> set_distance_backend(lambda origin, destination: 7)
+        >>> kal.ride_distance()
+        7
+        >>> set_distance_backend(None)
+        >>> kal.ride_distance()
+        2
+        """
+        backend = distance_backend()
+        if self.trip_distance is None or self.trip_backend is not backend:
+            self.trip_distance = travel_distance(self.origin,
+                                                 self.destination)
+            self.trip_backend = backend
+        return self.trip_distance
+
+    def __getstate__(self):
+        """
+        Returns the state of Rider self to pickle, without its trip distance,
+        since the distance backend it was computed with is not pickled.
+
+        @type self: Rider
+        @rtype: dict
+
+        >>> import pickle
+        >>> kal = Rider("kal", Location(5,2), Location(3,2), 5, 3)
+        >>> kal.ride_distance()
+        2
+        >>> pickle.loads(pickle.dumps(kal)).trip_distance is None
+        True
+        """
+        state = self.__dict__.copy()
+        state["trip_distance"] = state["trip_backend"] = None
+        return state
+
     def cancel(self):
         """
         Sets the status of the rider to cancelled
@@ -0,0 +1,499 @@
+"""Road Graph
+
+This module contains the RoadGraph class, which models the streets of a city
+laid out on the grid of the simulation, and the distance oracles that answer
+travel distance queries on it.
+
+A city map has one line per row of the grid and one character per column:
+
+    .   an open cell
+    #   a blocked cell, such as a building or the river
+    >   an open cell that cannot be left going west (towards column 0)
+    <   an open cell that cannot be left going east
+    v   an open cell that cannot be left going north (towards row 0)
+    ^   an open cell that cannot be left going south
+
+Drivers move between neighbouring open cells, one cell per unit of distance.
+A search over the graph for every travel time would be far too slow for the
+dispatcher, so distances are answered by an oracle that is built once:
+
+    MatrixOracle    holds the distance between every pair of cells in an
+                    array of 16-bit integers, which can be stored in a file
+                    and memory-mapped by later runs. For small grids.
+    LandmarkOracle  holds the distances to and from a few landmark cells,
+                    which bound any distance from below in constant time,
+                    finds exact distances by searches that these bounds
+                    guide towards the destination, and caches the most
+                    recent exact distances. For large grids.
+
+An oracle is called with an origin and a destination Location, and can be
+installed with location.set_distance_backend. The dispatcher compares the
+travel times of drivers by the lower bounds of a LandmarkOracle first, and
+only asks for the exact distances of the drivers whose bounds could beat the
+nearest driver found so far.
+"""
+import hashlib
+import heapq
+import mmap
+import os
+from array import array
+from collections import OrderedDict, deque
+from operator import sub
+
+from location import Location
+
+# The distance stored by a search of a RoadGraph for a cell that cannot be
+# reached, in an array of 32-bit integers, so that paths of any length fit.
+UNREACHABLE = 0xFFFFFFFF
+
+# The distance stored by a MatrixOracle for a cell that cannot be reached, in
+# an array of 16-bit integers.
+MATRIX_UNREACHABLE = 0xFFFF
+
+# The largest number of cells for which RoadGraph.oracle builds a
+# MatrixOracle, which takes 2 bytes for every pair of cells, as no distance
+# between them reaches MATRIX_UNREACHABLE.
+MATRIX_LIMIT = 4096
+
+# The distance to or from a landmark stored by a LandmarkOracle for a cell
+# that cannot be reached, far beyond any distance that can.
+_FAR = 1 << 30
+
+# The moves between neighbouring cells, by the arrow that forbids them.
+_MOVES = {">": (0, -1), "<": (0, 1), "v": (-1, 0), "^": (1, 0)}
+
+
+class RoadGraph:
+    """The streets of a city, as a directed graph over the cells of a grid.
+
+    === Attributes ===
+    @type rows: int
+        The number of rows of the grid.
+    @type columns: int
+        The number of columns of the grid.
+    """
+
+    # === Private Attributes ===
+    # @type _map: list[str]
+    #     The city map, with one string of length columns for every row.
+    # @type _successors: list[tuple[int]]
+    #     The cells that can be reached in one move from every cell.
+    # @type _predecessors: list[tuple[int]]
+    #     The cells from which every cell can be reached in one move.
+
+    def __init__(self, city_map):
+        """Initialize a RoadGraph from the lines of <city_map>.
+
+        Lines shorter than the longest line are padded with open cells.
+
+        @type self: RoadGraph
+        @type city_map: list[str]
+        @rtype: None
+        """
+        lines = [line.rstrip("\n") for line in city_map]
+        self.rows = len(lines)
+        self.columns = max([len(line) for line in lines], default=0)
+        self._map = [line.ljust(self.columns, ".") for line in lines]
+
+        successors = [[] for _ in range(self.rows * self.columns)]
+        predecessors = [[] for _ in range(self.rows * self.columns)]
+        for row, line in enumerate(self._map):
+            for column, cell in enumerate(line):
+                if cell == "#":
+                    continue
+                forbidden = _MOVES.get(cell)
+                for move in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                    other_row, other_column = row + move[0], column + move[1]
+                    if (move != forbidden and 0 <= other_row < self.rows and
+                            0 <= other_column < self.columns and
+                            self._map[other_row][other_column] != "#"):
+                        start = row * self.columns + column
+                        end = other_row * self.columns + other_column
+                        successors[start].append(end)
+                        predecessors[end].append(start)
+        self._successors = [tuple(cells) for cells in successors]
+        self._predecessors = [tuple(cells) for cells in predecessors]
+
+    @classmethod
+    def from_map(cls, filename):
+        """Return the RoadGraph of the city map in the file <filename>.
+
+        @type cls: type
+        @type filename: str
+        @rtype: RoadGraph
+        """
+        with open(filename) as file:
+            return cls(file.readlines())
+
+    def cell(self, location):
+        """Return the number of the cell at <location>.
+
+        Precondition: <location> is on the grid.
+
+        @type self: RoadGraph
+        @type location: Location
+        @rtype: int
+        """
+        return location.row * self.columns + location.column
+
+    def digest(self):
+        """Return a digest of the city map of this graph.
+
+        @type self: RoadGraph
+        @rtype: bytes
+        """
+        return hashlib.sha256("\n".join(self._map).encode()).digest()
+
+    def distances_from(self, cell):
+        """Return the distance from <cell> to every cell.
+
+        @type self: RoadGraph
+        @type cell: int
+        @rtype: array[int]
+        """
+        return self._search(cell, self._successors)
+
+    def distances_to(self, cell):
+        """Return the distance from every cell to <cell>.
+
+        @type self: RoadGraph
+        @type cell: int
+        @rtype: array[int]
+
+        >>> graph = RoadGraph(["...", ".#.", "..."])
+        >>> list(graph.distances_to(0)) == [0, 1, 2, 1, UNREACHABLE, 3, 2, 3, 4]
+        True
+        >>> one_way = RoadGraph([">>>"])
+        >>> list(one_way.distances_to(0))[1:] == [UNREACHABLE] * 2
+        True
+        >>> list(one_way.distances_from(0))
+        [0, 1, 2]
+        >>> snake = RoadGraph(["." * 370 if row % 2 == 0 else
+        ...                    "#" * 369 + "." if row % 4 == 1 else
+        ...                    "." + "#" * 369 for row in range(370)])
+        >>> snake.distances_from(0)[370 * 370 - 1]
+        68634
+        >>> LandmarkOracle(snake, 1)(Location(0, 0), Location(369, 369))
+        68634
+        """
+        return self._search(cell, self._predecessors)
+
+    def oracle(self, filename=None):
+        """Return a distance oracle for this graph: a MatrixOracle if the
+        grid is small enough, stored in <filename> if it is not None, and a
+        LandmarkOracle otherwise.
+
+        @type self: RoadGraph
+        @type filename: str | None
+        @rtype: MatrixOracle | LandmarkOracle
+        """
+        if self.rows * self.columns <= MATRIX_LIMIT:
+            return MatrixOracle(self, filename)
+        return LandmarkOracle(self)
+
+    def _search(self, cell, neighbours, typecode="I",
+                unreachable=UNREACHABLE):
+        """Return the number of moves from <cell> to every cell, following
+        the moves in <neighbours>, in an array of <typecode>, with
+        <unreachable> for the cells that cannot be reached.
+
+        @type self: RoadGraph
+        @type cell: int
+        @type neighbours: list[tuple[int]]
+        @type typecode: str
+        @type unreachable: int
+        @rtype: array[int]
+        """
+        distances = array(typecode, [unreachable]) * (self.rows * self.columns)
+        distances[cell] = 0
+        frontier = deque([cell])
+        while frontier:
+            current = frontier.popleft()
+            distance = distances[current] + 1
+            for other in neighbours[current]:
+                if distances[other] == unreachable:
+                    distances[other] = distance
+                    frontier.append(other)
+        return distances
+
+
+class MatrixOracle:
+    """The distance between every pair of cells of a RoadGraph."""
+
+    # === Private Attributes ===
+    # @type _graph: RoadGraph
+    #     The graph of the distances.
+    # @type _distances: array[int] | memoryview
+    #     The distance from every cell to every cell, row by row: the
+    #     distance from cell a to cell b is at a * cells + b.
+    # @type _map: mmap.mmap | None
+    #     The memory-mapped file of the distances, if there is one.
+
+    # The number of bytes of the header of a distance file, which holds the
+    # digest of its city map.
+    _HEADER = 32
+
+    def __init__(self, graph, filename=None):
+        """Initialize a MatrixOracle for <graph>.
+
+        If <filename> is not None, the distances are memory-mapped from that
+        file, after it is written, unless it already holds the distances of
+        the same city map.
+
+        @type self: MatrixOracle
+        @type graph: RoadGraph
+        @type filename: str | None
+        @rtype: None
+
+        >>> graph = RoadGraph(["...", ".#.", "..."])
+        >>> oracle = MatrixOracle(graph)
+        >>> oracle(Location(0, 1), Location(2, 1))
+        4
+        >>> oracle(Location(0, 0), Location(1, 1))
+        inf
+        """
+        self._graph = graph
+        self._map = None
+        cells = graph.rows * graph.columns
+        if filename is None:
+            self._distances = self._compute()
+            return
+
+        size = self._HEADER + 2 * cells * cells
+        digest = graph.digest()
+        if (not os.path.exists(filename) or
+                os.path.getsize(filename) != size or
+                _read_header(filename, self._HEADER) != digest):
+            temporary = filename + ".tmp"
+            with open(temporary, "wb") as file:
+                file.write(digest)
+                self._compute().tofile(file)
+            os.replace(temporary, filename)
+        with open(filename, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._distances = memoryview(self._map)[self._HEADER:].cast("H")
+
+    def __call__(self, origin, destination):
+        """Return the distance from <origin> to <destination>, or infinity if
+        the destination cannot be reached.
+
+        @type self: MatrixOracle
+        @type origin: Location
+        @type destination: Location
+        @rtype: int | float
+        """
+        columns = self._graph.columns
+        distance = self._distances[
+            (origin.row * columns + origin.column) *
+            self._graph.rows * columns +
+            destination.row * columns + destination.column]
+        return float("inf") if distance == MATRIX_UNREACHABLE else distance
+
+    def _compute(self):
+        """Return the distance from every cell to every cell.
+
+        @type self: MatrixOracle
+        @rtype: array[int]
+        """
+        graph = self._graph
+        distances = array("H")
+        for cell in range(graph.rows * graph.columns):
+            distances.extend(graph._search(cell, graph._successors, "H",
+                                           MATRIX_UNREACHABLE))
+        return distances
+
+
+def _read_header(filename, size):
+    """Return the first <size> bytes of the file <filename>.
+
+    @type filename: str
+    @type size: int
+    @rtype: bytes
+    """
+    with open(filename, "rb") as file:
+        return file.read(size)
+
+
+class LandmarkOracle:
+    """Lower bounds on the distances of a RoadGraph from a few landmark
+    cells, with exact distances found by searches guided by them.
+
+    For every landmark L, the triangle inequality bounds the distance from
+    a to b by d(L, b) - d(L, a) and by d(a, L) - d(b, L), and the Manhattan
+    distance bounds it on a grid as well. The bounds take constant time, so
+    that the dispatcher can rule most drivers out without an exact distance.
+    An exact distance is found by an A* search from the origin, which uses
+    the bound to the destination as its estimate, and so only visits the
+    cells around the shortest paths. The most recent exact distances are
+    cached.
+    """
+
+    # === Private Attributes ===
+    # @type _graph: RoadGraph
+    #     The graph of the distances.
+    # @type _stride: int
+    #     Twice the number of landmarks.
+    # @type _vectors: array[int]
+    #     For every cell, in order, the distance from every landmark to the
+    #     cell, followed by the negated distance from the cell to every
+    #     landmark, with _FAR for a distance that is infinite. The bound of
+    #     a landmark on the distance from a to b is then the difference
+    #     between their entries for it, and a difference beyond _FAR // 2
+    #     shows that b cannot be reached from a.
+    # @type _cache: OrderedDict[(int, int), int | float]
+    #     The most recently used exact distances, by their origin and
+    #     destination cells, least recently used first.
+    # @type _cache_size: int
+    #     The largest number of distances cached.
+
+    def __init__(self, graph, landmarks=8, cache_size=65536):
+        """Initialize a LandmarkOracle for <graph> with <landmarks>
+        landmarks, which caches <cache_size> exact distances.
+
+        The landmarks are picked far apart: every landmark is the cell
+        farthest from the landmarks picked before it.
+
+        @type self: LandmarkOracle
+        @type graph: RoadGraph
+        @type landmarks: int
+        @type cache_size: int
+        @rtype: None
+
+        >>> graph = RoadGraph(["....", ".##.", "...."])
+        >>> oracle = LandmarkOracle(graph, 2)
+        >>> oracle.lower_bound(Location(0, 0), Location(2, 3))
+        5
+        >>> oracle(Location(0, 1), Location(2, 2))
+        5
+        >>> oracle(Location(1, 1), Location(2, 2))
+        inf
+        """
+        self._graph = graph
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        from_landmarks, to_landmarks = [], []
+
+        cells = graph.rows * graph.columns
+        open_cells = [cell for cell in range(cells)
+                      if graph._successors[cell] or graph._predecessors[cell]]
+        if open_cells:
+            # The distance from the nearest landmark picked so far.
+            nearest = array("I", [UNREACHABLE]) * cells
+            landmark = open_cells[0]
+            for _ in range(min(landmarks, len(open_cells))):
+                from_landmark = graph.distances_from(landmark)
+                from_landmarks.append(from_landmark)
+                to_landmarks.append(graph.distances_to(landmark))
+                for cell in open_cells:
+                    nearest[cell] = min(nearest[cell], from_landmark[cell])
+                # Cells that cannot be reached from any landmark come first.
+                landmark = max(open_cells, key=nearest.__getitem__)
+
+        self._stride = 2 * len(from_landmarks)
+        self._vectors = array("i")
+        for cell in range(cells):
+            self._vectors.extend(
+                [_FAR if distances[cell] == UNREACHABLE else distances[cell]
+                 for distances in from_landmarks] +
+                [-_FAR if distances[cell] == UNREACHABLE else -distances[cell]
+                 for distances in to_landmarks])
+
+    def __call__(self, origin, destination):
+        """Return the distance from <origin> to <destination>, or infinity if
+        the destination cannot be reached.
+
+        @type self: LandmarkOracle
+        @type origin: Location
+        @type destination: Location
+        @rtype: int | float
+
+        >>> graph = RoadGraph(["." * 30] * 30)
+        >>> oracle = LandmarkOracle(graph, 4)
+        >>> all(oracle(Location(0, 0), Location(row, column)) ==
+        ...     graph.distances_from(0)[row * 30 + column]
+        ...     for row in range(30) for column in range(30))
+        True
+        """
+        key = (self._graph.cell(origin), self._graph.cell(destination))
+        distance = self._cache.get(key)
+        if distance is None:
+            distance = self._search(*key)
+            self._cache[key] = distance
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return distance
+
+    def lower_bound(self, origin, destination):
+        """Return a lower bound on the distance from <origin> to
+        <destination>, or infinity if the destination cannot be reached,
+        without searching the graph.
+
+        @type self: LandmarkOracle
+        @type origin: Location
+        @type destination: Location
+        @rtype: int | float
+        """
+        end = self._graph.cell(destination)
+        stride = self._stride
+        return self._estimate(self._graph.cell(origin), end,
+                              self._vectors[end * stride:(end + 1) * stride])
+
+    def _estimate(self, start, end, target):
+        """Return a lower bound on the distance from the cell <start> to the
+        cell <end>, whose entries of _vectors are <target>, or infinity if
+        <end> cannot be reached.
+
+        @type self: LandmarkOracle
+        @type start: int
+        @type end: int
+        @type target: array[int]
+        @rtype: int | float
+        """
+        columns, stride = self._graph.columns, self._stride
+        bound = max(map(sub, target,
+                        self._vectors[start * stride:(start + 1) * stride]),
+                    default=0)
+        if bound > _FAR // 2:
+            return float("inf")
+        # The Manhattan distance is a bound on a grid as well.
+        return max(bound, abs(start // columns - end // columns) +
+                   abs(start % columns - end % columns))
+
+    def _search(self, start, end):
+        """Return the distance from the cell <start> to the cell <end>, or
+        infinity if it cannot be reached, by an A* search.
+
+        The bound to <end> drops by at most one along a move, so the first
+        time the search reaches <end> is along a shortest path. Cells from
+        which the bound shows that <end> cannot be reached are never
+        visited.
+
+        @type self: LandmarkOracle
+        @type start: int
+        @type end: int
+        @rtype: int | float
+        """
+        successors = self._graph._successors
+        estimate = self._estimate
+        stride = self._stride
+        target = self._vectors[end * stride:(end + 1) * stride]
+        distances = {start: 0}
+        # Among cells with equal estimates, the ones furthest along go first.
+        frontier = [(estimate(start, end, target), 0, start)]
+        infinity = float("inf")
+        while frontier and frontier[0][0] != infinity:
+            _, negative, cell = heapq.heappop(frontier)
+            if cell == end:
+                return -negative
+            distance = 1 - negative
+            if distance - 1 > distances[cell]:
+                continue
+            for other in successors[cell]:
+                if distance < distances.get(other, UNREACHABLE):
+                    distances[other] = distance
+                    heapq.heappush(frontier, (
+                        distance + estimate(other, end, target), -distance,
+                        other))
+        return infinity
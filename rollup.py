@@ -0,0 +1,244 @@
+"""Rollups
+
+This module contains the Rollup class, which aggregates the activities a
+monitor is notified about into windows of time as they happen, and the
+CsvSink class, which appends the windows to a CSV file.
+
+Time is split into tumbling windows of a fixed width, aligned to multiples
+of the width. For every window, a rollup counts the ride requests, the
+matches (pickups) and the cancellations, the average time riders waited for
+a pickup or before cancelling, and the number of drivers with an activity.
+A sliding window covers the last few tumbling windows, and moves on by one
+tumbling window at a time.
+
+The counts of the windows a sliding window covers are kept in ring buffers,
+so the memory a rollup takes depends on the number of windows a sliding
+window covers, the number of drivers and the number of riders waiting at
+once, but not on the length of the run. A window is emitted, to a callback,
+as soon as an activity after its end is seen.
+"""
+import csv
+from array import array
+
+from monitor import RIDER, DRIVER, REQUEST, CANCEL, PICKUP
+
+# The fields of an emitted window, in order.
+FIELDS = ("kind", "start", "end", "requests", "matches", "cancellations",
+          "wait_time", "active_drivers")
+
+# The kinds of emitted windows.
+TUMBLING = "tumbling"
+SLIDING = "sliding"
+
+
+class Rollup:
+    """Tumbling and sliding window aggregates of activities.
+
+    Every window emitted is a dictionary with the keys in FIELDS, passed to
+    the callback of the rollup. A sliding window is only emitted if it
+    covers more than one tumbling window.
+    """
+
+    # === Private Attributes ===
+    # @type _width: int | float
+    #     The width of a tumbling window.
+    # @type _span: int
+    #     The number of tumbling windows a sliding window covers.
+    # @type _callback: callable
+    #     The function every window is emitted to.
+    # @type _start: int | float | None
+    #     The start of the current tumbling window, or None before the first
+    #     activity.
+    # @type _slot: int
+    #     The slot of the ring buffers of the current tumbling window.
+    # @type _filled: int
+    #     The number of slots of the ring buffers in use.
+    # @type _requests, _matches, _cancellations, _waits: array[int]
+    #     The number of requests, matches, cancellations and finished waits
+    #     of every tumbling window of the ring.
+    # @type _wait_time: array[float]
+    #     The total time of the finished waits of every tumbling window of
+    #     the ring.
+    # @type _drivers: list[set[str]]
+    #     The drivers with an activity in every tumbling window of the ring.
+    # @type _requested: dict[str, int | float]
+    #     The time of the request of every rider that is waiting.
+
+    def __init__(self, callback, width=300, span=1):
+        """Initialize a Rollup that emits windows to <callback>.
+
+        @type self: Rollup
+        @type callback: (dict[str, object]) -> None
+        @type width: int | float
+            The width of a tumbling window.
+        @type span: int
+            The number of tumbling windows a sliding window covers.
+        @rtype: None
+        """
+        self._width, self._span = width, span
+        self._callback = callback
+        self._start = None
+        self._slot = 0
+        self._filled = 1
+        self._requests = array("l", [0]) * span
+        self._matches = array("l", [0]) * span
+        self._cancellations = array("l", [0]) * span
+        self._waits = array("l", [0]) * span
+        self._wait_time = array("d", [0]) * span
+        self._drivers = [set() for _ in range(span)]
+        self._requested = {}
+
+    def notify(self, timestamp, category, description, identifier):
+        """Add an activity to the window of <timestamp>, and emit the windows
+        that end before it.
+
+        An activity before the start of the current window is added to the
+        current window.
+
+        @type self: Rollup
+        @type timestamp: int | float
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROPOFF
+        @type identifier: str
+        @rtype: None
+
+        >>> windows = []
+        >>> rollup = Rollup(windows.append, 10, 2)
+        >>> rollup.notify(1, RIDER, REQUEST, "kal")
+        >>> rollup.notify(4, DRIVER, PICKUP, "fire")
+        >>> rollup.notify(4, RIDER, PICKUP, "kal")
+        >>> rollup.notify(12, RIDER, REQUEST, "bal")
+        >>> rollup.notify(27, RIDER, CANCEL, "bal")
+        >>> for window in windows: print(window)
+        {'kind': 'tumbling', 'start': 0, 'end': 10, 'requests': 1, 'matches': 1, 'cancellations': 0, 'wait_time': 3.0, 'active_drivers': 1}
+        {'kind': 'tumbling', 'start': 10, 'end': 20, 'requests': 1, 'matches': 0, 'cancellations': 0, 'wait_time': 0, 'active_drivers': 0}
+        {'kind': 'sliding', 'start': 0, 'end': 20, 'requests': 2, 'matches': 1, 'cancellations': 0, 'wait_time': 3.0, 'active_drivers': 1}
+        """
+        if self._start is None:
+            self._start = timestamp // self._width * self._width
+        while timestamp >= self._start + self._width:
+            self._advance()
+
+        slot = self._slot
+        if category == DRIVER:
+            self._drivers[slot].add(identifier)
+        elif description == REQUEST:
+            self._requests[slot] += 1
+            self._requested[identifier] = timestamp
+        elif description == PICKUP or description == CANCEL:
+            if description == PICKUP:
+                self._matches[slot] += 1
+            else:
+                self._cancellations[slot] += 1
+            requested = self._requested.pop(identifier, None)
+            if requested is not None:
+                self._waits[slot] += 1
+                self._wait_time[slot] += timestamp - requested
+
+    def close(self):
+        """Emit the current window, even though it has not ended, and close
+        the callback if it has a close method.
+
+        @type self: Rollup
+        @rtype: None
+        """
+        if self._start is not None:
+            self._emit()
+            self._start = None
+        if hasattr(self._callback, "close"):
+            self._callback.close()
+
+    def _advance(self):
+        """Emit the current window and move on to the next one.
+
+        @type self: Rollup
+        @rtype: None
+        """
+        self._emit()
+        self._start += self._width
+        self._slot = (self._slot + 1) % self._span
+        self._filled = min(self._filled + 1, self._span)
+        slot = self._slot
+        self._requests[slot] = self._matches[slot] = 0
+        self._cancellations[slot] = self._waits[slot] = 0
+        self._wait_time[slot] = 0
+        self._drivers[slot] = set()
+
+    def _emit(self):
+        """Emit the current tumbling window, and the sliding window that ends
+        with it.
+
+        @type self: Rollup
+        @rtype: None
+        """
+        slot = self._slot
+        self._callback(self._window(TUMBLING, self._start, [slot]))
+        if self._filled > 1:
+            slots = [(slot - back) % self._span for back in range(self._filled)]
+            self._callback(self._window(
+                SLIDING, self._start - (self._filled - 1) * self._width,
+                slots))
+
+    def _window(self, kind, start, slots):
+        """Return the window of <kind> from <start> to the end of the current
+        tumbling window, with the counts of the tumbling windows in <slots>.
+
+        @type self: Rollup
+        @type kind: str
+        @type start: int | float
+        @type slots: list[int]
+        @rtype: dict[str, object]
+        """
+        waits = sum(self._waits[slot] for slot in slots)
+        drivers = set()
+        for slot in slots:
+            drivers.update(self._drivers[slot])
+        return {"kind": kind, "start": start,
+                "end": self._start + self._width,
+                "requests": sum(self._requests[slot] for slot in slots),
+                "matches": sum(self._matches[slot] for slot in slots),
+                "cancellations": sum(self._cancellations[slot]
+                                     for slot in slots),
+                "wait_time": (sum(self._wait_time[slot] for slot in slots) /
+                              waits if waits else 0),
+                "active_drivers": len(drivers)}
+
+
+class CsvSink:
+    """A callback for a Rollup that appends every window to a CSV file, with
+    a header row, and flushes it after every window."""
+
+    # === Private Attributes ===
+    # @type _file: io.TextIOWrapper
+    #     The file the windows are written to.
+    # @type _writer: csv.DictWriter
+    #     The writer of the rows of the file.
+
+    def __init__(self, filename):
+        """Initialize a CsvSink that writes to a new file named <filename>.
+
+        @type self: CsvSink
+        @type filename: str
+        @rtype: None
+        """
+        self._file = open(filename, "w", newline="")
+        self._writer = csv.DictWriter(self._file, FIELDS)
+        self._writer.writeheader()
+
+    def __call__(self, window):
+        """Append <window> to the file.
+
+        @type self: CsvSink
+        @type window: dict[str, object]
+        @rtype: None
+        """
+        self._writer.writerow(window)
+        self._file.flush()
+
+    def close(self):
+        """Close the file.
+
+        @type self: CsvSink
+        @rtype: None
+        """
+        self._file.close()
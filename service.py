@@ -0,0 +1,436 @@
+"""Dispatch Service
+
+This module contains the DispatchService class, a local asyncio TCP server
+in front of a Dispatcher, so that other services can request drivers and
+riders over the network.
+
+Requests and responses are JSON objects, one per line. Every request has an
+"id", which is copied to its response, and an "op", which is one of:
+
+    {"op": "request_driver", "rider": {"id": "kal", "origin": "5,2",
+                                       "destination": "3,2", "patience": 5}}
+        answered with {"driver": <driver id or null>}
+    {"op": "request_rider", "driver": {"id": "fire", "location": "5,5",
+                                       "speed": 5}}
+        answered with {"rider": <rider id or null>}
+    {"op": "cancel_ride", "rider": "kal"}
+        answered with {"cancelled": <true or false>}
+
+A request that is not valid JSON, or whose fields are missing or malformed,
+is answered with {"error": <reason>}, and the requests around it are done
+as usual.
+
+Requests that arrive within a short window of each other are coalesced
+into a single batch, and consecutive driver requests of a batch are
+dispatched in one pass. When too many requests are pending, the batch is
+dispatched as soon as possible, and the server stops reading from its
+clients until it has been.
+
+Run this module to start a service and measure it with a benchmark client.
+"""
+import asyncio
+import json
+import time
+
+from dispatcher import Dispatcher
+from driver import Driver
+from location import deserialize_location
+from rider import Rider
+
+# The request that stands for a line that is not valid JSON.
+_INVALID_JSON = object()
+
+
+def _rider(fields):
+    """Return the rider described by the JSON object <fields> of a request.
+
+    Raise ValueError if <fields> does not describe a rider.
+
+    @type fields: object
+    @rtype: Rider
+    """
+    try:
+        return Rider(str(fields["id"]),
+                     deserialize_location(str(fields["origin"])),
+                     deserialize_location(str(fields["destination"])),
+                     int(fields["patience"]),
+                     float(fields.get("timestamp", 0)))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("invalid rider")
+
+
+class DispatchService:
+    """A dispatcher that is served over a local TCP socket."""
+
+    # === Private Attributes ===
+    # @type _dispatcher: Dispatcher
+    #     The dispatcher that requests are forwarded to.
+    # @type _drivers: dict[str, Driver]
+    #     The registered drivers, by identifier.
+    # @type _riders: dict[str, Rider]
+    #     The riders that are waiting, by identifier.
+    # @type _window: float
+    #     The number of seconds requests are coalesced for.
+    # @type _max_pending: int
+    #     The number of pending requests at which reading stops.
+    # @type _pending: list[(object, asyncio.StreamWriter)]
+    #     The requests of the batch that is being coalesced, with the
+    #     writers of their connections. A line that is not valid JSON is
+    #     pending as _INVALID_JSON.
+    # @type _flush: asyncio.Handle | None
+    #     The callback that dispatches the pending batch, if it is
+    #     scheduled.
+    # @type _room: asyncio.Event
+    #     Set whenever a batch has been dispatched.
+
+    def __init__(self, window=0.001, max_pending=4096):
+        """Initialize a DispatchService.
+
+        @type self: DispatchService
+        @type window: float
+            The number of seconds requests are coalesced for.
+        @type max_pending: int
+            The number of pending requests at which the server stops reading
+            from its clients.
+        @rtype: None
+        """
+        self._dispatcher = Dispatcher()
+        self._drivers = {}
+        self._riders = {}
+        self._window, self._max_pending = window, max_pending
+        self._pending = []
+        self._flush = None
+        self._room = asyncio.Event()
+
+    def dispatch(self, requests):
+        """Do the batch of <requests> in order, and return their responses.
+
+        @type self: DispatchService
+        @type requests: list[dict]
+        @rtype: list[dict]
+
+        >>> service = DispatchService()
+        >>> for response in service.dispatch([
+        ...         {"id": 1, "op": "request_rider", "driver": {
+        ...             "id": "fire", "location": "5,5", "speed": 5}},
+        ...         {"id": 2, "op": "request_driver", "rider": {
+        ...             "id": "kal", "origin": "5,2", "destination": "3,2",
+        ...             "patience": 5}},
+        ...         {"id": 3, "op": "request_driver", "rider": {
+        ...             "id": "bal", "origin": "5,3", "destination": "3,2",
+        ...             "patience": 5}},
+        ...         {"id": 4, "op": "cancel_ride", "rider": "bal"},
+        ...         {"id": 5, "op": "fly"},
+        ...         {"id": 6, "op": "request_driver", "rider": {"id": "cal"}},
+        ...         {"id": 7, "op": "request_rider", "driver": {
+        ...             "id": "ice", "location": "5", "speed": 1}},
+        ...         {"id": 8, "op": "cancel_ride"}, 8]):
+        ...     print(sorted(response.items()))
+        [('id', 1), ('rider', None)]
+        [('driver', 'fire'), ('id', 2)]
+        [('driver', None), ('id', 3)]
+        [('cancelled', True), ('id', 4)]
+        [('error', 'unknown op'), ('id', 5)]
+        [('error', 'invalid rider'), ('id', 6)]
+        [('error', 'invalid driver'), ('id', 7)]
+        [('error', 'invalid rider'), ('id', 8)]
+        [('error', 'invalid request'), ('id', None)]
+
+        A rider is only kept while waiting, and a driver request matches the
+        longest waiting of two riders with the same identifier.
+
+        >>> service = DispatchService()
+        >>> kal = {"id": "kal", "origin": "1,1", "destination": "2,2",
+        ...        "patience": 5}
+        >>> for response in service.dispatch([
+        ...         {"id": 1, "op": "request_driver", "rider": kal},
+        ...         {"id": 2, "op": "request_driver", "rider": kal},
+        ...         {"id": 3, "op": "request_rider", "driver": {
+        ...             "id": "fire", "location": "5,5", "speed": 5}},
+        ...         {"id": 4, "op": "request_rider", "driver": {
+        ...             "id": "ice", "location": "5,5", "speed": 5}}]):
+        ...     print(sorted(response.items()))
+        [('driver', None), ('id', 1)]
+        [('driver', None), ('id', 2)]
+        [('id', 3), ('rider', 'kal')]
+        [('id', 4), ('rider', 'kal')]
+        >>> service._riders
+        {}
+        """
+        responses = []
+        riders = []
+        for request in requests + [None]:
+            if (isinstance(request, dict) and
+                    request.get("op") == "request_driver"):
+                try:
+                    riders.append((request, _rider(request.get("rider"))))
+                    continue
+                except ValueError:
+                    # The invalid request ends the run, so that the
+                    # responses stay in the order of the requests.
+                    pass
+            if riders:
+                # A run of driver requests is dispatched in a single pass.
+                responses.extend(self._request_drivers(riders))
+                riders = []
+            if request is None:
+                break
+            elif request is _INVALID_JSON:
+                responses.append({"id": None, "error": "invalid JSON"})
+            elif not isinstance(request, dict):
+                responses.append({"id": None, "error": "invalid request"})
+            elif request.get("op") == "request_driver":
+                responses.append({"id": request.get("id"),
+                                  "error": "invalid rider"})
+            elif request.get("op") == "request_rider":
+                responses.append(self._request_rider(request))
+            elif request.get("op") == "cancel_ride":
+                responses.append(self._cancel_ride(request))
+            else:
+                responses.append({"id": request.get("id"),
+                                  "error": "unknown op"})
+        return responses
+
+    async def serve(self, host="127.0.0.1", port=0):
+        """Start serving on a local TCP socket and return the asyncio Server.
+
+        @type self: DispatchService
+        @type host: str
+        @type port: int
+            The port to listen on, or 0 for any free port.
+        @rtype: asyncio.AbstractServer
+        """
+        return await asyncio.start_server(self._handle, host, port)
+
+    def _request_drivers(self, requests):
+        """Return the responses to a run of driver <requests>, each paired
+        with the rider it requests a driver for.
+
+        @type self: DispatchService
+        @type requests: list[(dict, Rider)]
+        @rtype: list[dict]
+        """
+        responses = []
+        drivers = self._dispatcher.request_drivers(
+            [rider for _, rider in requests])
+        for (request, rider), driver in zip(requests, drivers):
+            if driver is None:
+                self._riders[rider.id] = rider
+            else:
+                driver.start_drive(rider.origin)
+            responses.append({"id": request.get("id"),
+                              "driver": driver and driver.id})
+        return responses
+
+    def _request_rider(self, request):
+        """Return the response to the rider <request>.
+
+        The driver of the request has finished any drive it was on, and is
+        at the location given in the request.
+
+        @type self: DispatchService
+        @type request: dict
+        @rtype: dict
+        """
+        fields = request.get("driver")
+        try:
+            identifier = str(fields["id"])
+            location = deserialize_location(str(fields["location"]))
+            speed = int(fields["speed"])
+        except (KeyError, TypeError, ValueError):
+            return {"id": request.get("id"), "error": "invalid driver"}
+        if speed <= 0:
+            return {"id": request.get("id"), "error": "invalid driver"}
+        driver = self._drivers.get(identifier)
+        if driver is None:
+            driver = Driver(identifier, location, speed)
+            self._drivers[driver.id] = driver
+        driver.location, driver.destination = location, None
+        driver.is_idle, driver.rider = True, False
+
+        rider = self._dispatcher.request_rider(driver)
+        if rider is not None:
+            # A later rider with the same identifier may be waiting too.
+            if self._riders.get(rider.id) is rider:
+                del self._riders[rider.id]
+            driver.start_drive(rider.origin)
+        return {"id": request.get("id"), "rider": rider and rider.id}
+
+    def _cancel_ride(self, request):
+        """Return the response to the cancellation <request>.
+
+        @type self: DispatchService
+        @type request: dict
+        @rtype: dict
+        """
+        identifier = request.get("rider")
+        if not isinstance(identifier, str):
+            return {"id": request.get("id"), "error": "invalid rider"}
+        rider = self._riders.pop(identifier, None)
+        if rider is not None:
+            self._dispatcher.cancel_ride(rider)
+        return {"id": request.get("id"), "cancelled": rider is not None}
+
+    async def _handle(self, reader, writer):
+        """Coalesce the requests of a single client connection.
+
+        A line that is not valid JSON is answered with an error in turn,
+        after the requests before it.
+
+        @type self: DispatchService
+        @type reader: asyncio.StreamReader
+        @type writer: asyncio.StreamWriter
+        @rtype: None
+
+        >>> async def main():
+        ...     service = DispatchService(max_pending=2)
+        ...     server = await service.serve()
+        ...     port = server.sockets[0].getsockname()[1]
+        ...     reader, writer = await asyncio.open_connection("127.0.0.1",
+        ...                                                   port)
+        ...     writer.write(b'{"id": 1, "op": "request_driver"}\\n'
+        ...                  b'garbage\\n'
+        ...                  b'{"id": 2, "op": "request_driver", "rider": {'
+        ...                  b'"id": "kal", "origin": "1,1", '
+        ...                  b'"destination": "2,2", "patience": 5}}\\n'
+        ...                  b'{"id": 3, "op": "cancel_ride", "rider": "kal"}'
+        ...                  b'\\n')
+        ...     answers = [json.loads(await reader.readline())
+        ...                for _ in range(4)]
+        ...     writer.close()
+        ...     await writer.wait_closed()
+        ...     server.close()
+        ...     await server.wait_closed()
+        ...     return answers
+        >>> for answer in asyncio.run(main()): print(sorted(answer.items()))
+        [('error', 'invalid rider'), ('id', 1)]
+        [('error', 'invalid JSON'), ('id', None)]
+        [('driver', None), ('id', 2)]
+        [('cancelled', True), ('id', 3)]
+        """
+        loop = asyncio.get_running_loop()
+        line = await reader.readline()
+        while line:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                # The error is pending like a request, so that the responses
+                # stay in the order of the requests.
+                request = _INVALID_JSON
+            # Backpressure: stop reading while too many requests are
+            # pending.
+            while len(self._pending) >= self._max_pending:
+                await self._room.wait()
+            self._pending.append((request, writer))
+            if len(self._pending) >= self._max_pending:
+                # The batch is full, and is dispatched as soon as the loop is
+                # free.
+                if self._flush is not None:
+                    self._flush.cancel()
+                self._flush = loop.call_soon(self._dispatch_pending)
+            elif self._flush is None:
+                self._flush = loop.call_later(self._window,
+                                              self._dispatch_pending)
+            await writer.drain()
+            line = await reader.readline()
+        writer.close()
+
+    def _dispatch_pending(self):
+        """Dispatch the pending batch, and write the responses with a single
+        write per connection.
+
+        @type self: DispatchService
+        @rtype: None
+        """
+        if self._flush is not None:
+            self._flush.cancel()
+            self._flush = None
+        batch, self._pending = self._pending, []
+
+        responses = self.dispatch([request for request, _ in batch])
+        lines = {}
+        for (_, writer), response in zip(batch, responses):
+            lines.setdefault(writer, []).append(json.dumps(response) + "\n")
+        for writer, output in lines.items():
+            if not writer.is_closing():
+                writer.write("".join(output).encode())
+
+        self._room.set()
+        self._room.clear()
+
+
+async def benchmark_client(host, port, requests, connections=16, depth=32):
+    """Send the <requests> to the service at <host> and <port> and return the
+    number of responses per second and the latencies in seconds, sorted.
+
+    The requests are spread over <connections> connections, each of which
+    has up to <depth> requests in flight.
+
+    @type host: str
+    @type port: int
+    @type requests: list[dict]
+    @type connections: int
+    @type depth: int
+    @rtype: (float, list[float])
+    """
+    latencies = []
+
+    async def connection(share):
+        reader, writer = await asyncio.open_connection(host, port)
+        sent = {}
+        window = asyncio.Semaphore(depth)
+
+        async def receive():
+            for _ in share:
+                response = json.loads(await reader.readline())
+                latencies.append(time.perf_counter() - sent.pop(
+                    response["id"]))
+                window.release()
+
+        receiving = asyncio.ensure_future(receive())
+        for request in share:
+            await window.acquire()
+            sent[request["id"]] = time.perf_counter()
+            writer.write(json.dumps(request).encode() + b"\n")
+        await receiving
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[connection(requests[number::connections])
+                           for number in range(connections)])
+    return len(requests) / (time.perf_counter() - start), sorted(latencies)
+
+
+async def _main():
+    """Start a service and measure it with the benchmark client.
+
+    @rtype: None
+    """
+    from benchmark import random_trace
+
+    requests = []
+    for number, line in enumerate(random_trace(300, 30000, 100, 100, 1)):
+        tokens = line.split()
+        if tokens[1] == "DriverRequest":
+            requests.append({"id": number, "op": "request_rider", "driver": {
+                "id": tokens[2], "location": tokens[3],
+                "speed": int(tokens[4])}})
+        else:
+            requests.append({"id": number, "op": "request_driver", "rider": {
+                "id": tokens[2], "origin": tokens[3],
+                "destination": tokens[4], "patience": int(tokens[5])}})
+
+    service = DispatchService()
+    server = await service.serve()
+    port = server.sockets[0].getsockname()[1]
+    throughput, latencies = await benchmark_client("127.0.0.1", port,
+                                                   requests)
+    server.close()
+    print("{:.0f} requests/s, p50 {:.2f}ms, p99 {:.2f}ms, p99.9 {:.2f}ms"
+          .format(throughput, 1000 * latencies[len(latencies) // 2],
+                  1000 * latencies[len(latencies) * 99 // 100],
+                  1000 * latencies[len(latencies) * 999 // 1000]))
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,6 +1,14 @@
-from container import PriorityQueue
-from dispatcher import Dispatcher
-from event import Event, create_event_list
+import hashlib
+import os
+import pickle
+import zlib
+
+from container import PriorityQueue, TimeoutQueue
+from dispatcher import Dispatcher, LONGEST_WAITING
+from event import (Event, EventPool, Cancellation, LazyRequest, Rebalance,
+                   RiderRequest, create_event_list, recycle_events,
+                   serialize_event)
+from heatmap import DemandHeatmap
 from monitor import Monitor
 
 
@@ -28,53 +36,703 @@ class Simulation:
     #     sorting order.
     # @type _dispatcher: Dispatcher
     #     The dispatcher associated with the simulation.
+    # @type _monitor: Monitor
+    #     The monitor associated with the simulation.
+    # @type _time: int
+    #     The current time of the simulation.
+    # @type _interval: int | None
+    #     The number of input events between two recorded snapshots, or None
+    #     if no snapshots are recorded.
+    # @type _inputs: list[Event]
+    #     The input events of the run, in the order in which they are done.
+    # @type _consumed: int
+    #     The number of input events that have been done.
+    # @type _digest: hashlib.sha256
+    #     A running hash of the input events that have been done.
+    # @type _snapshots: list[(int, hashlib.sha256, bytes, int | float)]
+    #     The recorded snapshots, each with the number and the hash of the
+    #     input events done before it was taken, and the time at which it
+    #     was taken.
+    # @type _timeouts: TimeoutQueue[Cancellation] | None
+    #     The pending Cancellation events by rider, if they are kept out of
+    #     the event queue.
+    # @type _sequence: int
+    #     The number of events scheduled so far, if Cancellation events are
+    #     kept out of the event queue.
+    # @type _pool: EventPool | None
+    #     The events released for reuse once they are done, if events are
+    #     recycled.
+    # @type _rider_policy: str
+    #     The policy with which the dispatcher assigns waiting riders.
+    # @type _approximation: (int | float | None, int | None, int | None)
+    #     The approximation factor, the maximum number of candidates and the
+    #     check interval of the dispatcher.
+    # @type _ticks: (int | float, int | float) | None
+    #     The interval between two Rebalance events and the time of the next
+    #     one, if idle drivers are rebalanced.
 
-    def __init__(self):
+    def __init__(self, snapshot_interval=None, patience_timeouts=False,
+                 recycle=False, rider_policy=LONGEST_WAITING,
+                 approximation=None, max_candidates=None, rollup=None,
+                 activity_log=None, rebalance_interval=None,
+                 check_interval=None):
         """Initialize a Simulation.
 
+        If <snapshot_interval> is not None, a snapshot of the simulation is
+        recorded each time another <snapshot_interval> input events have
+        been done, so that a later rerun on a modified list of events can
+        resume from the last snapshot that the modification does not affect.
+
+        If <patience_timeouts> is True, Cancellation events are kept in a
+        separate queue of timeouts instead of the event queue, and the
+        Cancellation of a rider is disarmed as soon as the rider is picked
+        up. Only the timeouts that expire are ever done, and the event queue
+        only holds live events. Events are done in the same order either
+        way.
+
+        If <recycle> is True, the events spawned by the simulation are
+        released for reuse once they are done, and the events spawned are
+        taken from the released ones, so that the simulation allocates fewer
+        objects as it runs. The released events belong to the simulation,
+        and the events given to it are never reused.
+
+        <rider_policy> is the policy with which the dispatcher assigns a
+        waiting rider to a driver, as defined in the dispatcher module.
+
+        If <approximation> or <max_candidates> is not None, the dispatcher
+        is approximate, as defined in the dispatcher module. If
+        <check_interval> is also not None, one approximate dispatch in every
+        <check_interval> is checked against the nearest driver, and the
+        monitor records how far its choices are from the nearest drivers.
+
+        If <rollup> is not None, the monitor adds every activity to it as
+        events are done. A simulation with a rollup cannot record
+        snapshots, as a rerun would emit windows that were emitted already.
+
+        If <activity_log> is not None, the monitor spills activities to it
+        instead of keeping them in memory, and every activity is on disk
+        once run, resume or run_until returns. A simulation with an activity
+        log cannot record snapshots either, as a rerun would append
+        activities that were appended already.
+
+        If <rebalance_interval> is not None, the dispatcher keeps a heatmap
+        of the demand for drivers, and a Rebalance event moves idle drivers
+        towards the demand every <rebalance_interval>, for as long as there
+        are events left to do.
+
         @type self: Simulation
+        @type snapshot_interval: int | None
+        @type patience_timeouts: bool
+        @type recycle: bool
+        @type rider_policy: str
+        @type approximation: int | float | None
+        @type max_candidates: int | None
+        @type rollup: Rollup | None
+        @type activity_log: ActivityLog | None
+        @type rebalance_interval: int | float | None
+        @type check_interval: int | None
         @rtype: None
 
-
+        >>> sim = Simulation(patience_timeouts=True)
+        >>> sim.run(create_event_list("events.txt")) == Simulation().run(
+        ...     create_event_list("events.txt"))
+        True
+        >>> events = create_event_list("events.txt")
+        >>> given = [(type(event), event.timestamp) for event in events]
+        >>> sim = Simulation(recycle=True)
+        >>> sim.run(events) == Simulation().run(create_event_list("events.txt"))
+        True
+        >>> [(type(event), event.timestamp) for event in events] == given
+        True
+        >>> import tempfile
+        >>> from activitylog import ActivityLog
+        >>> directory = tempfile.mkdtemp()
+        >>> sim = Simulation(activity_log=ActivityLog(directory, 1000))
+        >>> _ = sim.run(create_event_list("events.txt"))
+        >>> len(list(ActivityLog(directory).scan()))
+        39
         """
+        if rollup is not None and snapshot_interval is not None:
+            raise ValueError("a simulation with a rollup cannot record "
+                             "snapshots")
+        if activity_log is not None and snapshot_interval is not None:
+            raise ValueError("a simulation with an activity log cannot "
+                             "record snapshots")
         self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
+        self._monitor = Monitor(rollup, activity_log)
+        self._dispatcher = Dispatcher(
+            rider_policy, approximation=approximation,
+            max_candidates=max_candidates,
+            monitor=None if check_interval is None else self._monitor,
+            heatmap=None if rebalance_interval is None else DemandHeatmap(),
+            check_interval=check_interval or 1)
+        self._time = 0
+        self._interval = snapshot_interval
+        self._inputs = []
+        self._consumed = 0
+        self._digest = hashlib.sha256()
+        self._snapshots = []
+        self._timeouts = TimeoutQueue() if patience_timeouts else None
+        self._sequence = 0
+        self._pool = EventPool() if recycle else None
+        self._rider_policy = rider_policy
+        self._approximation = (approximation, max_candidates, check_interval)
+        self._ticks = None
+        if rebalance_interval is not None:
+            self._ticks = (rebalance_interval, rebalance_interval)
 
-    def run(self, initial_events):
+    def run(self, initial_events, until=None):
         """Run the simulation on the list of events in <initial_events>.
 
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
+        If <until> is not None, only the events up to the timestamp <until>
+        are done, and the statistics are the ones at that time. The rest of
+        the events stay in the event queue, and the simulation can be
+        snapshotted or resumed.
+
         @type self: Simulation
         @type initial_events: list[Event]
             An initial list of events.
+        @type until: int | None
         @rtype: dict[str, object]
         """
-        # TODO
-        #pass
-
         # Add all initial events to the event queue.
-        event_queue = PriorityQueue()
-        for x in initial_events:
-            event_queue.add(x)
+        for event in initial_events:
+            self._schedule(event)
+
+        if self._interval is not None:
+            # Events with equal timestamps are done in the order they were
+            # added, which a stable sort keeps.
+            self._inputs = sorted(initial_events,
+                                  key=lambda event: event.timestamp)
+        return self.resume(until)
+
+    def resume(self, until=None):
+        """Continue the simulation with the events left in the event queue.
+
+        Return a dictionary containing statistics of the simulation. If
+        <until> is not None, stop after the last event with a timestamp up to
+        <until>, and report the statistics at the time <until>: a drive or
+        ride still in progress then is only counted up to that time.
+
+        @type self: Simulation
+        @type until: int | None
+        @rtype: dict[str, object]
+
+        >>> events = create_event_list("events.txt")
+        >>> sim = Simulation()
+        >>> sim.run(events, 10)["rider_wait_time"]
+        0.0
+        >>> sim.resume() == Simulation().run(create_event_list("events.txt"))
+        True
+        >>> from event import parse_event_lines
+        >>> sim = Simulation()
+        >>> report = sim.run(parse_event_lines(
+        ...     ["0 DriverRequest fire 1,1 1", "1 RiderRequest kal 1,1 1,101 500"]),
+        ...     5)
+        >>> report["driver_ride_distance"], report["driver_total_distance"]
+        (4.0, 4.0)
+        """
+        self._advance(None, until)
+        if until is not None:
+            self._time = max(self._time, until)
+        self._monitor.flush()
+        return self.report()
+
+    def run_until(self, timestamp):
+        """Do every event up to the timestamp <timestamp>, and return the
+        statistics of the simulation at that time.
+
+        @type self: Simulation
+        @type timestamp: int
+        @rtype: dict[str, object]
+
+        >>> sim = Simulation()
+        >>> sim.run([], 0)["rider_wait_time"]
+        0
+        >>> for event in create_event_list("events.txt"):
+        ...     sim.inject(event)
+        >>> sim.run_until(15)["rider_wait_time"]
+        0.0
+        >>> sim.now()
+        15
+        >>> sim.run_until(100) == Simulation().run(
+        ...     create_event_list("events.txt"))
+        True
+        """
+        self._advance(None, timestamp)
+        self._time = max(self._time, timestamp)
+        self._monitor.flush()
+        return self.report()
+
+    def step(self, n=1):
+        """Do the next <n> events, or all of the remaining events if there
+        are fewer than <n>. Return the number of events done.
+
+        @type self: Simulation
+        @type n: int
+        @rtype: int
 
+        >>> sim = Simulation()
+        >>> _ = sim.run(create_event_list("events.txt"), 0)
+        >>> sim.step(2)
+        2
+        >>> sim.now()
+        5.0
+        >>> sim.step(100)
+        20
+        >>> sim.step()
+        0
+        """
+        return self._advance(n, None)
+
+    def inject(self, event):
+        """Add <event> to the events of the running simulation.
+
+        Raise ValueError if the timestamp of <event> is before the current
+        time of the simulation.
+
+        @type self: Simulation
+        @type event: Event
+        @rtype: None
+
+        >>> from event import parse_event_lines
+        >>> sim = Simulation()
+        >>> sim.run_until(10)["rider_wait_time"]
+        0
+        >>> sim.inject(parse_event_lines(["9 DriverRequest fire 1,1 1"])[0])
+        Traceback (most recent call last):
+        ...
+        ValueError: cannot inject an event at 9 before the time 10
+        >>> sim.inject(parse_event_lines(["10 DriverRequest fire 1,1 1"])[0])
+        >>> sim.step()
+        1
+        """
+        if event.timestamp < self._time:
+            raise ValueError("cannot inject an event at {} before the time "
+                             "{}".format(event.timestamp, self._time))
+        self._schedule(event)
+
+    def now(self):
+        """Return the current time of the simulation, which is the timestamp
+        of the last event done, or the time the simulation was last run
+        until.
+
+        @type self: Simulation
+        @rtype: int
+        """
+        return self._time
+
+    def report(self):
+        """Return a dictionary containing statistics of the simulation so far.
+
+        @type self: Simulation
+        @rtype: dict[str, object]
+        """
+        self._monitor.advance(self._time)
+        return self._monitor.report()
+
+    def _advance(self, count, until):
+        """Do at most <count> events with a timestamp up to <until>, where
+        None stands for no limit. Return the number of events done.
+
+        @type self: Simulation
+        @type count: int | None
+        @type until: int | None
+        @rtype: int
+        """
+        if self._pool is None:
+            return self._advance_events(count, until)
+        previous = recycle_events(self._pool)
+        try:
+            return self._advance_events(count, until)
+        finally:
+            recycle_events(previous)
+
+    def _advance_events(self, count, until):
+        """Do at most <count> events with a timestamp up to <until>, where
+        None stands for no limit, and release them if events are recycled.
+        Return the number of events done.
+
+        @type self: Simulation
+        @type count: int | None
+        @type until: int | None
+        @rtype: int
+        """
+        if self._timeouts is not None:
+            return self._advance_with_timeouts(count, until)
+        if count is None:
+            return self._advance_in_batches(until)
+
+        events = self._events
+        done = 0
         # Until there are no more events, remove an event
         # from the event queue and do it. Add any returned
         # events to the event queue.
-        while not event_queue.is_empty():
-            new_event = event_queue.remove()
+        while done != count and not events.is_empty():
+            self._schedule_tick(events.peek().timestamp)
+            if until is not None and events.peek().timestamp > until:
+                break
+            event = events.remove()
+            self._time = event.timestamp
+            for new_event in event.do(self._dispatcher, self._monitor):
+                new_event.handle = events.add(new_event)
+            if (self._consumed < len(self._inputs) and
+                    event is self._inputs[self._consumed]):
+                self._consume([event])
+            if self._pool is not None:
+                self._pool.release(event)
+            done += 1
+        return done
 
-            if len(new_event) != 0:
-                for x in new_event:
-                    event_queue.add(x)
+    def _advance_in_batches(self, until):
+        """Do the events with a timestamp up to <until>, where None stands
+        for no limit, one batch of events with the same timestamp at a time.
+        Return the number of events done.
 
-        return self._monitor.report()
+        The events of a batch are done in the order they would be removed
+        from the event queue, and a run of RiderRequest events in the batch
+        is dispatched in a single pass. The events spawned by the batch are
+        added to the event queue after all of them are done, which is where
+        they would go anyway, as they come after every event of the batch
+        with the same timestamp.
+
+        @type self: Simulation
+        @type until: int | None
+        @rtype: int
+        """
+        events = self._events
+        inputs = self._inputs
+        done = 0
+        while not events.is_empty():
+            self._schedule_tick(events.peek().timestamp)
+            timestamp = events.peek().timestamp
+            if until is not None and timestamp > until:
+                break
+            batch = [events.remove()]
+            while not events.is_empty() and events.peek().timestamp == timestamp:
+                batch.append(events.remove())
+            self._time = timestamp
+
+            # Lazy requests are read in, so that they can join a run of
+            # RiderRequest events.
+            todo = [event.materialize() if type(event) is LazyRequest
+                    else event for event in batch]
+            new_events = []
+            start = 0
+            while start < len(todo):
+                end = start
+                while end < len(todo) and type(todo[end]) is RiderRequest:
+                    end += 1
+                if end - start > 1:
+                    new_events.extend(RiderRequest.do_all(
+                        todo[start:end], self._dispatcher, self._monitor))
+                else:
+                    end = start + 1
+                    new_events.extend(todo[start].do(self._dispatcher,
+                                                     self._monitor))
+                start = end
+            for new_event in new_events:
+                new_event.handle = events.add(new_event)
+
+            consumed = []
+            for event in batch:
+                if (self._consumed + len(consumed) < len(inputs) and
+                        event is inputs[self._consumed + len(consumed)]):
+                    consumed.append(event)
+            if consumed:
+                self._consume(consumed)
+            if self._pool is not None:
+                for event in batch:
+                    self._pool.release(event)
+            done += len(batch)
+        return done
+
+    def _advance_with_timeouts(self, count, until):
+        """Do at most <count> events with a timestamp up to <until>, taking
+        them from both the event queue and the timeouts. Return the number
+        of events done.
+
+        @type self: Simulation
+        @type count: int | None
+        @type until: int | None
+        @rtype: int
+        """
+        events, timeouts = self._events, self._timeouts
+        done = 0
+        while done != count:
+            if self._ticks is not None:
+                pending = [queue.peek().timestamp
+                           for queue in (events, timeouts)
+                           if not queue.is_empty()]
+                if pending:
+                    self._schedule_tick(min(pending))
+            source = events
+            if timeouts.is_empty():
+                if events.is_empty():
+                    break
+            elif events.is_empty():
+                source = timeouts
+            else:
+                event, timeout = events.peek(), timeouts.peek()
+                if ((timeout.timestamp, timeout.sequence) <
+                        (event.timestamp, event.sequence)):
+                    source = timeouts
+            if until is not None and source.peek().timestamp > until:
+                break
+
+            event = source.remove()
+            self._time = event.timestamp
+            for new_event in event.do(self._dispatcher, self._monitor):
+                self._schedule(new_event)
+            if (self._consumed < len(self._inputs) and
+                    event is self._inputs[self._consumed]):
+                self._consume([event])
+            if self._pool is not None:
+                self._pool.release(event)
+            done += 1
+        return done
+
+    def _schedule_tick(self, timestamp):
+        """Schedule the next Rebalance event if it is due by <timestamp>.
+
+        @type self: Simulation
+        @type timestamp: int | float
+        @rtype: None
+        """
+        if self._ticks is not None and self._ticks[1] <= timestamp:
+            interval, tick = self._ticks
+            self._ticks = (interval, tick + interval)
+            self._schedule(Rebalance.obtain(tick))
+
+    def _schedule(self, event):
+        """Add <event> to the event queue, or to the timeouts if it is a
+        Cancellation and timeouts are kept out of the event queue.
+
+        @type self: Simulation
+        @type event: Event
+        @rtype: None
+        """
+        if self._timeouts is None:
+            event.handle = self._events.add(event)
+            return
+        # The sequence keeps the order of events with the same timestamp
+        # across the event queue and the timeouts.
+        event.sequence = self._sequence
+        self._sequence += 1
+        if isinstance(event, Cancellation):
+            event.handle = self._timeouts.add(event, event.rider)
+        else:
+            event.handle = self._events.add(event)
+
+    def rerun(self, initial_events):
+        """Run the simulation again, on the modified list of events in
+        <initial_events>.
+
+        The simulation resumes from the last recorded snapshot that was taken
+        before the first input event that differs from the previous run, at
+        a time strictly before the timestamp of every input event it leaves
+        to do, and returns the same statistics as a run from scratch. A
+        snapshot taken at the timestamp of an input event left to do may
+        already hold events done after that input event in a run from
+        scratch, such as events spawned at the same timestamp.
+
+        Precondition: this Simulation was created with a snapshot interval,
+        and has been run to completion.
+
+        @type self: Simulation
+        @type initial_events: list[Event]
+        @rtype: dict[str, object]
+
+        >>> from event import parse_event_lines
+        >>> with open("events.txt") as file:
+        ...     lines = file.readlines()
+        >>> sim = Simulation(snapshot_interval=2)
+        >>> _ = sim.run(parse_event_lines(lines))
+        >>> lines[-1] = "25 RiderRequest Fallow 1,1 2,5 1"
+        >>> expected = Simulation().run(parse_event_lines(lines))
+        >>> sim.rerun(parse_event_lines(lines)) == expected
+        True
+
+        A request added at a timestamp that is already in the trace is done
+        before the events spawned at that timestamp.
+
+        >>> lines = ["0 DriverRequest D1 5,0 1", "0 DriverRequest D2 2,4 1",
+        ...          "0 DriverRequest D3 6,4 3", "1 RiderRequest R7 4,4 2,1 0",
+        ...          "2 RiderRequest R2 1,4 2,6 3", "2 RiderRequest R6 5,3 6,0 6",
+        ...          "3 DriverRequest D0 0,2 1", "4 DriverRequest D4 5,4 3"]
+        >>> sim = Simulation(snapshot_interval=4)
+        >>> _ = sim.run(parse_event_lines(lines))
+        >>> lines.append("4 RiderRequest RX 1,0 3,3 1")
+        >>> sim.rerun(parse_event_lines(lines)) == Simulation().run(
+        ...     parse_event_lines(lines))
+        True
+        """
+        inputs = sorted(initial_events, key=lambda event: event.timestamp)
+        digest = hashlib.sha256()
+        resumed = None
+        consumed = 0
+        for snapshot in self._snapshots:
+            while consumed < min(snapshot[0], len(inputs)):
+                digest.update(serialize_event(inputs[consumed]).encode())
+                consumed += 1
+            if (consumed != snapshot[0] or
+                    digest.digest() != snapshot[1].digest()):
+                break
+            if consumed == len(inputs) or inputs[consumed].timestamp > \
+                    snapshot[3]:
+                resumed = snapshot
+
+        if resumed is None:
+            approximation, max_candidates, check_interval = \
+                self._approximation
+            self.__init__(self._interval, self._timeouts is not None,
+                          self._pool is not None, self._rider_policy,
+                          approximation, max_candidates,
+                          rebalance_interval=None if self._ticks is None
+                          else self._ticks[0],
+                          check_interval=check_interval)
+            return self.run(initial_events)
+
+        (pending, self._dispatcher, self._monitor, self._timeouts,
+         self._sequence, self._ticks) = pickle.loads(
+            zlib.decompress(resumed[2]))
+        # The input events are added first, as they would have been in a run
+        # from scratch, so that they keep their place among pending events
+        # with the same timestamp.
+        self._events = PriorityQueue()
+        remaining = inputs[resumed[0]:]
+        for position, event in enumerate(remaining):
+            event.sequence = position - len(remaining)
+            event.handle = self._events.add(event)
+        for event in pending:
+            event.handle = self._events.add(event)
+        self._inputs = inputs
+        self._consumed = resumed[0]
+        self._digest = resumed[1].copy()
+        self._snapshots = self._snapshots[:self._snapshots.index(resumed) + 1]
+        return self.resume()
+
+    def _consume(self, done):
+        """Record that the input events <done> have been done, in order, and
+        take a snapshot if one is due.
+
+        The snapshot leaves out the input events that have not been done yet,
+        so that it only depends on the input events done so far.
+
+        @type self: Simulation
+        @type done: list[Event]
+        @rtype: None
+        """
+        before = self._consumed
+        for event in done:
+            self._digest.update(serialize_event(event).encode())
+        self._consumed += len(done)
+        if self._consumed // self._interval > before // self._interval:
+            remaining = set(map(id, self._inputs[self._consumed:]))
+            pending = [pending_event for pending_event in self._events
+                       if id(pending_event) not in remaining]
+            state = (pending, self._dispatcher, self._monitor,
+                     self._timeouts, self._sequence, self._ticks)
+            self._snapshots.append(
+                (self._consumed, self._digest.copy(),
+                 zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL),
+                               1), self._time))
+
+    def snapshot(self):
+        """Return a snapshot of the state of this simulation.
+
+        The snapshot holds the pending events, the dispatcher with its
+        waiting list and drivers, the riders and drivers themselves, and the
+        activities of the monitor. An object referred to from several places,
+        such as a rider of both a Pickup and a Cancellation event, is stored
+        once and is shared again after a restore.
+
+        @type self: Simulation
+        @rtype: bytes
+        """
+        state = (self._events, self._dispatcher, self._monitor,
+                 self._timeouts, self._sequence, self._ticks)
+        return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+
+    @classmethod
+    def restore(cls, snapshot):
+        """Return a new Simulation in the state stored in <snapshot>.
+
+        @type cls: type
+        @type snapshot: bytes
+            A snapshot returned by Simulation.snapshot.
+        @rtype: Simulation
+
+        >>> sim = Simulation()
+        >>> _ = sim.run(create_event_list("events.txt"), 12)
+        >>> copy = Simulation.restore(sim.snapshot())
+        >>> dropoff = copy._events._items[1]
+        >>> any(dropoff.driver is driver
+        ...     for driver in copy._dispatcher.driver_list)
+        True
+        >>> copy.resume() == sim.resume()
+        True
+        """
+        sim = cls()
+        (sim._events, sim._dispatcher, sim._monitor, sim._timeouts,
+         sim._sequence, sim._ticks) = pickle.loads(zlib.decompress(snapshot))
+        return sim
+
+    def save(self, filename):
+        """Write a snapshot of this simulation to the file <filename>.
+
+        The snapshot is written to disk before the file is replaced in a
+        single step, so that a crash while saving leaves either the previous
+        snapshot or the new one intact.
+
+        @type self: Simulation
+        @type filename: str
+        @rtype: None
+
+        >>> import tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> filename = os.path.join(directory, "simulation.snapshot")
+        >>> Simulation().save(filename)
+        >>> Simulation.load(filename).report()["rider_wait_time"]
+        0
+        >>> sorted(os.listdir(directory))
+        ['simulation.snapshot']
+        >>> import shutil
+        >>> shutil.rmtree(directory)
+        """
+        temporary = filename + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(self.snapshot())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, filename)
+        # The replacement is only on disk once the directory is, where a
+        # directory can be opened to be synced.
+        if hasattr(os, "O_DIRECTORY"):
+            directory = os.open(os.path.dirname(filename) or ".",
+                                os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    @classmethod
+    def load(cls, filename):
+        """Return a new Simulation in the state saved to the file <filename>.
+
+        @type cls: type
+        @type filename: str
+        @rtype: Simulation
+        """
+        with open(filename, "rb") as file:
+            return cls.restore(file.read())
 
 
 if __name__ == "__main__":
     events = create_event_list("events.txt")
     sim = Simulation()
-    #final_stats = sim.run(events)
+    final_stats = sim.run(events)
     print(final_stats)
@@ -0,0 +1,319 @@
+"""Spatial Index
+
+This module contains the GridIndex class, a spatial index of items at
+locations of the grid, such as waiting riders, that answers nearest queries
+without looking at every item.
+
+The grid is split into square cells, and every cell holds the items in it.
+A nearest query searches rings of cells of growing radius around its
+location. Every location in a ring r > 0 is at least (r - 1) * size + 1 away
+from the location of the query, and travel distances are never shorter than
+Manhattan distances, so the search stops as soon as no ring further out can
+hold a better item. An approximate search stops sooner: as soon as no ring
+further out can hold an item better by more than a given factor, or once it
+has looked at a given number of items.
+"""
+import heapq
+
+from location import travel_distance
+
+
+class GridIndex:
+    """A spatial index of items at locations of the grid.
+
+    Every item has a rank, such as the time at which it was added, and a
+    nearest query can trade distance off against rank. Every item also has a
+    scale, such as the inverse of its speed, that its distance is multiplied
+    by. Items are told apart by their id(), so they need not be hashable.
+    """
+
+    # === Private Attributes ===
+    # @type _size: int
+    #     The number of rows and columns of a cell.
+    # @type _cells: dict[(int, int), dict[int, object]]
+    #     The items in every cell that holds any, by id().
+    # @type _entries: dict[int, (int, Location, int, (int, int), float)]
+    #     The order in which every item was added, its location, its rank,
+    #     its cell and its scale, by id().
+    # @type _ranks: list[(int, int, int)]
+    #     A heap of the rank, order and id() of every item added, including
+    #     items that have since been removed, as long as they are at most
+    #     half of the heap.
+    # @type _added: int
+    #     The number of items added so far.
+    # @type _min_scale: float
+    #     The lowest scale of any item added so far.
+
+    def __init__(self, cell_size=8):
+        """Initialize an empty GridIndex.
+
+        @type self: GridIndex
+        @type cell_size: int
+            The number of rows and columns of a cell.
+        @rtype: None
+        """
+        self._size = cell_size
+        self._cells = {}
+        self._entries = {}
+        self._ranks = []
+        self._added = 0
+        self._min_scale = 1
+
+    def __len__(self):
+        """Return the number of items in this GridIndex.
+
+        @type self: GridIndex
+        @rtype: int
+        """
+        return len(self._entries)
+
+    def __contains__(self, item):
+        """Return True iff <item> is in this GridIndex.
+
+        @type self: GridIndex
+        @type item: object
+        @rtype: bool
+        """
+        return id(item) in self._entries
+
+    def add(self, item, location, rank=0, scale=1):
+        """Add <item> at <location> with <rank> and <scale>.
+
+        Precondition: <item> is not in this GridIndex, and <scale> > 0.
+
+        @type self: GridIndex
+        @type item: object
+        @type location: Location
+        @type rank: int | float
+        @type scale: int | float
+        @rtype: None
+        """
+        cell = (location.row // self._size, location.column // self._size)
+        self._cells.setdefault(cell, {})[id(item)] = item
+        self._entries[id(item)] = (self._added, location, rank, cell, scale)
+        self._min_scale = min(self._min_scale, scale)
+        heapq.heappush(self._ranks, (rank, self._added, id(item)))
+        self._added += 1
+
+    def remove(self, item):
+        """Remove <item>, and return whether it was in this GridIndex.
+
+        @type self: GridIndex
+        @type item: object
+        @rtype: bool
+
+        >>> from location import Location
+        >>> index = GridIndex()
+        >>> index.add("kal", Location(5, 2))
+        >>> index.remove("kal"), index.remove("kal"), len(index)
+        (True, False, 0)
+        >>> index.add("kal", Location(5, 2), 0)
+        >>> for rank in range(1, 1000):
+        ...     index.add(rank, Location(5, 2), rank)
+        ...     _ = index.remove(rank)
+        >>> len(index._ranks) <= 2 * len(index)
+        True
+        """
+        entry = self._entries.pop(id(item), None)
+        if entry is None:
+            return False
+        cell = self._cells[entry[3]]
+        del cell[id(item)]
+        if not cell:
+            del self._cells[entry[3]]
+        # The rank of the item is dropped once it reaches the top of the heap,
+        # or once the removed items make up more than half of the heap.
+        ranks = self._ranks
+        if len(ranks) > 2 * len(self._entries):
+            ranks[:] = [(entry[2], entry[0], key)
+                        for key, entry in self._entries.items()]
+            heapq.heapify(ranks)
+        while ranks and ranks[0][2] not in self._entries:
+            heapq.heappop(ranks)
+        return True
+
+    def nearest(self, location, weight=0, factor=1, limit=None):
+        """Return the item with the lowest score, or None if this GridIndex
+        is empty. The score of an item is its travel distance from
+        <location> times its scale, plus <weight> times its rank, and ties
+        go to the item of lowest rank, and then to the item added first.
+
+        If <factor> is greater than 1, the item returned may score up to
+        <factor> times the lowest score. If <limit> is not None, the search
+        stops once it has looked at <limit> items, and the item returned may
+        score any higher than the lowest score.
+
+        @type self: GridIndex
+        @type location: Location
+        @type weight: int | float
+            How much distance one unit of rank is worth.
+        @type factor: int | float
+        @type limit: int | None
+        @rtype: object | None
+
+        >>> from location import Location
+        >>> index = GridIndex(4)
+        >>> index.add("kal", Location(1, 1), 0)
+        >>> index.add("bal", Location(9, 9), 6)
+        >>> index.add("cal", Location(9, 10), 4)
+        >>> index.nearest(Location(8, 8))
+        'bal'
+        >>> index.nearest(Location(8, 8), 1)
+        'cal'
+        >>> index.nearest(Location(8, 8), 3)
+        'kal'
+        >>> index.nearest(Location(0, 0), 0, 2)
+        'kal'
+        >>> index.nearest(Location(8, 8), 3, 1, 1)
+        'cal'
+        >>> index.add("mal", Location(7, 7), 2)
+        >>> index.nearest(Location(8, 8))
+        'mal'
+        """
+        if not self._entries:
+            return None
+        # No item scores lower than its distance plus the lowest weighted
+        # rank.
+        floor = weight * self._ranks[0][0]
+        row, column = location.row // self._size, location.column // self._size
+        best, best_key = None, None
+        seen = 0
+        radius = 0
+        while seen < len(self._entries):
+            if best is not None:
+                bound = floor + self._min_scale * ((radius - 1) * self._size +
+                                                   1)
+                # An exact search goes on while a tie is possible, so that
+                # ties are broken by rank and order.
+                if (best_key[0] < bound if factor == 1 else
+                        best_key[0] <= factor * bound):
+                    break
+                if limit is not None and seen >= limit:
+                    break
+            for cell in self._ring(row, column, radius):
+                items = self._cells.get(cell)
+                if items is None:
+                    continue
+                seen += len(items)
+                for key, item in items.items():
+                    order, other, rank, _, scale = self._entries[key]
+                    score = (travel_distance(location, other) * scale +
+                             weight * rank, rank, order)
+                    if best_key is None or score < best_key:
+                        best, best_key = item, score
+            radius += 1
+        return best
+
+    def within(self, location, limit, count=None):
+        """Return the items whose travel distance from <location> times their
+        scale is at most <limit>, from the lowest to the highest, ties going
+        to the item added first. If <count> is not None, only the first
+        <count> of them are returned.
+
+        @type self: GridIndex
+        @type location: Location
+        @type limit: int | float
+        @type count: int | None
+        @rtype: list[object]
+
+        >>> from location import Location
+        >>> index = GridIndex(4)
+        >>> index.add("kal", Location(1, 1))
+        >>> index.add("bal", Location(9, 9), scale=0.5)
+        >>> index.add("cal", Location(9, 10))
+        >>> index.within(Location(8, 8), 5)
+        ['bal', 'cal']
+        >>> index.within(Location(8, 8), 20, 1)
+        ['bal']
+        """
+        row, column = location.row // self._size, location.column // self._size
+        found = []
+        seen = 0
+        radius = 0
+        while seen < len(self._entries):
+            bound = self._min_scale * ((radius - 1) * self._size + 1)
+            if radius > 0 and bound > limit:
+                break
+            if count is not None and len(found) >= count:
+                # No item further out can displace the first <count> found.
+                if heapq.nsmallest(count, found)[-1][0] < bound:
+                    break
+            for cell in self._ring(row, column, radius):
+                items = self._cells.get(cell)
+                if items is None:
+                    continue
+                seen += len(items)
+                for key in items:
+                    order, other, _, _, scale = self._entries[key]
+                    score = travel_distance(location, other) * scale
+                    if score <= limit:
+                        found.append((score, order, key))
+            radius += 1
+        found.sort()
+        if count is not None:
+            del found[count:]
+        return [self._cells[self._entries[key][3]][key]
+                for _, _, key in found]
+
+    def __getstate__(self):
+        """Return the state of this GridIndex to pickle.
+
+        Items are kept by id(), which unpickled items do not share, so the
+        items are pickled with their entries instead.
+
+        @type self: GridIndex
+        @rtype: (int, int, float, list[(object, tuple)])
+        """
+        return self._size, self._added, self._min_scale, [
+            (self._cells[entry[3]][key], entry)
+            for key, entry in self._entries.items()]
+
+    def __setstate__(self, state):
+        """Restore the state of an unpickled GridIndex.
+
+        @type self: GridIndex
+        @type state: (int, int, float, list[(object, tuple)])
+        @rtype: None
+
+        >>> import pickle
+        >>> from location import Location
+        >>> index = GridIndex()
+        >>> index.add(["kal"], Location(5, 2))
+        >>> copy = pickle.loads(pickle.dumps(index))
+        >>> copy.nearest(Location(0, 0))
+        ['kal']
+        >>> copy.remove(copy.nearest(Location(0, 0))), len(copy)
+        (True, 0)
+        """
+        self._size, self._added, self._min_scale, entries = state
+        self._cells, self._entries, self._ranks = {}, {}, []
+        for item, entry in entries:
+            self._cells.setdefault(entry[3], {})[id(item)] = item
+            self._entries[id(item)] = entry
+            self._ranks.append((entry[2], entry[0], id(item)))
+        heapq.heapify(self._ranks)
+
+    @staticmethod
+    def _ring(row, column, radius):
+        """Return the cells at Chebyshev distance <radius> from the cell at
+        <row> and <column>.
+
+        @type row: int
+        @type column: int
+        @type radius: int
+        @rtype: list[(int, int)]
+
+        >>> len(GridIndex._ring(0, 0, 0)), len(GridIndex._ring(0, 0, 2))
+        (1, 16)
+        """
+        if radius == 0:
+            return [(row, column)]
+        cells = [(row - radius, c)
+                 for c in range(column - radius, column + radius + 1)]
+        cells.extend((row + radius, c)
+                     for c in range(column - radius, column + radius + 1))
+        cells.extend((r, column - radius)
+                     for r in range(row - radius + 1, row + radius))
+        cells.extend((r, column + radius)
+                     for r in range(row - radius + 1, row + radius))
+        return cells